@@ -70,7 +70,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'cardealer.middleware.AsyncWhiteNoiseMiddleware',
     'allauth.account.middleware.AccountMiddleware'
 ]
 
@@ -187,6 +187,202 @@ MESSAGE_TAGS = {
 SITE_ID = 1
 
 
+# Voice assistant
+# Passage embeddings are cached here by content hash so restarts and other
+# workers never re-encode unchanged knowledge or inventory passages
+VOICE_ASSISTANT_EMBEDDING_CACHE_DIR = os.path.join(BASE_DIR, '.cache', 'embeddings')
+
+# FAISS index over knowledge and inventory passages. 'flat' is exact; 'hnsw'
+# and 'ivfpq' trade some recall for speed on large inventories (compare them
+# with `manage.py benchmark_index`). IVF-PQ needs 39 * max(IVF_NLIST,
+# 2 ** PQ_NBITS) passages to train (flat is used below that); its codebooks
+# are saved to TRAINED_INDEX_PATH and retrained on a full rebuild once the
+# passages reach IVF_RETRAIN_GROWTH times the training set. STORAGE 'float16'
+# or 'int8' keeps flat/HNSW vectors scalar-quantized (2x/4x smaller than
+# float32) to fit more workers. int8 ranges are learned from the passages at
+# each full rebuild, widened by SQ_RANGE_HEADROOM; a car saved later that
+# falls outside them triggers a rebuild instead of being clipped.
+VOICE_ASSISTANT_INDEX = {
+    'TYPE': 'flat',
+    'STORAGE': 'float32',
+    'SQ_RANGE_HEADROOM': 0.2,
+    'HNSW_M': 32,
+    'HNSW_EF_CONSTRUCTION': 40,
+    'HNSW_EF_SEARCH': 64,
+    'IVF_NLIST': 256,
+    'IVF_NPROBE': 16,
+    'PQ_M': 16,
+    'PQ_NBITS': 8,
+    'TRAINED_INDEX_PATH': os.path.join(BASE_DIR, '.cache', 'faiss', 'ivfpq.trained.faiss'),
+    'IVF_RETRAIN_GROWTH': 2,
+}
+
+# Replies reused for questions whose embedding is at least SIMILARITY_THRESHOLD
+# (cosine) close to an earlier one; cleared whenever a Car row changes. Only a
+# call's opening question without inventory constraints is cached. Each worker
+# keeps its own cache and seeds it from the opening question and reply of the
+# PREWARM most recent calls when it loads the inventory (0 to start empty).
+VOICE_ASSISTANT_RESPONSE_CACHE = {
+    'ENABLED': True,
+    'SIMILARITY_THRESHOLD': 0.92,
+    'MAX_ENTRIES': 500,
+    'TTL': 60 * 60,  # seconds
+    'MAX_BYTES': 5 * 1024 * 1024,
+    'PREWARM': 0,
+}
+
+# Embedding model backend. 'onnx' runs the model exported by
+# `manage.py export_onnx_encoder [--quantize]` on onnxruntime, which is faster
+# on CPU-only hosts; QUANTIZE selects the int8 model. Falls back to 'torch'
+# when no export is found.
+VOICE_ASSISTANT_ENCODER = {
+    'BACKEND': 'torch',
+    'ONNX_DIR': os.path.join(BASE_DIR, '.cache', 'onnx'),
+    'QUANTIZE': False,
+}
+
+# Embeddings and nearest passages of recent queries, keyed by normalized text
+# so re-sent recognizer results skip the encoder and the index search
+VOICE_ASSISTANT_QUERY_CACHE = {
+    'ENABLED': True,
+    'MAX_ENTRIES': 1000,
+}
+
+# Query encodes arriving within MAX_WAIT_MS of each other (up to MAX_BATCH)
+# are encoded in one batch; batch-size counters are shown on /talk-to-ai/ready/
+VOICE_ASSISTANT_QUERY_BATCHING = {
+    'ENABLED': True,
+    'MAX_BATCH': 16,
+    'MAX_WAIT_MS': 5,
+}
+
+# The browser recognizer re-sends growing transcripts of one utterance. Messages
+# that repeat or extend the previous one within MERGE_WINDOW_SECONDS are merged
+# into it, and each answer waits DEBOUNCE_MS and is dropped if a newer message
+# in the same call arrives first.
+VOICE_ASSISTANT_TURNS = {
+    'DEBOUNCE_MS': 300,
+    'MERGE_WINDOW_SECONDS': 20,
+}
+
+# Retrieval started from interim (partial) transcripts of at least MIN_WORDS
+# words is reused by the final message when the texts are SIMILARITY alike
+VOICE_ASSISTANT_SPECULATION = {
+    'ENABLED': True,
+    'MIN_WORDS': 3,
+    'SIMILARITY': 0.85,
+    'TTL': 30,  # seconds
+    'MAX_SESSIONS': 1000,
+}
+
+# Optional per-host embedding server (`manage.py run_embedding_server`). With
+# SOCKET set, web workers send encodes and car changes to it over a Unix socket
+# and memory-map the index snapshots it saves to SNAPSHOT_DIR, instead of each
+# loading the model and building its own index.
+VOICE_ASSISTANT_EMBEDDING_SERVER = {
+    'SOCKET': None,  # e.g. '/run/cardealer/embeddings.sock'
+    'SNAPSHOT_DIR': os.path.join(BASE_DIR, '.cache', 'faiss', 'snapshots'),
+    'TIMEOUT': 10,  # seconds
+}
+
+# Voice calls over one WebSocket per call (served by cardealer.asgi). The page
+# falls back to the HTTP endpoints when the server cannot upgrade, e.g. under
+# `runserver` or a WSGI server.
+VOICE_ASSISTANT_WEBSOCKET = {
+    'PATH': '/talk-to-ai/ws/',
+    'MAX_MESSAGE_BYTES': 64 * 1024,
+}
+
+# Per-call state (session row, recent messages, ended flag) cached between
+# utterances so history is read from memory; every change is still written to
+# the database, which rebuilds the entry when it is missing. The default
+# LocMemCache is per process, so ENABLED None turns this on only when CACHE is a
+# shared backend (Redis, Memcached); forcing True on LocMemCache is only safe
+# with a single worker.
+VOICE_ASSISTANT_CALL_STATE = {
+    'ENABLED': None,
+    'CACHE': 'default',
+    'TTL': 30 * 60,  # seconds
+    'HISTORY_MESSAGES': 5,  # older messages are folded into a short summary
+    'REBUILD_MESSAGES': 50,
+}
+
+# Conversation messages are buffered and saved with bulk_create by a background
+# thread once MAX_BATCH are waiting or the oldest is MAX_DELAY seconds old, and
+# when a call ends or the process exits. The buffer is per process; a call's
+# recent messages are also in its shared call state, which covers rows another
+# worker has not saved yet. Set ENABLED to False to save each message as it is made.
+VOICE_ASSISTANT_CONVERSATION_WRITES = {
+    'ENABLED': True,
+    'MAX_BATCH': 50,
+    'MAX_DELAY': 1.0,  # seconds
+}
+
+# Latency budget of one voice turn (milliseconds). Each stage gets its own
+# budget, capped by what is left of the turn; if Gemini misses its deadline the
+# caller hears a templated answer built from the top retrieved passages.
+VOICE_ASSISTANT_DEADLINES = {
+    'ENABLED': True,
+    'TURN_MS': 8000,
+    'ENCODE_MS': 1000,
+    'SEARCH_MS': 1500,
+    'LLM_MS': 6000,
+}
+
+# Token budget of each prompt section, estimated at ~4 characters per token, so
+# prompts (and time to first token) stay bounded however long a call runs.
+# Retrieved passages are taken most relevant first, skipping those below
+# MIN_RELEVANCE (cosine similarity); turns older than the call state's
+# HISTORY_MESSAGES appear only in the call summary.
+VOICE_ASSISTANT_PROMPT = {
+    'CONTEXT_TOKENS': 600,
+    'SUMMARY_TOKENS': 150,
+    'HISTORY_TOKENS': 250,
+    'QUERY_TOKENS': 120,
+    'MIN_RELEVANCE': 0.25,
+}
+
+# Policy questions (hours, APR, location, guarantees, ...) whose best retrieved
+# passage has a curated answer in voice_assistant/faq.py are answered from it
+# without calling the LLM, if that passage is at least MIN_RELEVANCE similar
+# and MARGIN ahead of passages with other answers. Hit rates per relevance band
+# are shown on /talk-to-ai/ready/ for tuning the threshold.
+VOICE_ASSISTANT_FAQ = {
+    'ENABLED': True,
+    'MIN_RELEVANCE': 0.6,
+    'MARGIN': 0.05,
+    'MAX_WORDS': 16,
+}
+
+# Admission control in front of Gemini, per process. At most MAX_IN_FLIGHT
+# requests run at once, starting no faster than RATE_PER_SECOND (bursts of up
+# to BURST; 0 disables the rate limit). Up to MAX_QUEUE more wait their turn
+# within the LLM deadline; beyond that a turn gets the templated fallback at
+# once. Concurrent identical prompts share one request when COALESCE is set.
+VOICE_ASSISTANT_GENERATION = {
+    'ENABLED': True,
+    'MAX_IN_FLIGHT': 8,
+    'MAX_QUEUE': 16,
+    'RATE_PER_SECOND': 0,
+    'BURST': 10,
+    'COALESCE': True,
+}
+
+# Model that writes the voice replies: 'gemini' (needs GEMINI_API_KEY), 'local'
+# (a small transformers model on CPU, downloaded on first use) or 'stub' (canned
+# replies after STUB_LATENCY_MS, for load tests and offline development). With
+# FALLBACK set, requests the backend fails are answered by that one instead.
+VOICE_ASSISTANT_LLM = {
+    'BACKEND': 'gemini',
+    'FALLBACK': None,  # e.g. 'local'
+    'GEMINI_MODEL': 'gemini-1.5-flash',
+    'LOCAL_MODEL': 'HuggingFaceTB/SmolLM2-360M-Instruct',
+    'LOCAL_THREADS': None,
+    'STUB_LATENCY_MS': 800,
+    'STUB_JITTER_MS': 0,
+}
+
+
 # Email sending
 # EMAIL_HOST = 'smtp.gmail.com'
 # EMAIL_PORT = 587
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:06
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cars', '0006_car_search_indexes'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='car',
+            name='cars_car_body_st_f09179_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='car',
+            name='cars_car_fuel_ty_ea08fc_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='car',
+            name='cars_car_transmi_f8bcfb_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='car',
+            name='cars_car_conditi_752162_idx',
+        ),
+        migrations.AddIndex(
+            model_name='car',
+            index=models.Index(django.db.models.functions.text.Upper('body_style'), models.F('price'), name='car_body_style_upper_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='car',
+            index=models.Index(django.db.models.functions.text.Upper('fuel_type'), name='car_fuel_type_upper_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='car',
+            index=models.Index(django.db.models.functions.text.Upper('transmission'), name='car_transmission_upper_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='car',
+            index=models.Index(django.db.models.functions.text.Upper('condition'), name='car_condition_upper_idx'),
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.db.models.functions import Upper
 from datetime import datetime
 from ckeditor.fields import RichTextField
 from multiselectfield import MultiSelectField
@@ -119,3 +120,15 @@ class Car(models.Model):
 
     def __str__(self):
         return self.car_title
+
+    class Meta:
+        # Columns filtered by the voice assistant's structured inventory search.
+        # Free-text columns are compared case-insensitively as Upper(column).
+        indexes = [
+            models.Index(fields=['price']),
+            models.Index(fields=['year']),
+            models.Index(Upper('body_style'), 'price', name='car_body_style_upper_price_idx'),
+            models.Index(Upper('fuel_type'), name='car_fuel_type_upper_idx'),
+            models.Index(Upper('transmission'), name='car_transmission_upper_idx'),
+            models.Index(Upper('condition'), name='car_condition_upper_idx'),
+        ]
@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class VoiceAssistantConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'voice_assistant'
+
+    def ready(self):
+        # Keep the shared inventory index in sync with Car rows
+        from . import signals  # noqa: F401
+        from . import checks  # noqa: F401
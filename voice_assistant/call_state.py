@@ -0,0 +1,252 @@
+import asyncio
+import threading
+import time
+import uuid
+from contextlib import asynccontextmanager
+from typing import List, Optional
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+
+from .conversation_writer import get_conversation_writer
+from .models import CallSession, Conversation
+from .prompt_builder import fold_into_summary
+
+CALL_STATE_DEFAULTS = {
+    'ENABLED': None,  # None: only when CACHE is shared between processes
+    'CACHE': 'default',  # alias in settings.CACHES
+    'TTL': 30 * 60,  # seconds since the call was last touched
+    'HISTORY_MESSAGES': 5,  # recent messages kept for prompts and transcript merging; older ones are summarized
+    'REBUILD_MESSAGES': 50,  # messages read to rebuild history and summary when the entry is missing
+}
+
+
+# Backends whose entries other worker processes cannot see
+PROCESS_LOCAL_CACHES = {
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+}
+
+LOCK_TIMEOUT = 5  # seconds a request that died holding a call's lock can block its updates
+
+
+def cache_is_shared(alias: str) -> bool:
+    return settings.CACHES.get(alias, {}).get('BACKEND') not in PROCESS_LOCAL_CACHES
+
+
+def get_call_state_config() -> dict:
+    config = dict(CALL_STATE_DEFAULTS)
+    config.update(getattr(settings, 'VOICE_ASSISTANT_CALL_STATE', {}))
+    if config['ENABLED'] is None:
+        config['ENABLED'] = cache_is_shared(config['CACHE'])
+    return config
+
+
+def cache_key(session_id: str) -> str:
+    return f"voice_assistant:call:{session_id}"
+
+
+def lock_key(session_id: str) -> str:
+    return f"voice_assistant:call-lock:{session_id}"
+
+
+def message_entry(msg: Conversation) -> dict:
+    # (session, speaker, timestamp) identifies the row; write-behind rows have no id yet
+    return {'speaker': msg.speaker, 'message': msg.message, 'timestamp': msg.timestamp}
+
+
+async def flush_conversations():
+    """Save buffered messages so database reads see the whole call."""
+    writer = get_conversation_writer()
+    if writer:
+        await writer.aflush()
+
+
+class CallState:
+    """A call's session row, its last few messages (oldest first) and a summary of the ones before."""
+
+    def __init__(self, session: CallSession, messages: List[dict], summary: List[str] = None):
+        self.session = session
+        self.messages = messages
+        self.summary = summary or []
+
+    @property
+    def session_id(self) -> str:
+        return self.session.session_id
+
+    @property
+    def ended(self) -> bool:
+        return self.session.end_time is not None
+
+    def history(self, limit: int = None) -> List[dict]:
+        """Recent messages in the shape the RAG engine expects."""
+        limit = limit or get_call_state_config()['HISTORY_MESSAGES']
+        return [{'speaker': msg['speaker'], 'message': msg['message']} for msg in self.messages[-limit:]]
+
+
+class CallStateStore:
+    """Per-call state kept in Django's cache so utterances skip history queries.
+
+    The database remains the record of every call: each change is written
+    to it (messages via the write-behind ConversationWriter), and a missing
+    or expired cache entry is rebuilt from it.
+    The cache entry is authoritative for reads (recent history, whether the
+    call has ended) while it exists, which holds as long as every process
+    serving the call shares the cache. LocMemCache, Django's default, is per
+    process, so unless ENABLED is set explicitly this is only on with a shared
+    backend (Redis, Memcached).
+
+    Updates re-read the entry, change it and write it back while holding the
+    call's lock key, so concurrent requests of one call do not drop each
+    other's messages.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def count(self, hit: bool):
+        with self.lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    async def cached(self, session_id: str) -> Optional[CallState]:
+        config = get_call_state_config()
+        if not config['ENABLED']:
+            return None
+        return await caches[config['CACHE']].aget(cache_key(session_id))
+
+    async def get(self, session_id: str) -> Optional[CallState]:
+        """Return a call's state from the cache, or rebuilt from the database (None if no such call)."""
+        state = await self.cached(session_id)
+        self.count(state is not None)
+        if state is not None:
+            return state
+
+        session = await CallSession.objects.filter(session_id=session_id).afirst()
+        if session is None:
+            return None
+        await flush_conversations()
+        limit = get_call_state_config()['REBUILD_MESSAGES']
+        recent = [msg async for msg in session.messages.order_by('-timestamp')[:limit]][::-1]
+        # Saving folds all but the last HISTORY_MESSAGES into the summary
+        state = CallState(session, [message_entry(msg) for msg in recent])
+        await self.save(state)
+        return state
+
+    async def create(self, session_id: str) -> CallState:
+        session = await CallSession.objects.acreate(
+            session_id=session_id,
+            start_time=timezone.now()
+        )
+        state = CallState(session, [])
+        await self.save(state)
+        return state
+
+    async def save(self, state: CallState):
+        config = get_call_state_config()
+        older = state.messages[:-config['HISTORY_MESSAGES']]
+        if older:
+            state.summary = fold_into_summary(state.summary, older)
+            del state.messages[:len(older)]
+        if not config['ENABLED']:
+            return
+        await caches[config['CACHE']].aset(cache_key(state.session_id), state, config['TTL'])
+
+    @asynccontextmanager
+    async def locked(self, state: CallState):
+        """Hold the call's lock while its cache entry is read, changed and written back.
+
+        cache.add() is atomic on Django's cache backends, so only one request,
+        in any worker, holds the lock key at a time.
+        """
+        config = get_call_state_config()
+        if not config['ENABLED']:
+            yield
+            return
+        cache = caches[config['CACHE']]
+        key = lock_key(state.session_id)
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + LOCK_TIMEOUT
+        while not await cache.aadd(key, token, LOCK_TIMEOUT):
+            if time.monotonic() >= deadline:
+                break  # the holder died; its key expires on its own
+            await asyncio.sleep(0.005)
+        try:
+            yield
+        finally:
+            if await cache.aget(key) == token:
+                await cache.adelete(key)
+
+    async def refresh(self, state: CallState):
+        """Pick up messages another request of the same call cached meanwhile."""
+        latest = await self.cached(state.session_id)
+        if latest is not None:
+            state.messages = latest.messages
+            state.summary = latest.summary
+
+    async def add_message(self, state: CallState, speaker: str, message: str) -> dict:
+        msg = Conversation(
+            session=state.session,
+            speaker=speaker,
+            message=message
+        )
+        writer = get_conversation_writer()
+        if writer:
+            writer.add(msg)
+        else:
+            await msg.asave()
+        entry = message_entry(msg)
+        async with self.locked(state):
+            await self.refresh(state)
+            state.messages.append(entry)
+            await self.save(state)
+        return entry
+
+    async def update_message(self, state: CallState, entry: dict, message: str):
+        previous_timestamp = entry['timestamp']
+        entry['message'] = message
+        entry['timestamp'] = timezone.now()
+        changes = {'message': entry['message'], 'timestamp': entry['timestamp']}
+        writer = get_conversation_writer()
+        if not (writer and writer.update_pending(state.session, entry['speaker'], previous_timestamp, changes)):
+            saved = Conversation.objects.filter(session=state.session, speaker=entry['speaker'],
+                                                timestamp=previous_timestamp)
+            if not await saved.aupdate(**changes) and writer:
+                # Still buffered by the worker that added it, which saves it within max_delay
+                await asyncio.sleep(writer.max_delay + 0.25)
+                await saved.aupdate(**changes)
+        async with self.locked(state):
+            await self.refresh(state)
+            for cached in state.messages:
+                if cached['speaker'] == entry['speaker'] and cached['timestamp'] == previous_timestamp:
+                    cached.update(entry)
+            await self.save(state)
+
+    async def set_ended(self, state: CallState, ended: bool):
+        session = state.session
+        if ended:
+            session.end_time = timezone.now()
+            session.duration = session.end_time - session.start_time
+            await session.asave(update_fields=['end_time', 'duration'])
+        else:
+            session.end_time = None
+            await session.asave(update_fields=['end_time'])
+        async with self.locked(state):
+            await self.refresh(state)
+            await self.save(state)
+
+    def stats(self):
+        with self.lock:
+            return {
+                'enabled': get_call_state_config()['ENABLED'],
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+
+call_states = CallStateStore()
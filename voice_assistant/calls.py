@@ -0,0 +1,119 @@
+from typing import List, Tuple
+
+from .call_state import CallState, call_states, flush_conversations, message_entry
+from .metrics import TurnTimings
+from .models import CallFeedback, CallSession
+from .turns import Superseded, turns
+
+GREETING = "Hello! Thank you for calling our dealership. I'm your AI assistant. How can I help you today?"
+STILL_HERE = "I'm still here. What can I help you with?"
+# Said for a re-sent transcript whose first send is still being answered
+STILL_ANSWERING = "One moment, I'm still working on that."
+
+
+async def start_call(session_id: str) -> Tuple[CallState, str]:
+    """Open a call and return its state with what the assistant says first."""
+    state = await call_states.get(session_id)
+    if state is not None and not state.ended:
+        return state, STILL_HERE
+    state = await call_states.create(session_id)
+    await call_states.add_message(state, 'assistant', GREETING)
+    return state, GREETING
+
+
+async def open_call(session_id: str) -> CallState:
+    """Return the state of the call a message belongs to, creating or reopening it as needed."""
+    state = await call_states.get(session_id)
+    if state is None:
+        state = await call_states.create(session_id)
+        print(f"Created new session on the fly: {session_id}")
+    elif state.ended:
+        # Reopen session if it was ended
+        await call_states.set_ended(state, False)
+        print(f"Reopened session: {session_id}")
+    return state
+
+
+async def end_call(state: CallState) -> List[dict]:
+    """Close a call and return its full transcript."""
+    if not state.ended:
+        await call_states.set_ended(state, True)
+    # Buffered messages must be saved for the transcript to be complete
+    await flush_conversations()
+    messages = [message_entry(msg) async for msg in state.session.messages.all()]
+    # Another worker may still buffer the last turn; the call state has it
+    saved = {(msg['speaker'], msg['timestamp']) for msg in messages}
+    messages += [msg for msg in state.messages if (msg['speaker'], msg['timestamp']) not in saved]
+
+    return [{
+        'timestamp': msg['timestamp'].strftime('%I:%M:%S %p'),
+        'speaker': msg['speaker'].title(),
+        'text': msg['message']
+    } for msg in sorted(messages, key=lambda msg: msg['timestamp'])]
+
+
+def save_feedback(session: CallSession, rating, comments='', helpful_aspects='', improvement_suggestions='') -> CallFeedback:
+    """Create or update the feedback for a call session."""
+    feedback, created = CallFeedback.objects.get_or_create(
+        session=session,
+        defaults={
+            'rating': rating,
+            'comments': comments,
+            'helpful_aspects': helpful_aspects,
+            'improvement_suggestions': improvement_suggestions,
+        }
+    )
+
+    if not created:
+        # Update existing feedback
+        feedback.rating = rating
+        feedback.comments = comments
+        feedback.helpful_aspects = helpful_aspects
+        feedback.improvement_suggestions = improvement_suggestions
+        feedback.save()
+    return feedback
+
+
+async def stream_reply(engine, state: CallState, kind: str, query: str, conversation_history: List[dict],
+                       timings: TurnTimings = None):
+    """Answer one recorded user message, yielding the events a client is sent.
+
+    Events are dicts with a ``type`` of 'chunk' (one sentence), 'done' (the
+    full reply, saved to the call, with per-stage ``timings`` in ms),
+    'duplicate' (a re-sent transcript; ``pending`` if its first send is still
+    being answered) or 'superseded' (a newer message replaced this one before
+    anything was said).
+    """
+    if kind == 'repeat':
+        # Re-sent transcript: the earlier reply was (or is being) spoken already
+        turns.record_repeat()
+        yield {'type': 'duplicate', 'response': query or STILL_ANSWERING, 'pending': query is None}
+        return
+
+    session_id = state.session_id
+    timings = timings or TurnTimings()
+    turn = turns.start(session_id)
+    sentences = []
+    replies = engine.stream_response(query, conversation_history, session_id, timings=timings, summary=state.summary)
+    try:
+        await turn.debounce()
+        while True:
+            try:
+                sentence = await turn.run(replies.__anext__())
+            except StopAsyncIteration:
+                break
+            sentences.append(sentence)
+            yield {'type': 'chunk', 'text': sentence}
+    except Superseded:
+        # Sentences already sent are kept so the history matches what was spoken
+        if not sentences:
+            yield {'type': 'superseded'}
+            return
+    finally:
+        turns.finish(session_id, turn)
+        await replies.aclose()
+
+    ai_response = " ".join(sentences)
+    await call_states.add_message(state, 'assistant', ai_response)
+    timings.finish()
+    yield {'type': 'done', 'response': ai_response, 'timings': timings.as_dict()}
@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.core import checks
+
+from .call_state import cache_is_shared, get_call_state_config
+
+
+@checks.register(checks.Tags.caches)
+def check_call_state_cache(app_configs, **kwargs):
+    """Warn when call state is forced on with a cache that workers do not share."""
+    explicit = getattr(settings, 'VOICE_ASSISTANT_CALL_STATE', {}).get('ENABLED')
+    alias = get_call_state_config()['CACHE']
+    if alias not in settings.CACHES:
+        return [checks.Error(
+            f"VOICE_ASSISTANT_CALL_STATE['CACHE'] refers to {alias!r}, which is not in CACHES.",
+            id='voice_assistant.E001',
+        )]
+    if explicit and not cache_is_shared(alias):
+        return [checks.Warning(
+            f"VOICE_ASSISTANT_CALL_STATE is enabled on the process-local cache {alias!r}.",
+            hint=("With more than one worker a call's requests can read a stale history. Point CACHE at a "
+                  "shared backend (Redis, Memcached) or leave ENABLED as None."),
+            id='voice_assistant.W001',
+        )]
+    return []
@@ -0,0 +1,141 @@
+import atexit
+import threading
+import time
+from collections import Counter
+from typing import List
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+from .models import Conversation
+
+WRITER_DEFAULTS = {
+    'ENABLED': True,
+    'MAX_BATCH': 50,  # flush once this many messages are waiting
+    'MAX_DELAY': 1.0,  # seconds a message may wait before it is flushed
+}
+
+
+def get_writer_config() -> dict:
+    config = dict(WRITER_DEFAULTS)
+    config.update(getattr(settings, 'VOICE_ASSISTANT_CONVERSATION_WRITES', {}))
+    return config
+
+
+class ConversationWriter:
+    """Write-behind buffer that saves Conversation rows with bulk_create.
+
+    Requests hand over unsaved messages and return at once. A background
+    thread inserts them in one transaction when ``max_batch`` are waiting or
+    the oldest has waited ``max_delay`` seconds. ``flush()`` saves everything
+    handed over before it was called, e.g. before reading a transcript, and
+    runs again at exit. Messages still buffered when the process dies are
+    lost, so the delay bounds how much of a call a crash can drop.
+    """
+
+    def __init__(self, max_batch=50, max_delay=1.0):
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.pending: List[Conversation] = []
+        self.oldest = None
+        self.lock = threading.Lock()
+        self.wakeup = threading.Condition(self.lock)
+        self.flush_lock = threading.Lock()
+        self.thread = None
+        self.batch_sizes = Counter()
+        self.failures = 0
+
+    def add(self, message: Conversation):
+        """Queue an unsaved message; safe to call from any thread or event loop."""
+        with self.lock:
+            if not self.pending:
+                self.oldest = time.monotonic()
+            self.pending.append(message)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name='conversation-writer', daemon=True)
+                self.thread.start()
+                atexit.register(self.flush)
+            if len(self.pending) >= self.max_batch:
+                self.wakeup.notify()
+
+    def update_pending(self, session, speaker: str, timestamp, fields: dict) -> bool:
+        """Change a message that is still buffered; False if it is not (any more)."""
+        with self.lock:
+            for msg in self.pending:
+                if msg.session_id == session.pk and msg.speaker == speaker and msg.timestamp == timestamp:
+                    for name, value in fields.items():
+                        setattr(msg, name, value)
+                    return True
+        return False
+
+    def flush(self) -> int:
+        """Save every queued message now and return how many were written."""
+        # Held while inserting, so a flush returns only after earlier batches are committed
+        with self.flush_lock:
+            with self.lock:
+                batch, self.pending, self.oldest = self.pending, [], None
+            if not batch:
+                return 0
+            try:
+                Conversation.objects.bulk_create(batch)
+            except Exception as e:
+                print(f"Error saving {len(batch)} conversation messages: {str(e)}")
+                with self.lock:
+                    self.failures += 1
+                    # Put them back in front so a later flush retries in order
+                    self.pending[:0] = batch
+                    self.oldest = self.oldest or time.monotonic()
+                raise
+            with self.lock:
+                self.batch_sizes[len(batch)] += 1
+            return len(batch)
+
+    async def aflush(self) -> int:
+        return await sync_to_async(self.flush)()
+
+    def _run(self):
+        while True:
+            with self.lock:
+                while len(self.pending) < self.max_batch:
+                    if self.pending:
+                        remaining = self.oldest + self.max_delay - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        self.wakeup.wait(remaining)
+                    else:
+                        self.wakeup.wait()
+            close_old_connections()
+            try:
+                self.flush()
+            except Exception:
+                # Retried on the next pass; don't spin on a database that is down
+                time.sleep(self.max_delay)
+
+    def stats(self):
+        with self.lock:
+            batches = sum(self.batch_sizes.values())
+            return {
+                'pending': len(self.pending),
+                'batches': batches,
+                'messages': sum(size * count for size, count in self.batch_sizes.items()),
+                'max_batch_size': max(self.batch_sizes, default=0),
+                'failures': self.failures,
+            }
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_conversation_writer():
+    """Return the process-wide writer, or None when write-behind is disabled."""
+    global _writer
+    config = get_writer_config()
+    if not config['ENABLED']:
+        return None
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = ConversationWriter(config['MAX_BATCH'], config['MAX_DELAY'])
+    return _writer
@@ -0,0 +1,60 @@
+import asyncio
+import time
+from typing import Optional
+
+from django.conf import settings
+
+from .metrics import TurnTimings, metrics
+
+DEADLINE_DEFAULTS = {
+    'ENABLED': True,
+    'TURN_MS': 8000,  # whole turn; each stage also gets at most what is left of it
+    'ENCODE_MS': 1000,
+    'SEARCH_MS': 1500,
+    'LLM_MS': 6000,
+}
+
+
+def get_deadline_config() -> dict:
+    config = dict(DEADLINE_DEFAULTS)
+    config.update(getattr(settings, 'VOICE_ASSISTANT_DEADLINES', {}))
+    return config
+
+
+class StageTimeout(Exception):
+    """A pipeline stage missed its deadline and was cancelled."""
+
+    def __init__(self, stage: str):
+        super().__init__(f"{stage} missed its deadline")
+        self.stage = stage
+
+
+class TurnDeadline:
+    """Latency budget of one turn, split into per-stage budgets."""
+
+    def __init__(self, config: dict = None):
+        self.config = config or get_deadline_config()
+        self.expires = time.monotonic() + self.config['TURN_MS'] / 1000
+        self.stage_expires = {}
+
+    def budget(self, stage: str) -> Optional[float]:
+        """Seconds the stage may still take, or None when deadlines are disabled.
+
+        A stage's budget starts when it first runs, so a reply streamed in
+        chunks shares one LLM budget.
+        """
+        if not self.config['ENABLED']:
+            return None
+        now = time.monotonic()
+        stage_expires = self.stage_expires.setdefault(stage, now + self.config[f"{stage.upper()}_MS"] / 1000)
+        return max(0.0, min(stage_expires, self.expires) - now)
+
+    async def run(self, stage: str, awaitable, timings: TurnTimings):
+        """Await a stage within its budget, cancelling it and raising StageTimeout if it overruns."""
+        with timings.stage(stage):
+            try:
+                return await asyncio.wait_for(awaitable, self.budget(stage))
+            except asyncio.TimeoutError:
+                metrics.record_timeout(stage)
+                print(f"Voice turn {stage} stage missed its deadline")
+                raise StageTimeout(stage)
@@ -0,0 +1,244 @@
+import os
+import socket
+import socketserver
+import struct
+import threading
+from typing import List
+
+import numpy as np
+from django.conf import settings
+from django.db import close_old_connections
+
+SERVER_DEFAULTS = {
+    'SOCKET': None,
+    'SNAPSHOT_DIR': os.path.join(settings.BASE_DIR, '.cache', 'faiss', 'snapshots'),
+    'TIMEOUT': 10,
+}
+
+# Request ops
+OP_ENCODE = 1
+OP_RELOAD_INVENTORY = 2
+OP_UPDATE_CAR = 3
+OP_REMOVE_CAR = 4
+
+# Reply statuses
+STATUS_OK = 0
+STATUS_ERROR = 1
+
+# Every frame is a 1-byte op (or status) and a 4-byte payload length. Payloads:
+#   ENCODE request: text count, then (length, UTF-8 bytes) per text
+#   ENCODE reply: rows, dimension, then row-major float32 vectors
+#   UPDATE_CAR / REMOVE_CAR request: car id; inventory replies: new version
+HEADER = struct.Struct('!BI')
+COUNT = struct.Struct('!I')
+SHAPE = struct.Struct('!II')
+INT64 = struct.Struct('!q')
+
+# Set in the server process so it loads the model instead of calling itself
+_serving = False
+
+
+class EmbeddingServerError(Exception):
+    pass
+
+
+def get_server_config() -> dict:
+    config = dict(SERVER_DEFAULTS)
+    config.update(getattr(settings, 'VOICE_ASSISTANT_EMBEDDING_SERVER', {}))
+    return config
+
+
+def use_embedding_server() -> bool:
+    """True in web workers configured to delegate to the embedding server."""
+    return bool(get_server_config()['SOCKET']) and not _serving
+
+
+def recv_exact(sock, size: int) -> bytes:
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("Embedding server connection closed")
+        data += chunk
+    return bytes(data)
+
+
+def send_frame(sock, code: int, payload: bytes = b''):
+    sock.sendall(HEADER.pack(code, len(payload)) + payload)
+
+
+def recv_frame(sock):
+    code, length = HEADER.unpack(recv_exact(sock, HEADER.size))
+    return code, recv_exact(sock, length)
+
+
+def pack_texts(texts: List[str]) -> bytes:
+    encoded = [text.encode('utf-8') for text in texts]
+    return COUNT.pack(len(encoded)) + b''.join(COUNT.pack(len(e)) + e for e in encoded)
+
+
+def unpack_texts(payload: bytes) -> List[str]:
+    (count,), offset = COUNT.unpack_from(payload), COUNT.size
+    texts = []
+    for _ in range(count):
+        (length,) = COUNT.unpack_from(payload, offset)
+        offset += COUNT.size
+        texts.append(payload[offset:offset + length].decode('utf-8'))
+        offset += length
+    return texts
+
+
+def pack_vectors(vectors: np.ndarray) -> bytes:
+    vectors = np.ascontiguousarray(vectors, dtype='float32')
+    return SHAPE.pack(*vectors.shape) + vectors.tobytes()
+
+
+def unpack_vectors(payload: bytes) -> np.ndarray:
+    rows, dimension = SHAPE.unpack_from(payload)
+    return np.frombuffer(payload, dtype='float32', offset=SHAPE.size).reshape(rows, dimension)
+
+
+class EmbeddingClient:
+    """Stand-in for the SentenceTransformer that encodes on the embedding server.
+
+    Also forwards inventory changes, since the server owns the index that the
+    workers memory-map.
+    """
+
+    def __init__(self, path: str, timeout: float = 10):
+        self.path = path
+        self.timeout = timeout
+        self.local = threading.local()
+
+    def _connection(self):
+        sock = getattr(self.local, 'sock', None)
+        if sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            sock.connect(self.path)
+            self.local.sock = sock
+        return sock
+
+    def request(self, op: int, payload: bytes = b'') -> bytes:
+        # One persistent connection per thread, reopened once if the server restarted
+        for attempt in range(2):
+            sock = self._connection()
+            try:
+                send_frame(sock, op, payload)
+                status, reply = recv_frame(sock)
+                break
+            except OSError:
+                sock.close()
+                self.local.sock = None
+                if attempt:
+                    raise
+        if status != STATUS_OK:
+            raise EmbeddingServerError(reply.decode('utf-8', 'replace'))
+        return reply
+
+    def encode(self, texts: List[str], **kwargs) -> np.ndarray:
+        return unpack_vectors(self.request(OP_ENCODE, pack_texts(list(texts))))
+
+    def reload_inventory(self) -> int:
+        return INT64.unpack(self.request(OP_RELOAD_INVENTORY))[0]
+
+    def update_car(self, car_id: int) -> int:
+        return INT64.unpack(self.request(OP_UPDATE_CAR, INT64.pack(car_id)))[0]
+
+    def remove_car(self, car_id: int) -> int:
+        return INT64.unpack(self.request(OP_REMOVE_CAR, INT64.pack(car_id)))[0]
+
+
+class EmbeddingRequestHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        while True:
+            try:
+                op, payload = recv_frame(self.request)
+            except (ConnectionError, struct.error):
+                return
+            try:
+                reply, status = self.server.dispatch(op, payload), STATUS_OK
+            except Exception as e:
+                print(f"Embedding server error: {str(e)}")
+                reply, status = str(e).encode('utf-8'), STATUS_ERROR
+            finally:
+                close_old_connections()
+            send_frame(self.request, status, reply)
+
+
+class EmbeddingServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Owns the encoder and the index for every web worker on the host.
+
+    Each published index snapshot is saved to ``snapshot_dir`` for the
+    workers to memory-map read-only, so they share one copy of it in the
+    page cache.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, path: str, engine, snapshot_dir: str):
+        self.engine = engine
+        self.snapshot_dir = snapshot_dir
+        self.save_lock = threading.Lock()
+        super().__init__(path, EmbeddingRequestHandler)
+
+    def dispatch(self, op: int, payload: bytes) -> bytes:
+        from cars.models import Car
+        from .rag_engine import get_encoder
+
+        if op == OP_ENCODE:
+            return pack_vectors(get_encoder().encode(unpack_texts(payload)))
+
+        if op == OP_RELOAD_INVENTORY:
+            self.engine.load_inventory()
+        elif op == OP_UPDATE_CAR:
+            (car_id,) = INT64.unpack(payload)
+            car = Car.objects.filter(pk=car_id).first()
+            if car is None:
+                self.engine.remove_car(car_id)
+            else:
+                self.engine.update_car(car)
+        elif op == OP_REMOVE_CAR:
+            self.engine.remove_car(INT64.unpack(payload)[0])
+        else:
+            raise EmbeddingServerError(f"Unknown embedding server op {op}")
+
+        self.save_snapshot()
+        return INT64.pack(self.engine.inventory_version)
+
+    def save_snapshot(self):
+        with self.save_lock:
+            self.engine.snapshot.save(self.snapshot_dir, {'known_models': sorted(self.engine.known_models)})
+
+
+def serve(path: str = None, snapshot_dir: str = None):
+    """Load the model and inventory, then answer workers on the Unix socket."""
+    global _serving
+    _serving = True
+    config = get_server_config()
+    path = path or config['SOCKET']
+    snapshot_dir = snapshot_dir or config['SNAPSHOT_DIR']
+    if not path:
+        raise EmbeddingServerError("Set VOICE_ASSISTANT_EMBEDDING_SERVER['SOCKET'] or pass a socket path")
+
+    from .index_snapshot import IndexSnapshot
+    from .rag_engine import get_encoder, get_rag_engine
+
+    get_encoder()
+    engine = get_rag_engine()
+    # Continue numbering after the last saved snapshot so workers notice the change
+    saved_version = IndexSnapshot.saved_version(snapshot_dir)
+    if saved_version is not None:
+        engine.publish(IndexSnapshot(saved_version, engine.snapshot.index, engine.snapshot.passages))
+    engine.load_inventory()
+
+    if os.path.exists(path):
+        os.remove(path)  # left behind by a previous run
+    server = EmbeddingServer(path, engine, snapshot_dir)
+    server.save_snapshot()
+    print(f"Embedding server listening on {path} (index version {engine.inventory_version})")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        os.remove(path)
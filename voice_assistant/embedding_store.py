@@ -0,0 +1,116 @@
+import hashlib
+import json
+import os
+import re
+from contextlib import contextmanager
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process locking, single worker only
+    fcntl = None
+
+
+class EmbeddingStore:
+    """Content-hash keyed embedding cache shared across restarts and workers.
+
+    Vectors are appended to a raw float32 file (``<namespace>.f32``) that is
+    memory-mapped for reads, with a sidecar ``<namespace>.keys`` file holding
+    one SHA-256 content hash per row. Appends happen under an exclusive file
+    lock, so several gunicorn workers can safely share one directory.
+    """
+
+    def __init__(self, directory, namespace: str):
+        self.directory = str(directory)
+        namespace = re.sub(r'[^A-Za-z0-9_.-]', '_', namespace)
+        self.vectors_path = os.path.join(self.directory, f"{namespace}.f32")
+        self.keys_path = os.path.join(self.directory, f"{namespace}.keys")
+        self.meta_path = os.path.join(self.directory, f"{namespace}.json")
+        self.lock_path = os.path.join(self.directory, f"{namespace}.lock")
+        self.dimension = None
+        self.rows = {}
+        self.vectors = None
+        self._keys_offset = 0
+        os.makedirs(self.directory, exist_ok=True)
+
+    @staticmethod
+    def key_for(text: str) -> str:
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    @contextmanager
+    def _locked(self):
+        with open(self.lock_path, 'a') as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _refresh(self):
+        """Pick up rows appended by this or other processes since the last read."""
+        if self.dimension is None:
+            if not os.path.exists(self.meta_path):
+                return
+            with open(self.meta_path) as f:
+                self.dimension = json.load(f)['dimension']
+
+        if not os.path.exists(self.keys_path) or os.path.getsize(self.keys_path) == self._keys_offset:
+            return
+
+        with open(self.keys_path) as f:
+            f.seek(self._keys_offset)
+            for line in f:
+                if not line.endswith('\n'):
+                    break  # partially written line, read it next time
+                self.rows[line.strip()] = len(self.rows)
+                self._keys_offset += len(line.encode('utf-8'))
+
+        # Vectors are always written before their keys, so every row is present
+        self.vectors = np.memmap(self.vectors_path, dtype='float32', mode='r',
+                                 shape=(len(self.rows), self.dimension)) if self.rows else None
+
+    def get_many(self, texts: List[str]) -> Tuple[Dict[int, np.ndarray], List[int]]:
+        """Return cached vectors by position and the positions that still need encoding."""
+        self._refresh()
+        found, missing = {}, []
+        for position, text in enumerate(texts):
+            row = self.rows.get(self.key_for(text))
+            if row is None:
+                missing.append(position)
+            else:
+                found[position] = np.array(self.vectors[row])
+        return found, missing
+
+    def put_many(self, texts: List[str], vectors: np.ndarray):
+        """Append vectors for texts that are not stored yet."""
+        if not texts:
+            return
+        vectors = np.ascontiguousarray(vectors, dtype='float32')
+        with self._locked():
+            if self.dimension is None and not os.path.exists(self.meta_path):
+                with open(self.meta_path, 'w') as f:
+                    json.dump({'dimension': int(vectors.shape[1])}, f)
+            self._refresh()
+
+            new_keys, new_rows = [], []
+            for text, vector in zip(texts, vectors):
+                key = self.key_for(text)
+                if key not in self.rows and key not in new_keys:
+                    new_keys.append(key)
+                    new_rows.append(vector)
+            if not new_keys:
+                return
+
+            with open(self.vectors_path, 'ab') as f:
+                # Drop vectors left behind by a writer that died before writing keys
+                f.truncate(len(self.rows) * self.dimension * 4)
+                f.write(np.array(new_rows, dtype='float32').tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            with open(self.keys_path, 'a') as f:
+                f.write(''.join(f"{key}\n" for key in new_keys))
+            self._refresh()
@@ -0,0 +1,86 @@
+import asyncio
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+from typing import Callable, List
+
+import numpy as np
+
+
+class QueryEncodeBatcher:
+    """Gather concurrent query encodes into one encoder call.
+
+    Callers submit from any thread or event loop. A background thread takes
+    the first waiting query, collects more for up to ``max_wait`` seconds (or
+    until ``max_batch`` are queued), encodes them in one forward pass and
+    hands each caller its own row.
+    """
+
+    def __init__(self, encode: Callable[[List[str]], np.ndarray], max_batch=16, max_wait=0.005):
+        self.encode = encode
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.queue = queue.Queue()
+        self.thread = None
+        self.start_lock = threading.Lock()
+        self.stats_lock = threading.Lock()
+        self.batch_sizes = Counter()
+
+    def submit(self, text: str) -> Future:
+        """Queue text and return a future for its vector."""
+        future = Future()
+        self.queue.put((text, future))
+        if self.thread is None:
+            with self.start_lock:
+                if self.thread is None:
+                    self.thread = threading.Thread(target=self._run, name='query-encode-batcher', daemon=True)
+                    self.thread.start()
+        return future
+
+    async def encode_one(self, text: str) -> np.ndarray:
+        return await asyncio.wrap_future(self.submit(text))
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._encode_batch(batch)
+
+    def _encode_batch(self, batch):
+        # Skip callers that gave up (e.g. a disconnected client) while queued
+        batch = [(text, future) for text, future in batch if future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        try:
+            vectors = np.asarray(self.encode([text for text, _ in batch]), dtype='float32')
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+
+        with self.stats_lock:
+            self.batch_sizes[len(batch)] += 1
+        for (_, future), vector in zip(batch, vectors):
+            future.set_result(vector)
+
+    def stats(self):
+        with self.stats_lock:
+            batches = sum(self.batch_sizes.values())
+            queries = sum(size * count for size, count in self.batch_sizes.items())
+            return {
+                'batches': batches,
+                'queries': queries,
+                'mean_batch_size': round(queries / batches, 2) if batches else 0,
+                'max_batch_size': max(self.batch_sizes, default=0),
+                'batch_sizes': dict(sorted(self.batch_sizes.items())),
+            }
@@ -0,0 +1,170 @@
+import json
+import os
+from typing import List
+
+import numpy as np
+from django.conf import settings
+
+ENCODER_DEFAULTS = {
+    'BACKEND': 'torch',  # 'torch' (sentence-transformers) or 'onnx' (onnxruntime)
+    'ONNX_DIR': os.path.join(settings.BASE_DIR, '.cache', 'onnx'),
+    'QUANTIZE': False,  # use the dynamically int8-quantized ONNX model
+}
+
+ENCODER_BACKENDS = ('torch', 'onnx')
+
+ONNX_INPUTS = ('input_ids', 'attention_mask', 'token_type_ids')
+
+
+def get_encoder_config(**overrides) -> dict:
+    """Merge settings.VOICE_ASSISTANT_ENCODER (and any overrides) over the defaults."""
+    config = dict(ENCODER_DEFAULTS)
+    config.update(getattr(settings, 'VOICE_ASSISTANT_ENCODER', {}))
+    config.update(overrides)
+    if config['BACKEND'] not in ENCODER_BACKENDS:
+        raise ValueError(f"Unknown VOICE_ASSISTANT_ENCODER BACKEND {config['BACKEND']!r}, expected one of {ENCODER_BACKENDS}")
+    return config
+
+
+def onnx_model_path(config: dict) -> str:
+    return os.path.join(config['ONNX_DIR'], 'model.int8.onnx' if config['QUANTIZE'] else 'model.onnx')
+
+
+def uses_onnx(config: dict) -> bool:
+    return config['BACKEND'] == 'onnx' and os.path.exists(onnx_model_path(config))
+
+
+def encoder_namespace(model_name: str, config: dict = None) -> str:
+    """Embedding store namespace; int8 vectors must not mix with full-precision ones."""
+    config = config or get_encoder_config()
+    if uses_onnx(config) and config['QUANTIZE']:
+        return f"{model_name}.onnx-int8"
+    return model_name
+
+
+def load_encoder(model_name: str, config: dict = None):
+    """Create the configured encoder backend; both expose encode(texts)."""
+    config = config or get_encoder_config()
+    if config['BACKEND'] == 'onnx':
+        if uses_onnx(config):
+            return OnnxEncoder(config['ONNX_DIR'], onnx_model_path(config))
+        print(f"No ONNX encoder at {onnx_model_path(config)} (run `manage.py export_onnx_encoder`); using PyTorch")
+
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(model_name)
+
+
+class OnnxEncoder:
+    """SentenceTransformer-compatible encoder running an exported model on onnxruntime.
+
+    Reproduces the sentence-transformers pipeline saved by ``export_onnx``:
+    mean pooling over the attention mask, then optional L2 normalization.
+    Importing onnxruntime and tokenizers is much cheaper than torch.
+    """
+
+    def __init__(self, model_dir: str, model_path: str):
+        import onnxruntime
+        from tokenizers import Tokenizer
+
+        with open(os.path.join(model_dir, 'encoder.json')) as f:
+            meta = json.load(f)
+        self.normalize = meta['normalize']
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, 'tokenizer.json'))
+        self.tokenizer.enable_truncation(meta['max_length'])
+        self.tokenizer.enable_padding(pad_id=meta.get('pad_id', 0))
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = onnxruntime.InferenceSession(model_path, options, providers=['CPUExecutionProvider'])
+        self.input_names = [i.name for i in self.session.get_inputs()]
+
+    def encode(self, texts, batch_size: int = 32, **kwargs) -> np.ndarray:
+        single = isinstance(texts, str)
+        texts = [texts] if single else list(texts)
+        batches = [self._encode_batch(texts[i:i + batch_size]) for i in range(0, len(texts), batch_size)]
+        vectors = np.vstack(batches) if batches else np.zeros((0, self.dimension), dtype='float32')
+        return vectors[0] if single else vectors
+
+    @property
+    def dimension(self) -> int:
+        return self.session.get_outputs()[0].shape[-1]
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+        columns = {
+            'input_ids': [e.ids for e in encodings],
+            'attention_mask': [e.attention_mask for e in encodings],
+            'token_type_ids': [e.type_ids for e in encodings],
+        }
+        feeds = {name: np.array(columns[name], dtype='int64') for name in self.input_names}
+        hidden = self.session.run(None, feeds)[0]
+
+        mask = feeds.get('attention_mask', np.array(columns['attention_mask'], dtype='int64'))[..., None]
+        pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        if self.normalize:
+            pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+        return pooled.astype('float32')
+
+
+def export_onnx(model_name: str, output_dir: str, quantize: bool = False) -> str:
+    """Export a sentence-transformers model to ONNX (and optionally int8) under output_dir."""
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    model = SentenceTransformer(model_name, device='cpu')
+    transformer, pooling = model[0], model[1]
+    pooling_config = pooling.get_config_dict()
+    if pooling_config.get('pooling_mode', 'mean' if pooling_config.get('pooling_mode_mean_tokens') else None) != 'mean':
+        raise ValueError(f"{model_name} does not use mean pooling, which OnnxEncoder assumes")
+
+    os.makedirs(output_dir, exist_ok=True)
+    transformer.tokenizer.save_pretrained(output_dir)
+    if not os.path.exists(os.path.join(output_dir, 'tokenizer.json')):
+        raise ValueError(f"{model_name} has no fast tokenizer (tokenizer.json) to export")
+
+    sample = transformer.tokenizer(['Do you have any SUVs under $30,000?'], return_tensors='pt')
+    names = [name for name in ONNX_INPUTS if name in sample]
+
+    class HiddenStates(torch.nn.Module):
+        def __init__(self, auto_model):
+            super().__init__()
+            self.auto_model = auto_model
+
+        def forward(self, *inputs):
+            return self.auto_model(**dict(zip(names, inputs))).last_hidden_state
+
+    axes = {0: 'batch', 1: 'sequence'}
+    path = os.path.join(output_dir, 'model.onnx')
+    torch.onnx.export(
+        HiddenStates(transformer.auto_model.eval()), tuple(sample[name] for name in names), path,
+        input_names=names, output_names=['last_hidden_state'],
+        dynamic_axes={name: axes for name in names + ['last_hidden_state']},
+        opset_version=17, dynamo=False,
+    )
+
+    with open(os.path.join(output_dir, 'encoder.json'), 'w') as f:
+        json.dump({
+            'model': model_name,
+            'max_length': model.max_seq_length,
+            'normalize': any(type(module).__name__ == 'Normalize' for module in model),
+            'pad_id': transformer.tokenizer.pad_token_id or 0,
+        }, f)
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quantize_dynamic(path, os.path.join(output_dir, 'model.int8.onnx'), weight_type=QuantType.QInt8)
+    return output_dir
+
+
+def check_parity(reference, candidate, texts: List[str]) -> dict:
+    """Compare two encoders' vectors for the same texts by cosine similarity."""
+    expected = np.asarray(reference.encode(texts), dtype='float32')
+    actual = np.asarray(candidate.encode(texts), dtype='float32')
+    cosine = (expected * actual).sum(axis=1) / (
+        np.linalg.norm(expected, axis=1) * np.linalg.norm(actual, axis=1)
+    )
+    return {
+        'min_cosine': float(cosine.min()),
+        'mean_cosine': float(cosine.mean()),
+        'max_abs_diff': float(np.abs(expected - actual).max()),
+    }
@@ -0,0 +1,174 @@
+import math
+import threading
+from collections import Counter, defaultdict
+from typing import Iterable, List, Optional, Tuple
+
+from django.conf import settings
+
+from .inventory_search import contains_phrase, parse_inventory_query
+from .metrics import metrics
+
+FAQ_DEFAULTS = {
+    'ENABLED': True,
+    'MIN_RELEVANCE': 0.6,  # cosine similarity of the query to the passage behind the answer
+    'MARGIN': 0.05,  # lead required over the best passage with a different answer
+    'MAX_WORDS': 16,  # longer utterances usually ask more than one thing
+}
+
+# Spoken answers keyed by the BASE_KNOWLEDGE passage (rag_engine.py) they
+# restate. A template only rephrases its own passage and adds no facts, since
+# it is spoken without the LLM checking it. Edit a passage and its template
+# together; tests fail on a template whose passage no longer exists.
+FAQ_ANSWERS = {
+    "We offer competitive financing rates starting from 2.9% APR for qualified buyers.":
+        "Our financing rates start from 2.9% APR for qualified buyers.",
+    "Special financing programs available for first-time buyers and college graduates with rates from 3.9% APR.":
+        "First-time buyers and college graduates can get special financing from 3.9% APR.",
+    "Flexible lease terms available from 24 to 60 months with multiple mileage options.":
+        "We offer leases from 24 to 60 months, with several mileage options to choose from.",
+    "Zero down payment options available for qualified buyers with excellent credit.":
+        "Yes, buyers with excellent credit can qualify for zero down payment.",
+    "Quick and easy online pre-approval process available through our secure website.":
+        "You can get pre-approved online, quickly and easily, through our secure website.",
+    "Express service available for routine maintenance with no appointment necessary.":
+        "Yes, express service for routine maintenance needs no appointment.",
+    "Service hours: Monday-Friday 7 AM to 7 PM, Saturday 8 AM to 5 PM.":
+        "Our service center is open Monday to Friday from 7 AM to 7 PM, and Saturday from 8 AM to 5 PM.",
+    "Service center hours: Monday-Friday 7 AM to 7 PM, Saturday 8 AM to 5 PM.":
+        "Our service center is open Monday to Friday from 7 AM to 7 PM, and Saturday from 8 AM to 5 PM.",
+    "Sales department hours: Monday-Saturday 9 AM to 7 PM, Sunday 11 AM to 5 PM.":
+        "Our sales team is available Monday to Saturday from 9 AM to 7 PM, and Sunday from 11 AM to 5 PM.",
+    "We are located in University of Education, Lahore, Pakistan.":
+        "We're located at the University of Education in Lahore, Pakistan.",
+    "Reference points include Township and College Road.":
+        "Reference points near us include Township and College Road.",
+    "Military personnel receive an additional $500 off their purchase.":
+        "Yes, military personnel get an additional $500 off their purchase.",
+    "College graduate program offers $750 rebate on new vehicle purchases.":
+        "Our college graduate program offers a $750 rebate on new vehicle purchases.",
+    "Trade-in program offers competitive market value plus an additional $500 towards your new vehicle.":
+        "We give you competitive market value for your trade-in, plus an extra $500 towards your new vehicle.",
+    "Complimentary vehicle appraisals for trade-ins.":
+        "Yes, we appraise trade-ins free of charge.",
+    "Courtesy shuttle service available within a 10-mile radius.":
+        "Yes, we offer a courtesy shuttle service within a 10-mile radius.",
+    "Test drives available 7 days a week with prior appointment.":
+        "Test drives are available 7 days a week by appointment.",
+    "Extended test drives up to 24 hours available for serious buyers.":
+        "Yes, serious buyers can take an extended test drive of up to 24 hours.",
+    "Virtual test drive consultations available through video call.":
+        "Yes, we offer virtual test drive consultations over video call.",
+    "Certified pre-owned vehicles include additional 1-year/12,000-mile warranty.":
+        "Our certified pre-owned vehicles come with an additional 1-year, 12,000-mile warranty.",
+    "Powertrain warranty coverage up to 10 years/100,000 miles available.":
+        "Powertrain warranty coverage is available for up to 10 years or 100,000 miles.",
+    "Every used vehicle comes with a 7-day/500-mile money-back guarantee.":
+        "Every used vehicle comes with a 7-day, 500-mile money-back guarantee.",
+    "All our used vehicles undergo a comprehensive 150-point inspection and come with a detailed vehicle history report.":
+        "Every used vehicle goes through a 150-point inspection and comes with a detailed vehicle history report.",
+    "Free vehicle history reports for all used cars.":
+        "Yes, vehicle history reports are free for all our used cars.",
+    "Comfortable waiting area with complimentary Wi-Fi, coffee, and refreshments.":
+        "Our waiting area is comfortable, with complimentary Wi-Fi, coffee and refreshments.",
+    "Complimentary car wash with every service visit.":
+        "Yes, every service visit includes a complimentary car wash.",
+    "Complimentary multi-point inspection with every service visit.":
+        "Yes, every service visit includes a complimentary multi-point inspection.",
+}
+
+# Words and phrases that mark a question about dealership policy rather than a car
+POLICY_CUES = [
+    'hours', 'open', 'opening', 'close', 'closing', 'weekend', 'saturday', 'sunday',
+    'apr', 'rate', 'rates', 'interest', 'finance', 'financing', 'loan', 'lease', 'leasing',
+    'down payment', 'pre-approval', 'pre-approved', 'preapproval', 'credit',
+    'where', 'located', 'location', 'address', 'directions',
+    'warranty', 'guarantee', 'money-back', 'money back', 'return', 'refund',
+    'trade-in', 'trade in', 'appraisal', 'military', 'graduate', 'graduates', 'rebate', 'discount',
+    'test drive', 'test-drive', 'shuttle', 'wifi', 'wi-fi', 'waiting area', 'car wash',
+    'inspection', 'history report', 'carfax', 'express service', 'appointment',
+]
+
+# Constraint keys that make an utterance an inventory question; a condition
+# alone ("warranty on used cars") still reads as a policy question
+INVENTORY_KEYS = ('min_price', 'max_price', 'min_year', 'max_year', 'body_style', 'fuel_type',
+                  'transmission', 'features', 'model_terms')
+
+
+def get_faq_config() -> dict:
+    config = dict(FAQ_DEFAULTS)
+    config.update(getattr(settings, 'VOICE_ASSISTANT_FAQ', {}))
+    return config
+
+
+def is_policy_lookup(query: str, known_models: Iterable[str] = (), max_words: int = None) -> bool:
+    """True for a short question about dealership policy that names no car, price or feature."""
+    text = query.lower()
+    if max_words and len(text.split()) > max_words:
+        return False
+    constraints = parse_inventory_query(text, known_models)
+    if any(key in constraints for key in INVENTORY_KEYS):
+        return False
+    return any(contains_phrase(text, cue) for cue in POLICY_CUES)
+
+
+class FaqFastPath:
+    """Answer policy lookups from FAQ_ANSWERS instead of the LLM.
+
+    A query gets a template answer when it reads as a policy lookup, the best
+    retrieved base-knowledge passage with a template is at least
+    MIN_RELEVANCE similar, and it leads every passage with a different answer
+    by MARGIN. Every policy lookup is counted with its top relevance, so the
+    hit rate per relevance band shows where to set the threshold.
+    """
+
+    def __init__(self, base_knowledge: List[str]):
+        self.knowledge = set(base_knowledge)
+        for passage in FAQ_ANSWERS:
+            if passage not in self.knowledge:
+                print(f"FAQ template has no matching base knowledge passage: {passage!r}")
+        self.lock = threading.Lock()
+        self.outcomes = Counter()
+        self.bands = defaultdict(Counter)
+
+    def record(self, outcome: str, relevance: float = None):
+        with self.lock:
+            self.outcomes[outcome] += 1
+            if relevance is not None:
+                self.bands[f"{math.floor(relevance * 20) / 20:.2f}"][outcome] += 1
+        metrics.increment('faq_hits' if outcome == 'hit' else 'faq_misses')
+
+    def answer(self, query: str, context: List[Tuple[str, float]], known_models: Iterable[str] = ()) -> Optional[str]:
+        """Return the template answer for query, or None to let the LLM answer."""
+        config = get_faq_config()
+        if not is_policy_lookup(query, known_models, config['MAX_WORDS']):
+            return None
+
+        # Inventory passages (SQL matches and car passages) are never answered here
+        hits = sorted(((score, passage) for passage, score in context or [] if passage in self.knowledge), reverse=True)
+        if not hits:
+            self.record('no_passage')
+            return None
+        relevance, passage = hits[0]
+        answer = FAQ_ANSWERS.get(passage)
+        if answer is None:
+            outcome = 'no_template'
+        elif relevance < config['MIN_RELEVANCE']:
+            outcome = 'low_relevance'
+        elif any(relevance - score < config['MARGIN'] for score, other in hits[1:] if FAQ_ANSWERS.get(other) != answer):
+            outcome = 'ambiguous'
+        else:
+            outcome = 'hit'
+        self.record(outcome, relevance)
+        print(f"FAQ fast path {outcome} at relevance {relevance:.2f} for {query!r}")
+        return answer if outcome == 'hit' else None
+
+    def stats(self):
+        with self.lock:
+            lookups = sum(self.outcomes.values())
+            return {
+                'enabled': get_faq_config()['ENABLED'],
+                'policy_lookups': lookups,
+                'hit_rate': round(self.outcomes['hit'] / lookups, 3) if lookups else None,
+                'outcomes': dict(self.outcomes),
+                'by_relevance': {band: dict(counts) for band, counts in sorted(self.bands.items())},
+            }
@@ -0,0 +1,204 @@
+import os
+import threading
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from dotenv import load_dotenv
+
+from .metrics import metrics
+
+load_dotenv()
+
+LLM_DEFAULTS = {
+    'BACKEND': 'gemini',  # 'gemini', 'local' (transformers on CPU) or 'stub'
+    'FALLBACK': None,  # backend that answers when BACKEND fails, e.g. 'local'
+    'GEMINI_MODEL': 'gemini-1.5-flash',
+    'LOCAL_MODEL': 'HuggingFaceTB/SmolLM2-360M-Instruct',
+    'LOCAL_THREADS': None,  # torch CPU threads, None for torch's default
+    'STUB_LATENCY_MS': 800,
+    'STUB_JITTER_MS': 0,
+}
+
+LLM_BACKENDS = ('gemini', 'local', 'stub')
+
+
+def get_llm_config(**overrides) -> dict:
+    """Merge settings.VOICE_ASSISTANT_LLM (and any overrides) over the defaults."""
+    config = dict(LLM_DEFAULTS)
+    config.update(getattr(settings, 'VOICE_ASSISTANT_LLM', {}))
+    config.update(overrides)
+    for key in ('BACKEND', 'FALLBACK'):
+        if config[key] is not None and config[key] not in LLM_BACKENDS:
+            raise ValueError(f"Unknown VOICE_ASSISTANT_LLM {key} {config[key]!r}, expected one of {LLM_BACKENDS}")
+    return config
+
+
+def load_backend(name: str, config: dict):
+    """Create one backend; all expose Gemini's generate_content_async(prompt, generation_config, stream)."""
+    if name == 'gemini':
+        import google.generativeai as genai
+        genai.configure(api_key=os.getenv('GEMINI_API_KEY'))
+        return genai.GenerativeModel(config['GEMINI_MODEL'])
+    if name == 'local':
+        return LocalCausalLM(config['LOCAL_MODEL'], config['LOCAL_THREADS'])
+    from .stub_model import StubGenerativeModel
+    return StubGenerativeModel(config['STUB_LATENCY_MS'] / 1000, config['STUB_JITTER_MS'] / 1000)
+
+
+def load_generation_backend(config: dict = None):
+    """Create the configured backend, wrapped with its fallback if one is set."""
+    config = config or get_llm_config()
+    backend = load_backend(config['BACKEND'], config)
+    if config['FALLBACK'] and config['FALLBACK'] != config['BACKEND']:
+        backend = FailoverBackend(backend, load_backend(config['FALLBACK'], config))
+    print(f"Voice assistant generation backend: {config['BACKEND']}"
+          + (f" (fallback {config['FALLBACK']})" if config['FALLBACK'] else ''))
+    return backend
+
+
+class TextChunk:
+    """A generated reply, or one streamed piece of it, shaped like Gemini's responses."""
+
+    def __init__(self, text: str):
+        self.text = text
+
+
+class FailoverBackend:
+    """Send requests to the primary backend and to the fallback when it raises.
+
+    A streamed reply only fails over if the primary fails before its first
+    chunk; a reply cut off midway cannot be resumed by another model.
+    """
+
+    def __init__(self, primary, fallback):
+        self.primary = primary
+        self.fallback = fallback
+
+    def failed(self, error: Exception):
+        metrics.increment('generation_failovers')
+        print(f"Generation backend failed ({error}); answering with the fallback backend")
+
+    async def generate_content_async(self, prompt: str, generation_config=None, stream=False):
+        try:
+            response = await self.primary.generate_content_async(prompt, generation_config=generation_config, stream=stream)
+        except Exception as e:
+            self.failed(e)
+            return await self.fallback.generate_content_async(prompt, generation_config=generation_config, stream=stream)
+        if not stream:
+            return response
+        return self.stream(response, prompt, generation_config)
+
+    async def stream(self, response, prompt: str, generation_config):
+        emitted = False
+        try:
+            async for chunk in response:
+                emitted = True
+                yield chunk
+        except Exception as e:
+            if emitted:
+                raise
+            self.failed(e)
+            async for chunk in await self.fallback.generate_content_async(
+                prompt,
+                generation_config=generation_config,
+                stream=True
+            ):
+                yield chunk
+
+
+class LocalCausalLM:
+    """A small transformers causal LM on CPU, for offline use or when Gemini is down.
+
+    Replies are generated one at a time (a CPU model gains nothing from running
+    several at once); streamed replies are produced on a thread and stop early
+    when the caller stops reading.
+    """
+
+    def __init__(self, model_name: str, threads: int = None):
+        import torch
+        from transformers import AutoModelForCausalLM, AutoTokenizer
+
+        if threads:
+            torch.set_num_threads(threads)
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        self.model = AutoModelForCausalLM.from_pretrained(model_name).eval()
+        self.lock = threading.Lock()
+
+    def encode_prompt(self, prompt: str):
+        if self.tokenizer.chat_template:
+            return self.tokenizer.apply_chat_template(
+                [{'role': 'user', 'content': prompt}],
+                add_generation_prompt=True,
+                return_tensors='pt',
+                return_dict=True
+            )
+        return self.tokenizer(prompt, return_tensors='pt')
+
+    def generate(self, prompt: str, generation_config: dict = None, streamer=None, stop: threading.Event = None) -> str:
+        import torch
+        from transformers import StoppingCriteria, StoppingCriteriaList
+
+        class StopWhenSet(StoppingCriteria):
+            def __call__(self, input_ids, scores, **kwargs):
+                return torch.full((input_ids.shape[0],), stop.is_set(), dtype=torch.bool)
+
+        generation_config = generation_config or {}
+        temperature = generation_config.get('temperature', 0.0)
+        sampling = {}
+        if temperature > 0:
+            sampling = {
+                'do_sample': True,
+                'temperature': temperature,
+                'top_p': generation_config.get('top_p', 1.0),
+                'top_k': generation_config.get('top_k', 50),
+            }
+        max_new_tokens = generation_config.get('max_output_tokens', 150)
+        inputs = self.encode_prompt(prompt)
+        context_length = getattr(self.model.config, 'max_position_embeddings', None)
+        if context_length and inputs['input_ids'].shape[1] > context_length - max_new_tokens:
+            # Small models have short contexts: keep the end, where the question is
+            keep = context_length - max_new_tokens
+            inputs = {name: tensor[:, -keep:] for name, tensor in inputs.items()}
+        with self.lock, torch.inference_mode():
+            output = self.model.generate(
+                **inputs,
+                max_new_tokens=max_new_tokens,
+                pad_token_id=self.tokenizer.pad_token_id or self.tokenizer.eos_token_id,
+                streamer=streamer,
+                stopping_criteria=StoppingCriteriaList([StopWhenSet()]) if stop else None,
+                **sampling
+            )
+        return self.tokenizer.decode(output[0][inputs['input_ids'].shape[1]:], skip_special_tokens=True)
+
+    async def generate_content_async(self, prompt: str, generation_config: dict = None, stream=False):
+        if stream:
+            return self.stream(prompt, generation_config)
+        text = await sync_to_async(self.generate, thread_sensitive=False)(prompt, generation_config)
+        return TextChunk(text)
+
+    async def stream(self, prompt: str, generation_config: dict = None):
+        from transformers import TextIteratorStreamer
+
+        streamer = TextIteratorStreamer(self.tokenizer, skip_prompt=True, skip_special_tokens=True)
+        stop = threading.Event()
+        errors = []
+
+        def run():
+            try:
+                self.generate(prompt, generation_config, streamer, stop)
+            except Exception as e:
+                errors.append(e)
+                streamer.end()
+
+        threading.Thread(target=run, name='local-llm', daemon=True).start()
+        try:
+            while True:
+                text = await sync_to_async(next, thread_sensitive=False)(streamer, None)
+                if text is None:
+                    break
+                if text:
+                    yield TextChunk(text)
+            if errors:
+                raise errors[0]
+        finally:
+            stop.set()
@@ -0,0 +1,292 @@
+import asyncio
+import hashlib
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+
+from .metrics import metrics
+
+GATEWAY_DEFAULTS = {
+    'ENABLED': True,
+    'MAX_IN_FLIGHT': 8,  # LLM requests running at once in this process
+    'MAX_QUEUE': 16,  # requests waiting for a slot; more are turned away at once
+    'RATE_PER_SECOND': 0,  # sustained request rate, 0 for no limit
+    'BURST': 10,  # requests that may start back to back when the rate allows
+    'COALESCE': True,  # concurrent identical prompts share one request
+}
+
+
+def get_gateway_config() -> dict:
+    config = dict(GATEWAY_DEFAULTS)
+    config.update(getattr(settings, 'VOICE_ASSISTANT_GENERATION', {}))
+    return config
+
+
+class GatewayBusy(Exception):
+    """Too many generation requests are already waiting; answer without the LLM."""
+
+
+class FlightAbandoned(Exception):
+    """The shared request was cancelled before it finished."""
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+
+def wake(loop, future):
+    """Resolve a future from any thread."""
+    try:
+        loop.call_soon_threadsafe(_resolve, future)
+    except RuntimeError:
+        pass  # its event loop has already closed
+
+
+class Waiter:
+    """A request queued for a slot, woken from whichever thread frees one."""
+
+    def __init__(self):
+        self.loop = asyncio.get_running_loop()
+        self.future = None
+
+    def wake(self):
+        if self.future is not None:
+            wake(self.loop, self.future)
+
+
+class Flight:
+    """One upstream request and the responses (or streamed chunks) it has produced.
+
+    Every caller with the same prompt subscribes and replays the chunks from
+    the start; the request is cancelled once the last subscriber leaves.
+    """
+
+    def __init__(self, key: str):
+        self.key = key
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self.subscribers = 0
+        self.abandoned = False
+        self.task = None
+        self.loop = None
+        self.waiters = []
+        self.lock = threading.Lock()
+
+    def publish(self, chunk=None, done=False, error=None):
+        with self.lock:
+            if done:
+                self.done = True
+                self.error = error
+            else:
+                self.chunks.append(chunk)
+            waiters, self.waiters = self.waiters, []
+        for loop, future in waiters:
+            wake(loop, future)
+
+    async def next(self, index: int):
+        """Wait for chunks past ``index``; return (new chunks, done, error)."""
+        while True:
+            with self.lock:
+                if len(self.chunks) > index or self.done:
+                    return self.chunks[index:], self.done, self.error
+                loop = asyncio.get_running_loop()
+                future = loop.create_future()
+                self.waiters.append((loop, future))
+            await future
+
+
+class GenerationGateway:
+    """Process-wide admission control in front of the generation backend.
+
+    At most MAX_IN_FLIGHT requests run at once and requests start no faster
+    than the token bucket allows. Others wait in FIFO order; when MAX_QUEUE
+    are already waiting, a new request fails fast with GatewayBusy so the
+    caller can answer from its retrieved passages instead. Identical concurrent
+    prompts are coalesced into a single flight.
+
+    Callers may run on different event loops (async views under WSGI get one
+    per request), so state is guarded by a thread lock and waiters are woken
+    with call_soon_threadsafe.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.queue = deque()
+        self.tokens = None
+        self.refilled = time.monotonic()
+        self.flights = {}
+        self.started = 0
+        self.coalesced = 0
+        self.rejected = 0
+
+    def refill(self, config: dict):
+        now = time.monotonic()
+        if self.tokens is None:
+            self.tokens = float(config['BURST'])
+        self.tokens = min(float(config['BURST']), self.tokens + (now - self.refilled) * config['RATE_PER_SECOND'])
+        self.refilled = now
+
+    def has_token(self, config: dict) -> bool:
+        return config['RATE_PER_SECOND'] <= 0 or self.tokens >= 1
+
+    def wake_head(self):
+        if self.queue:
+            self.queue[0].wake()
+
+    async def acquire(self):
+        """Wait for a slot and a rate token, or raise GatewayBusy if the queue is full."""
+        waiter = None
+        try:
+            while True:
+                with self.lock:
+                    config = get_gateway_config()
+                    self.refill(config)
+                    is_head = not self.queue or self.queue[0] is waiter
+                    slot_free = self.in_flight < config['MAX_IN_FLIGHT']
+                    if is_head and slot_free and self.has_token(config):
+                        self.in_flight += 1
+                        self.started += 1
+                        if config['RATE_PER_SECOND'] > 0:
+                            self.tokens -= 1
+                        if waiter is not None:
+                            self.queue.popleft()
+                            self.wake_head()
+                        return
+                    if waiter is None:
+                        if len(self.queue) >= config['MAX_QUEUE']:
+                            self.rejected += 1
+                            metrics.increment('generation_rejected')
+                            raise GatewayBusy()
+                        waiter = Waiter()
+                        self.queue.append(waiter)
+                    waiter.future = waiter.loop.create_future()
+                    # The head polls for its next rate token; everyone else waits to be woken
+                    delay = None
+                    if is_head and slot_free:
+                        delay = (1 - self.tokens) / config['RATE_PER_SECOND']
+                try:
+                    await asyncio.wait_for(waiter.future, delay)
+                except asyncio.TimeoutError:
+                    pass
+        except BaseException:
+            if waiter is not None:
+                with self.lock:
+                    if waiter in self.queue:
+                        self.queue.remove(waiter)
+                        self.wake_head()
+            raise
+
+    def release(self):
+        with self.lock:
+            self.in_flight -= 1
+            self.wake_head()
+
+    def join(self, key: str):
+        """Subscribe to the flight for key, starting one if none is running."""
+        with self.lock:
+            flight = self.flights.get(key) if key else None
+            if flight is not None and not flight.abandoned:
+                flight.subscribers += 1
+                self.coalesced += 1
+                metrics.increment('generation_coalesced')
+                return flight, False
+            flight = Flight(key)
+            flight.subscribers = 1
+            if key:
+                self.flights[key] = flight
+            return flight, True
+
+    def leave(self, flight: Flight):
+        with self.lock:
+            flight.subscribers -= 1
+            if flight.subscribers or flight.done:
+                return
+            flight.abandoned = True
+        # Nobody is listening any more: stop the upstream request
+        try:
+            flight.loop.call_soon_threadsafe(flight.task.cancel)
+        except RuntimeError:
+            pass
+
+    async def fly(self, flight: Flight, model, prompt: str, generation_config, stream: bool):
+        try:
+            await self.acquire()
+            try:
+                response = await model.generate_content_async(
+                    prompt,
+                    generation_config=generation_config,
+                    stream=stream
+                )
+                if stream:
+                    async for chunk in response:
+                        flight.publish(chunk)
+                else:
+                    flight.publish(response)
+            finally:
+                self.release()
+            flight.publish(done=True)
+        except asyncio.CancelledError:
+            flight.publish(done=True, error=FlightAbandoned())
+            raise
+        except Exception as e:
+            flight.publish(done=True, error=e)
+        finally:
+            with self.lock:
+                if self.flights.get(flight.key) is flight:
+                    del self.flights[flight.key]
+
+    async def follow(self, key: str, model, prompt: str, generation_config, stream: bool):
+        """Yield the flight's chunks from the start, starting the flight if this caller leads it."""
+        flight, leader = self.join(key)
+        try:
+            if leader:
+                flight.loop = asyncio.get_running_loop()
+                flight.task = flight.loop.create_task(self.fly(flight, model, prompt, generation_config, stream))
+            index = 0
+            while True:
+                chunks, done, error = await flight.next(index)
+                for chunk in chunks:
+                    index += 1
+                    yield chunk
+                if done:
+                    if error is not None:
+                        raise error
+                    return
+        finally:
+            self.leave(flight)
+
+    async def generate(self, model, prompt: str, generation_config=None, stream=False):
+        """Drop-in for model.generate_content_async() that goes through the gateway."""
+        config = get_gateway_config()
+        if not config['ENABLED']:
+            return await model.generate_content_async(prompt, generation_config=generation_config, stream=stream)
+
+        key = None
+        if config['COALESCE']:
+            key = hashlib.sha1(f"{stream}|{generation_config!r}|{prompt}".encode('utf-8')).hexdigest()
+        responses = self.follow(key, model, prompt, generation_config, stream)
+        if stream:
+            return responses
+        try:
+            return await responses.__anext__()
+        finally:
+            await responses.aclose()
+
+    def stats(self):
+        with self.lock:
+            return {
+                'enabled': get_gateway_config()['ENABLED'],
+                'in_flight': self.in_flight,
+                'queued': len(self.queue),
+                'started': self.started,
+                'coalesced': self.coalesced,
+                'rejected': self.rejected,
+            }
+
+
+generation_gateway = GenerationGateway()
@@ -0,0 +1,167 @@
+import json
+import os
+
+import faiss
+import numpy as np
+from django.conf import settings
+
+INDEX_DEFAULTS = {
+    'TYPE': 'flat',  # 'flat', 'hnsw' or 'ivfpq'
+    'STORAGE': 'float32',  # 'float32', 'float16' or 'int8' for flat/hnsw
+    'SQ_RANGE_HEADROOM': 0.2,  # int8: widen each learned range by this fraction on both sides
+    'HNSW_M': 32,
+    'HNSW_EF_CONSTRUCTION': 40,
+    'HNSW_EF_SEARCH': 64,
+    'IVF_NLIST': 256,
+    'IVF_NPROBE': 16,
+    'PQ_M': 16,
+    'PQ_NBITS': 8,
+    'TRAINED_INDEX_PATH': None,
+    'IVF_RETRAIN_GROWTH': 2,  # retrain once the passages reach this multiple of the training set
+}
+
+INDEX_TYPES = ('flat', 'hnsw', 'ivfpq')
+
+# k-means needs this many training vectors per centroid (FAISS warns below it)
+TRAINING_POINTS_PER_CENTROID = 39
+
+# Scalar quantizers for compact flat/HNSW storage; IVF-PQ is already compressed
+SCALAR_QUANTIZERS = {
+    'float32': None,
+    'float16': faiss.ScalarQuantizer.QT_fp16,
+    'int8': faiss.ScalarQuantizer.QT_8bit,
+}
+
+
+def get_index_config(**overrides) -> dict:
+    """Merge settings.VOICE_ASSISTANT_INDEX (and any overrides) over the defaults."""
+    config = dict(INDEX_DEFAULTS)
+    config.update(getattr(settings, 'VOICE_ASSISTANT_INDEX', {}))
+    config.update(overrides)
+    if config['TYPE'] not in INDEX_TYPES:
+        raise ValueError(f"Unknown VOICE_ASSISTANT_INDEX TYPE {config['TYPE']!r}, expected one of {INDEX_TYPES}")
+    if config['STORAGE'] not in SCALAR_QUANTIZERS:
+        raise ValueError(f"Unknown VOICE_ASSISTANT_INDEX STORAGE {config['STORAGE']!r}, expected one of {tuple(SCALAR_QUANTIZERS)}")
+    return config
+
+
+def min_training_size(config: dict) -> int:
+    """IVF-PQ needs enough vectors for both the coarse and the PQ codebooks."""
+    return TRAINING_POINTS_PER_CENTROID * max(config['IVF_NLIST'], 2 ** config['PQ_NBITS'])
+
+
+def scalar_quantizer(index):
+    """The ScalarQuantizer of a flat or HNSW SQ index, or None for other indexes."""
+    if isinstance(index, faiss.IndexIDMap):
+        index = faiss.downcast_index(index.index)
+    if isinstance(index, faiss.IndexHNSW):
+        index = faiss.downcast_index(index.storage)
+    return index.sq if isinstance(index, faiss.IndexScalarQuantizer) else None
+
+
+def fits_trained_range(index, vectors: np.ndarray) -> bool:
+    """False if an int8 index would clip vectors to the ranges it was trained on."""
+    sq = scalar_quantizer(index)
+    if sq is None or sq.qtype != faiss.ScalarQuantizer.QT_8bit:
+        return True
+    trained = faiss.vector_to_array(sq.trained)
+    vmin, vdiff = trained[:sq.d], trained[sq.d:]
+    return bool(((vectors >= vmin) & (vectors <= vmin + vdiff)).all())
+
+
+def supports_removal(index) -> bool:
+    """HNSW graphs cannot drop vectors, so they are rebuilt on change instead."""
+    if isinstance(index, faiss.IndexIDMap):
+        index = faiss.downcast_index(index.index)
+    return not isinstance(index, faiss.IndexHNSW)
+
+
+def build_index(dimension: int, vectors: np.ndarray, ids: np.ndarray, config: dict = None):
+    """Build and fill the configured index type over vectors keyed by ids."""
+    config = config or get_index_config()
+    kind = config['TYPE']
+
+    if kind == 'ivfpq' and len(vectors) < min_training_size(config):
+        print(f"Only {len(vectors)} passages, need {min_training_size(config)} to train IVF-PQ; using a flat index")
+        kind = 'flat'
+
+    vectors = np.ascontiguousarray(vectors, dtype='float32')
+    qtype = SCALAR_QUANTIZERS[config['STORAGE']]
+
+    if kind == 'ivfpq':
+        index = load_or_train_ivfpq(dimension, vectors, config)
+    else:
+        if kind == 'hnsw':
+            if qtype is None:
+                base = faiss.IndexHNSWFlat(dimension, config['HNSW_M'])
+            else:
+                base = faiss.IndexHNSWSQ(dimension, qtype, config['HNSW_M'])
+            base.hnsw.efConstruction = config['HNSW_EF_CONSTRUCTION']
+            base.hnsw.efSearch = config['HNSW_EF_SEARCH']
+        elif qtype is None:
+            base = faiss.IndexFlatL2(dimension)
+        else:
+            base = faiss.IndexScalarQuantizer(dimension, qtype, faiss.METRIC_L2)
+        # int8 learns per-dimension ranges from the vectors it is built with;
+        # headroom lets cars added before the next rebuild fit them too
+        if qtype is not None and len(vectors):
+            scalar_quantizer(base).rangestat_arg = config['SQ_RANGE_HEADROOM']
+            base.train(vectors)
+        index = faiss.IndexIDMap(base)
+
+    if len(vectors):
+        index.add_with_ids(vectors, np.asarray(ids, dtype='int64'))
+    return index
+
+
+def index_memory_bytes(index) -> int:
+    """Approximate in-memory size of an index (its serialized size)."""
+    return int(faiss.serialize_index(index).nbytes)
+
+
+def ivfpq_matches(index, dimension: int, config: dict) -> bool:
+    return (index.d == dimension and index.nlist == config['IVF_NLIST']
+            and index.pq.M == config['PQ_M'] and index.pq.nbits == config['PQ_NBITS'])
+
+
+def trained_on(path: str) -> int:
+    """Number of vectors the codebooks saved at path were trained on (0 if unknown)."""
+    try:
+        with open(f"{path}.json") as f:
+            return int(json.load(f)['trained_on'])
+    except (OSError, ValueError, KeyError):
+        return 0
+
+
+def load_or_train_ivfpq(dimension: int, vectors: np.ndarray, config: dict, retrain: bool = False):
+    """Return an empty trained IVF-PQ index, reusing the persisted codebooks when they match.
+
+    Codebooks trained on a much smaller inventory fit the current one poorly,
+    so they are retrained once the passages reach IVF_RETRAIN_GROWTH times
+    the training set.
+    """
+    path = config['TRAINED_INDEX_PATH']
+    if path and os.path.exists(path) and not retrain:
+        # read_index already returns the concrete type; downcasting its
+        # temporary result would leave a dangling wrapper
+        index = faiss.read_index(path)
+        if not ivfpq_matches(index, dimension, config):
+            print(f"Trained index at {path} does not match VOICE_ASSISTANT_INDEX, retraining")
+        elif len(vectors) >= config['IVF_RETRAIN_GROWTH'] * trained_on(path):
+            print(f"Trained index at {path} was trained on {trained_on(path)} vectors, retraining on {len(vectors)}")
+        else:
+            index.nprobe = config['IVF_NPROBE']
+            return index
+
+    quantizer = faiss.IndexFlatL2(dimension)
+    index = faiss.IndexIVFPQ(quantizer, dimension, config['IVF_NLIST'], config['PQ_M'], config['PQ_NBITS'])
+    index.train(np.ascontiguousarray(vectors, dtype='float32'))
+    index.nprobe = config['IVF_NPROBE']
+
+    if path:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        faiss.write_index(index, path)
+        with open(f"{path}.json", 'w') as f:
+            json.dump({'trained_on': len(vectors)}, f)
+        print(f"Saved trained IVF-PQ index to {path}")
+    return index
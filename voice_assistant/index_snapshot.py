@@ -0,0 +1,131 @@
+import json
+import os
+import re
+from typing import Callable, Dict, List, Optional, Tuple
+
+import faiss
+import numpy as np
+
+from .index_factory import fits_trained_range, supports_removal
+
+# Saved snapshots: snapshot-<version>.faiss/.json plus a CURRENT pointer file
+CURRENT_FILE = 'CURRENT'
+SNAPSHOT_FILE = re.compile(r'snapshot-(\d+)\.(?:faiss|json)$')
+KEEP_SNAPSHOTS = 3
+
+# Map flat/SQ codes straight from the page cache instead of copying them
+MMAP_FLAGS = getattr(faiss, 'IO_FLAG_MMAP_IFC', faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+
+
+def owned_copy(index):
+    """Copy index into memory this process owns.
+
+    ``faiss.clone_index`` of a memory-mapped index shares the read-only
+    mapping, and ``remove_ids`` on it crashes; a serialized round trip does not.
+    """
+    return faiss.deserialize_index(faiss.serialize_index(index))
+
+
+class IndexSnapshot:
+    """An immutable, versioned view of the passage index.
+
+    Requests grab ``engine.snapshot`` once and search it without locks. Writers
+    never touch a published snapshot: ``with_changes`` copies the index into
+    owned memory (it may be memory-mapped), applies the edits to the copy and
+    returns a new snapshot for the engine to publish with a single attribute
+    assignment.
+    """
+
+    __slots__ = ('version', 'index', 'passages')
+
+    def __init__(self, version: int, index, passages: Dict[int, str]):
+        self.version = version
+        self.index = index
+        self.passages = passages
+
+    def search(self, query_vector: np.ndarray, k: int) -> Tuple[List[int], List[float]]:
+        """Return the ids and L2 distances of the k nearest passages."""
+        distances, indices = self.index.search(query_vector, k)
+        hits = [(int(i), float(d)) for i, d in zip(indices[0], distances[0]) if i != -1]
+        return [i for i, _ in hits], [d for _, d in hits]
+
+    def with_changes(self, upserts: Dict[int, str], embeddings: np.ndarray, removals: List[int],
+                     rebuild: Callable[[Dict[int, str]], object] = None) -> 'IndexSnapshot':
+        """Return the next version with passages upserted and removed.
+
+        Indexes that cannot remove vectors (HNSW), and int8 indexes whose
+        trained ranges would clip the new vectors, are rebuilt with ``rebuild``.
+        """
+        passages = dict(self.passages)
+        for passage_id in removals:
+            passages.pop(passage_id, None)
+        passages.update(upserts)
+
+        stale_ids = list(removals) + list(upserts.keys())
+        if ((stale_ids and not supports_removal(self.index))
+                or (upserts and not fits_trained_range(self.index, embeddings))):
+            return IndexSnapshot(self.version + 1, rebuild(passages), passages)
+
+        index = owned_copy(self.index)
+        if stale_ids:
+            index.remove_ids(np.array(stale_ids, dtype='int64'))
+        if upserts:
+            index.add_with_ids(embeddings, np.array(list(upserts.keys()), dtype='int64'))
+
+        return IndexSnapshot(self.version + 1, index, passages)
+
+    def save(self, directory: str, metadata: Dict = None):
+        """Write this snapshot under directory and point CURRENT at it."""
+        os.makedirs(directory, exist_ok=True)
+        stem = os.path.join(directory, f"snapshot-{self.version}")
+        # Write to temp files and rename: readers may have the old file mapped
+        faiss.write_index(self.index, f"{stem}.faiss.tmp")
+        os.replace(f"{stem}.faiss.tmp", f"{stem}.faiss")
+        with open(f"{stem}.json.tmp", 'w') as f:
+            json.dump({
+                'version': self.version,
+                'passages': {str(i): text for i, text in self.passages.items()},
+                'metadata': metadata or {},
+            }, f)
+        os.replace(f"{stem}.json.tmp", f"{stem}.json")
+
+        pointer = os.path.join(directory, CURRENT_FILE)
+        with open(f"{pointer}.tmp", 'w') as f:
+            f.write(str(self.version))
+        os.replace(f"{pointer}.tmp", pointer)
+
+        # Older snapshots stay readable by processes that still map them
+        versions = sorted({int(m.group(1)) for m in map(SNAPSHOT_FILE.match, os.listdir(directory)) if m})
+        for version in versions[:-KEEP_SNAPSHOTS]:
+            if version != self.version:
+                for ext in ('faiss', 'json'):
+                    path = os.path.join(directory, f"snapshot-{version}.{ext}")
+                    if os.path.exists(path):
+                        os.remove(path)
+
+    @staticmethod
+    def saved_version(directory: str) -> Optional[int]:
+        """Version CURRENT points at, or None if nothing was saved yet."""
+        try:
+            with open(os.path.join(directory, CURRENT_FILE)) as f:
+                return int(f.read().strip())
+        except (OSError, ValueError):
+            return None
+
+    @classmethod
+    def load(cls, directory: str, mmap: bool = True) -> Tuple['IndexSnapshot', Dict]:
+        """Load the current saved snapshot, memory-mapped read-only by default.
+
+        A mapped index must not be edited in place, nor a ``faiss.clone_index``
+        of it; ``with_changes`` works because it copies the index out of the
+        mapping first.
+        """
+        version = cls.saved_version(directory)
+        if version is None:
+            raise FileNotFoundError(f"No saved index snapshot in {directory}")
+        stem = os.path.join(directory, f"snapshot-{version}")
+        index = faiss.read_index(f"{stem}.faiss", MMAP_FLAGS if mmap else 0)
+        with open(f"{stem}.json") as f:
+            data = json.load(f)
+        passages = {int(i): text for i, text in data['passages'].items()}
+        return cls(data['version'], index, passages), data['metadata']
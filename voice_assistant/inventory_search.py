@@ -0,0 +1,254 @@
+import re
+from typing import Dict, Iterable, List
+
+from django.db.models import Q
+from django.db.models.functions import Upper
+
+from cars.models import Car
+
+BODY_STYLES = {
+    'SUV': ['suv', 'suvs', 'crossover', 'crossovers'],
+    'Sedan': ['sedan', 'sedans', 'saloon'],
+    'Hatchback': ['hatchback', 'hatchbacks', 'hatch'],
+    'Truck': ['truck', 'trucks', 'pickup', 'pickups', 'pick-up'],
+    'Coupe': ['coupe', 'coupes'],
+    'Convertible': ['convertible', 'convertibles', 'cabriolet'],
+    'Van': ['van', 'vans', 'minivan', 'minivans'],
+    'Wagon': ['wagon', 'wagons', 'estate'],
+}
+
+FUEL_TYPES = {
+    'Hybrid': ['hybrid', 'hybrids'],
+    'Electric': ['electric', 'ev', 'evs'],
+    'Diesel': ['diesel'],
+    'Gasoline': ['gasoline', 'petrol', 'gas car', 'gas cars', 'gas vehicle', 'gas vehicles', 'gas engine', 'gas-powered'],
+}
+
+TRANSMISSIONS = {
+    'Automatic': ['automatic'],
+    'Manual': ['manual', 'stick shift', 'stick-shift'],
+    'CVT': ['cvt'],
+}
+
+CONDITIONS = {
+    'New': ['brand new', 'new car', 'new cars', 'new vehicle', 'new vehicles', 'new one', 'new ones'],
+    'Used': ['used', 'pre-owned', 'preowned', 'second hand', 'second-hand'],
+}
+
+# Free-text values seen in Car rows besides the spoken phrasings above
+STORED_ALIASES = {
+    'Gasoline': ['gas'],
+    'Automatic': ['auto', 'at', 'a/t'],
+    'Manual': ['mt', 'm/t'],
+}
+
+FIELD_OPTIONS = {
+    'body_style': BODY_STYLES,
+    'fuel_type': FUEL_TYPES,
+    'transmission': TRANSMISSIONS,
+    'condition': CONDITIONS,
+}
+
+# Spoken phrasings for Car.features_choices
+FEATURES = {
+    'Cruise Control': ['cruise control', 'cruise'],
+    'Audio Interface': ['audio interface', 'aux', 'audio input'],
+    'Airbags': ['airbag', 'airbags'],
+    'Air Conditioning': ['air conditioning', 'air conditioner', 'a/c', 'ac'],
+    'Seat Heating': ['seat heating', 'heated seats', 'heated seat'],
+    'Alarm System': ['alarm', 'alarm system'],
+    'ParkAssist': ['parkassist', 'park assist', 'parking assist', 'parking sensors'],
+    'Power Steering': ['power steering'],
+    'Reversing Camera': ['reversing camera', 'backup camera', 'rear camera', 'reverse camera', 'rearview camera'],
+    'Direct Fuel Injection': ['direct fuel injection', 'fuel injection'],
+    'Auto Start/Stop': ['start/stop', 'start stop', 'start-stop'],
+    'Wind Deflector': ['wind deflector', 'wind deflectors'],
+    'Bluetooth Handset': ['bluetooth'],
+}
+
+# Makes recognised in the free-text car_title ("Toyota Vitz for sale - one owner")
+CAR_MAKES = {
+    'audi', 'bmw', 'changan', 'chevrolet', 'daihatsu', 'ford', 'haval', 'honda', 'hyundai', 'jeep', 'kia',
+    'lexus', 'mazda', 'mercedes', 'mitsubishi', 'nissan', 'peugeot', 'porsche', 'proton', 'subaru', 'suzuki',
+    'tesla', 'toyota', 'volkswagen', 'volvo',
+}
+
+# Words that can appear in model names but never identify one
+MODEL_STOPWORDS = {
+    'and', 'for', 'the', 'with', 'one', 'two', 'owner', 'owners', 'sale', 'new', 'used', 'car', 'cars',
+    'model', 'edition', 'version', 'series', 'class', 'good', 'condition', 'low', 'mileage',
+}
+
+# Numbers followed by these are distances, power, durations, ... rather than prices
+NOT_PRICE_UNITS = (r'(?:(?:miles?|mi|km|kms|kilometers?|hp|horsepower|mpg|minutes?|mins?|hours?|days?|weeks?'
+                   r'|months?|years?|yrs?|percent)\b|%)')
+# A bare model year ("between 2018 and 2020") is not a price unless marked as money
+YEAR_LIKE = r'(?:199\d|20[0-2]\d|2030)(?![\d,.]?\d)(?!\s*(?:k\b|thousand|grand|dollars|bucks))'
+AMOUNT = (rf'(?:\$\s*|(?!{YEAR_LIKE}))(\d{{1,3}}(?:,\d{{3}})+|\d+(?:\.\d+)?)(?![\d,.]?\d)'
+          rf'(?!\s*(?:k|thousand|grand)?\s*{NOT_PRICE_UNITS})\s*(k\b|thousand|grand)?')
+PRICE_BETWEEN = re.compile(rf'between\s+{AMOUNT}\s+(?:and|to|-)\s+{AMOUNT}')
+PRICE_RANGE = re.compile(rf'\$\s*(\d{{1,3}}(?:,\d{{3}})+|\d+(?:\.\d+)?)\s*(k)?\s*(?:-|to)\s*{AMOUNT}')
+PRICE_MAX = re.compile(rf'(?:under|below|less than|cheaper than|max(?:imum)?|up to|no more than|at most)\s+{AMOUNT}')
+PRICE_MIN = re.compile(rf'(?:over|above|more than|at least|starting (?:at|from)|minimum)\s+{AMOUNT}')
+YEAR_RANGE = re.compile(r'(?:between|from)\s+((?:19|20)\d{2})\s+(?:and|to|through|-)\s+((?:19|20)\d{2})\b')
+YEAR_AFTER = re.compile(r'(?:newer than|after|later than)\s+((?:19|20)\d{2})')
+YEAR_SINCE = re.compile(r'(?:since|from|or newer than)\s+((?:19|20)\d{2})|((?:19|20)\d{2})\s+or\s+(?:newer|later)')
+YEAR_BEFORE = re.compile(r'(?:older than|before|earlier than)\s+((?:19|20)\d{2})')
+YEAR_EXACT = re.compile(r'(?<![\d$,])((?:19|20)\d{2})(?!\s*(?:k\b|miles|dollars|\d|,\d))')
+
+
+def parse_amount(number: str, unit: str = None) -> int:
+    value = float(number.replace(',', ''))
+    if unit:
+        value *= 1000
+    return int(value)
+
+
+def parse_price_range(match) -> tuple:
+    """Low and high price of a range; "20 to 30 thousand" applies the unit to both ends."""
+    low_unit, high_unit = match.group(2), match.group(4)
+    if not low_unit and high_unit and float(match.group(1).replace(',', '')) < 1000:
+        low_unit = high_unit
+    low = parse_amount(match.group(1), low_unit)
+    high = parse_amount(match.group(3), high_unit)
+    return min(low, high), max(low, high)
+
+
+def is_model_term(word: str) -> bool:
+    return len(word) >= 3 and re.search('[a-z]', word) is not None and word not in MODEL_STOPWORDS
+
+
+def model_terms_for(cars: Iterable[Car]) -> set:
+    """Words that name a car in stock: its Car.model words plus a known make from its title."""
+    terms = set()
+    for car in cars:
+        terms.update(word for word in re.split(r'[^\w-]+', car.model.lower()) if is_model_term(word))
+        terms.update(word for word in re.split(r'[^\w-]+', car.car_title.lower()) if word in CAR_MAKES)
+    return terms
+
+
+def whole_word(field: str, term: str) -> Q:
+    """Case-insensitive match of term as a whole space-separated word of field, on any database."""
+    return (Q(**{f'{field}__iexact': term}) | Q(**{f'{field}__istartswith': f'{term} '})
+            | Q(**{f'{field}__iendswith': f' {term}'}) | Q(**{f'{field}__icontains': f' {term} '}))
+
+
+def contains_phrase(text: str, phrase: str) -> bool:
+    return re.search(rf'(?<![\w/-]){re.escape(phrase)}(?![\w/-])', text) is not None
+
+
+def match_options(text: str, options: Dict[str, List[str]]) -> List[str]:
+    return [value for value, phrases in options.items() if any(contains_phrase(text, p) for p in phrases)]
+
+
+def parse_inventory_query(text: str, known_models: Iterable[str] = ()) -> Dict:
+    """Extract inventory constraints (price, year, body style, ...) from an utterance.
+
+    Returns an empty dict when the utterance does not constrain the inventory.
+    """
+    text = text.lower()
+    constraints = {}
+
+    between = PRICE_BETWEEN.search(text) or PRICE_RANGE.search(text)
+    if between:
+        constraints['min_price'], constraints['max_price'] = parse_price_range(between)
+    else:
+        price_max = PRICE_MAX.search(text)
+        if price_max:
+            constraints['max_price'] = parse_amount(price_max.group(1), price_max.group(2))
+        price_min = PRICE_MIN.search(text)
+        if price_min:
+            constraints['min_price'] = parse_amount(price_min.group(1), price_min.group(2))
+
+    year_range = YEAR_RANGE.search(text)
+    if year_range:
+        constraints['min_year'], constraints['max_year'] = sorted(int(year) for year in year_range.groups())
+    else:
+        year_after = YEAR_AFTER.search(text)
+        year_since = YEAR_SINCE.search(text)
+        year_before = YEAR_BEFORE.search(text)
+        if year_after:
+            constraints['min_year'] = int(year_after.group(1)) + 1
+        elif year_since:
+            constraints['min_year'] = int(year_since.group(1) or year_since.group(2))
+        if year_before:
+            constraints['max_year'] = int(year_before.group(1)) - 1
+        if not (year_after or year_since or year_before):
+            year_exact = YEAR_EXACT.search(text)
+            if year_exact:
+                constraints['min_year'] = constraints['max_year'] = int(year_exact.group(1))
+
+    for key, options in list(FIELD_OPTIONS.items()) + [('features', FEATURES)]:
+        matches = match_options(text, options)
+        if matches:
+            constraints[key] = matches
+
+    # Make/model words taken from the live inventory (model_terms_for), e.g. "honda" or "civic"
+    model_terms = sorted({
+        word for model in known_models for word in model.lower().split()
+        if is_model_term(word) and contains_phrase(text, word)
+    })
+    if model_terms:
+        constraints['model_terms'] = model_terms
+
+    return constraints
+
+
+def search_inventory(constraints: Dict, limit: int = 5) -> List[Car]:
+    """Run parsed constraints as an indexed ORM query and return the best rows."""
+    cars = Car.objects.all()
+    if 'min_price' in constraints:
+        cars = cars.filter(price__gte=constraints['min_price'])
+    if 'max_price' in constraints:
+        cars = cars.filter(price__lte=constraints['max_price'])
+    if 'min_year' in constraints:
+        cars = cars.filter(year__gte=constraints['min_year'])
+    if 'max_year' in constraints:
+        cars = cars.filter(year__lte=constraints['max_year'])
+
+    # These columns are free text, so accept any known spelling of each value.
+    # Upper(column) IN (...) can use the Upper() indexes on Car; __iexact cannot.
+    for key, options in FIELD_OPTIONS.items():
+        if key in constraints:
+            spellings = {spelling.upper() for value in constraints[key]
+                         for spelling in [value] + options[value] + STORED_ALIASES.get(value, [])}
+            cars = cars.alias(**{f'{key}_upper': Upper(key)}).filter(**{f'{key}_upper__in': sorted(spellings)})
+
+    for feature in constraints.get('features', []):
+        cars = cars.filter(features__icontains=feature)
+
+    if 'model_terms' in constraints:
+        match = Q()
+        for term in constraints['model_terms']:
+            match |= whole_word('model', term)
+            if term in CAR_MAKES:
+                match |= whole_word('car_title', term)
+        cars = cars.filter(match)
+
+    return list(cars.order_by('-is_featured', 'price')[:limit])
+
+
+def describe_constraints(constraints: Dict) -> str:
+    """Short human-readable description used when nothing matches."""
+    parts = []
+    for key in ('condition', 'fuel_type', 'body_style', 'transmission'):
+        if key in constraints:
+            parts.append('/'.join(constraints[key]))
+    if 'model_terms' in constraints:
+        parts.append(' '.join(constraints['model_terms']).title())
+    description = ' '.join(parts) or 'vehicles'
+    if 'min_price' in constraints and 'max_price' in constraints:
+        description += f" priced ${constraints['min_price']:,}-${constraints['max_price']:,}"
+    elif 'max_price' in constraints:
+        description += f" under ${constraints['max_price']:,}"
+    elif 'min_price' in constraints:
+        description += f" over ${constraints['min_price']:,}"
+    if constraints.get('min_year') and constraints.get('min_year') == constraints.get('max_year'):
+        description += f" from {constraints['min_year']}"
+    elif 'min_year' in constraints:
+        description += f" from {constraints['min_year']} or newer"
+    elif 'max_year' in constraints:
+        description += f" from {constraints['max_year']} or older"
+    if 'features' in constraints:
+        description += f" with {', '.join(constraints['features'])}"
+    return description
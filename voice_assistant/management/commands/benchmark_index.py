@@ -0,0 +1,90 @@
+import time
+
+import faiss
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from voice_assistant.index_factory import (
+    INDEX_TYPES, SCALAR_QUANTIZERS, build_index, get_index_config, index_memory_bytes, min_training_size,
+)
+
+
+class Command(BaseCommand):
+    help = 'Compare recall and latency of the FAISS index types over the inventory (or synthetic) passages'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--types', default=','.join(INDEX_TYPES),
+                            help='Comma-separated index types to compare (default: all)')
+        parser.add_argument('--storage', default=None,
+                            help='Comma-separated vector storage modes to compare (float32,float16,int8); '
+                                 'defaults to the configured one')
+        parser.add_argument('--synthetic', type=int, default=0, metavar='N',
+                            help='Benchmark N random clustered vectors instead of the live passages')
+        parser.add_argument('--queries', type=int, default=200)
+        parser.add_argument('-k', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['seed'])
+        vectors = self.load_vectors(options['synthetic'], rng)
+        ids = np.arange(len(vectors), dtype='int64')
+        dimension = vectors.shape[1]
+        k = options['k']
+
+        # Queries are perturbed passages, like paraphrased questions
+        picks = rng.integers(0, len(vectors), options['queries'])
+        queries = vectors[picks] + rng.normal(0, 0.05, (len(picks), dimension)).astype('float32')
+
+        exact = faiss.IndexFlatL2(dimension)
+        exact.add(vectors)
+        _, truth = exact.search(queries, k)
+
+        self.stdout.write(f"{len(vectors)} vectors, dimension {dimension}, {len(queries)} queries, k={k}\n")
+        self.stdout.write(f"{'type':<16}{'build s':>10}{'recall@k':>10}{'p50 ms':>10}{'p95 ms':>10}{'size MB':>10}")
+
+        storages = (options['storage'] or get_index_config()['STORAGE']).split(',')
+        for kind, storage in [(k.strip(), s.strip()) for k in options['types'].split(',') for s in storages]:
+            if kind not in INDEX_TYPES:
+                raise CommandError(f"Unknown index type {kind!r}")
+            if storage not in SCALAR_QUANTIZERS:
+                raise CommandError(f"Unknown storage mode {storage!r}")
+            if kind == 'ivfpq' and storage != storages[0]:
+                continue  # PQ codes ignore STORAGE
+            label = kind if kind == 'ivfpq' else f"{kind}/{storage}"
+            # Never overwrite the deployed IVF-PQ codebooks from a benchmark
+            config = get_index_config(TYPE=kind, STORAGE=storage, TRAINED_INDEX_PATH=None)
+            if kind == 'ivfpq' and len(vectors) < min_training_size(config):
+                self.stdout.write(f"{label:<16}  skipped: needs at least {min_training_size(config)} vectors to train")
+                continue
+
+            started = time.perf_counter()
+            index = build_index(dimension, vectors, ids, config)
+            build_seconds = time.perf_counter() - started
+
+            latencies, found = [], []
+            for query in queries:
+                started = time.perf_counter()
+                _, result = index.search(query.reshape(1, -1), k)
+                latencies.append((time.perf_counter() - started) * 1000)
+                found.append(result[0])
+
+            recall = np.mean([len(set(f) & set(t)) / k for f, t in zip(found, truth)])
+            size_mb = index_memory_bytes(index) / (1024 * 1024)
+            self.stdout.write(
+                f"{label:<16}{build_seconds:>10.2f}{recall:>10.3f}"
+                f"{np.percentile(latencies, 50):>10.3f}{np.percentile(latencies, 95):>10.3f}{size_mb:>10.2f}"
+            )
+
+    def load_vectors(self, synthetic, rng):
+        if synthetic:
+            # Clustered data behaves more like real passages than uniform noise
+            centers = rng.normal(0, 1, (max(1, synthetic // 50), 384))
+            vectors = centers[rng.integers(0, len(centers), synthetic)] + rng.normal(0, 0.3, (synthetic, 384))
+            vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+            return vectors.astype('float32')
+
+        from voice_assistant.rag_engine import get_rag_engine
+        engine = get_rag_engine()
+        if not engine.inventory_loaded:
+            engine.load_inventory()
+        return engine.embed(list(engine.snapshot.passages.values()))
@@ -0,0 +1,202 @@
+import asyncio
+import json
+import re
+import resource
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+
+import numpy as np
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+from voice_assistant.models import CallSession
+
+TRANSCRIPT_LINE = re.compile(r'^\[[^\]]+\]\s+USER:\s*(.+)$')
+BENCHMARK_PREFIX = 'voice-benchmark'
+
+
+class QueryCounter:
+    """Count SQL statements by verb on every database connection."""
+
+    def __init__(self):
+        self.counts = Counter()
+        self.lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        with self.lock:
+            self.counts[sql.split(None, 1)[0].upper()] += 1
+        return execute(sql, params, many, context)
+
+    def install(self):
+        # Views run their queries on other threads, which open their own connections
+        connection_created.connect(self.connected, weak=False)
+        for connection in connections.all(initialized_only=True):
+            connection.execute_wrappers.append(self)
+
+    def connected(self, sender, connection, **kwargs):
+        connection.execute_wrappers.append(self)
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+class Command(BaseCommand):
+    help = ('Replay scripted calls through process_voice against a stub Gemini model and report '
+            'throughput, stage latency percentiles, DB queries and peak RSS')
+
+    def add_arguments(self, parser):
+        parser.add_argument('transcripts', nargs='*',
+                            help='call-transcript-*.txt files to replay (default: recent Conversation history)')
+        parser.add_argument('--history-calls', type=int, default=20,
+                            help='Number of recent recorded calls to replay when no transcripts are given')
+        parser.add_argument('--concurrency', type=int, default=4, help='Calls in progress at once')
+        parser.add_argument('--repeat', type=int, default=1, help='Replay every call this many times')
+        parser.add_argument('--llm-latency-ms', type=float, default=800)
+        parser.add_argument('--llm-jitter-ms', type=float, default=0,
+                            help='Extra stub latency of up to this much, derived from each prompt')
+        parser.add_argument('--stream', action='store_true', help='Replay through process_voice_stream (SSE)')
+        parser.add_argument('--no-debounce', action='store_true', help='Answer without the turn debounce')
+        parser.add_argument('--no-cache', action='store_true', help='Disable the response and query caches')
+        parser.add_argument('--keep-data', action='store_true',
+                            help='Keep the benchmark calls and user in the database afterwards')
+
+    def handle(self, *args, **options):
+        scripts = self.load_scripts(options['transcripts'], options['history_calls']) * options['repeat']
+        if not scripts:
+            raise CommandError('Nothing to replay: pass transcript files or record some calls first')
+
+        from voice_assistant import rag_engine
+        from voice_assistant.stub_model import StubGenerativeModel
+
+        if options['no_debounce']:
+            settings.VOICE_ASSISTANT_TURNS = {**getattr(settings, 'VOICE_ASSISTANT_TURNS', {}), 'DEBOUNCE_MS': 0}
+        stub = StubGenerativeModel(options['llm_latency_ms'] / 1000, options['llm_jitter_ms'] / 1000)
+        rag_engine._model = stub
+        engine = rag_engine.warm_up()
+        if options['no_cache']:
+            engine.response_cache = None
+            engine.query_cache = None
+        rss_after_warm_up = peak_rss_mb()
+
+        # Names unique to this run, so cleanup never touches an existing account or call
+        run_prefix = f"{BENCHMARK_PREFIX}-{int(time.time())}-{uuid.uuid4().hex[:8]}"
+        user = get_user_model().objects.create_user(username=run_prefix)
+        counter = QueryCounter()
+        counter.install()
+        try:
+            results = asyncio.run(self.replay(scripts, user, run_prefix, options))
+            results['queries'] = Counter(counter.counts)
+        finally:
+            if not options['keep_data']:
+                from voice_assistant.conversation_writer import get_conversation_writer
+                writer = get_conversation_writer()
+                if writer:
+                    writer.flush()
+                CallSession.objects.filter(session_id__startswith=run_prefix).delete()
+                user.delete()
+
+        self.report(scripts, results, stub, rss_after_warm_up, options)
+
+    def load_scripts(self, paths, history_calls):
+        """Return the user utterances of each call to replay."""
+        if paths:
+            scripts = []
+            for path in paths:
+                with open(path, encoding='utf-8') as f:
+                    turns = [m.group(1).strip() for m in map(TRANSCRIPT_LINE.match, f) if m]
+                if turns:
+                    scripts.append(turns)
+            return scripts
+
+        sessions = CallSession.objects.exclude(session_id__startswith=BENCHMARK_PREFIX)[:history_calls]
+        scripts = []
+        for session in sessions:
+            turns = list(session.messages.filter(speaker='user').order_by('timestamp').values_list('message', flat=True))
+            if turns:
+                scripts.append(turns)
+        return scripts
+
+    async def replay(self, scripts, user, run_prefix, options):
+        from django.test import AsyncClient
+        from voice_assistant.metrics import metrics
+
+        client = AsyncClient()
+        await client.aforce_login(user)
+        url = '/talk-to-ai/process/stream/' if options['stream'] else '/talk-to-ai/process/'
+        semaphore = asyncio.Semaphore(options['concurrency'])
+        latencies, outcomes = [], Counter()
+
+        async def post(path, payload):
+            return await client.post(path, json.dumps(payload), content_type='application/json')
+
+        async def replay_call(number, turns):
+            session_id = f"{run_prefix}-{number}"
+            async with semaphore:
+                await post('/talk-to-ai/process/', {'session_id': session_id, 'is_call_start': True})
+                for text in turns:
+                    started = time.perf_counter()
+                    response = await post(url, {'session_id': session_id, 'text': text})
+                    if options['stream']:
+                        body = b''.join([chunk async for chunk in response.streaming_content]).decode()
+                        events = [json.loads(line[6:]) for line in body.split('\n\n') if line.startswith('data: ')]
+                        outcome = events[-1]['type'] if events else 'empty'
+                    else:
+                        data = json.loads(response.content)
+                        outcome = ('duplicate' if data.get('is_duplicate') else
+                                   'superseded' if data.get('is_superseded') else data.get('status'))
+                    latencies.append(time.perf_counter() - started)
+                    outcomes[outcome if response.status_code == 200 else f"http {response.status_code}"] += 1
+                await post('/talk-to-ai/process/', {'session_id': session_id, 'is_call_end': True})
+
+        metrics.reset()
+        started = time.perf_counter()
+        await asyncio.gather(*(replay_call(number, turns) for number, turns in enumerate(scripts)))
+        return {
+            'elapsed': time.perf_counter() - started,
+            'latencies': latencies,
+            'outcomes': outcomes,
+            'stages': metrics.stats(),
+        }
+
+    def report(self, scripts, results, stub, rss_after_warm_up, options):
+        turns = len(results['latencies'])
+        elapsed = results['elapsed']
+        latencies_ms = np.array(results['latencies']) * 1000
+        queries = sum(results['queries'].values())
+
+        self.stdout.write(
+            f"{len(scripts)} calls, {turns} turns, concurrency {options['concurrency']}, "
+            f"stub LLM {options['llm_latency_ms']:.0f}ms (+{options['llm_jitter_ms']:.0f}ms jitter), "
+            f"{'SSE' if options['stream'] else 'JSON'}\n"
+        )
+        self.stdout.write(f"elapsed            {elapsed:.2f}s")
+        self.stdout.write(f"turns/sec          {turns / elapsed:.2f}")
+        self.stdout.write(
+            f"turn latency ms    p50 {np.percentile(latencies_ms, 50):.1f}  "
+            f"p95 {np.percentile(latencies_ms, 95):.1f}  p99 {np.percentile(latencies_ms, 99):.1f}"
+        )
+        self.stdout.write(f"outcomes           {dict(results['outcomes'])}")
+        self.stdout.write(f"LLM calls          {stub.calls}")
+        self.stdout.write(
+            f"DB queries         {queries} ({queries / max(turns, 1):.1f}/turn)  "
+            + '  '.join(f"{verb} {count}" for verb, count in results['queries'].most_common())
+        )
+        self.stdout.write(f"peak RSS           {peak_rss_mb():.0f} MB (after warm-up {rss_after_warm_up:.0f} MB)")
+
+        stages = results['stages']
+        self.stdout.write(f"\n{'stage':<10}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+        for stage, summary in stages['stages'].items():
+            self.stdout.write(
+                f"{stage:<10}{summary['count']:>8}{summary['p50_ms']:>10.1f}{summary['p95_ms']:>10.1f}{summary['p99_ms']:>10.1f}"
+            )
+        if stages['timeouts']:
+            self.stdout.write(f"timeouts           {stages['timeouts']}")
@@ -0,0 +1,69 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from cars.models import Car
+from voice_assistant.encoders import OnnxEncoder, check_parity, export_onnx, get_encoder_config, onnx_model_path
+from voice_assistant.rag_engine import EMBEDDING_MODEL_NAME, format_car_context
+
+SAMPLE_QUERIES = [
+    "What are your service hours?",
+    "Do you have any SUVs under $30,000?",
+    "Can I get financing with bad credit?",
+    "Show me used sedans newer than 2019 with a backup camera",
+    "Is there a discount for military personnel?",
+    "How long can I take a car for a test drive?",
+]
+
+
+class Command(BaseCommand):
+    help = 'Export the embedding model to ONNX (optionally int8) and check it against PyTorch'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', default=EMBEDDING_MODEL_NAME)
+        parser.add_argument('--output', help="Output directory (default: VOICE_ASSISTANT_ENCODER['ONNX_DIR'])")
+        parser.add_argument('--quantize', action='store_true', help='Also write a dynamically int8-quantized model')
+        parser.add_argument('--min-cosine', type=float, default=0.99,
+                            help='Fail if any parity vector is less similar than this to PyTorch')
+        parser.add_argument('--skip-parity', action='store_true')
+
+    def handle(self, *args, **options):
+        output = options['output'] or get_encoder_config()['ONNX_DIR']
+        export_onnx(options['model'], output, quantize=options['quantize'])
+        self.stdout.write(self.style.SUCCESS(f"Exported {options['model']} to {output}"))
+        if options['skip_parity']:
+            return
+
+        from sentence_transformers import SentenceTransformer
+        reference = SentenceTransformer(options['model'], device='cpu')
+        texts = SAMPLE_QUERIES + [format_car_context(car) for car in Car.objects.all()[:50]]
+
+        variants = [False, True] if options['quantize'] else [False]
+        failed = []
+        self.stdout.write(f"{'backend':<12}{'min cos':>10}{'mean cos':>10}{'p50 ms':>10}")
+        self.stdout.write(f"{'torch':<12}{1:>10.4f}{1:>10.4f}{self.query_latency(reference):>10.2f}")
+        for quantize in variants:
+            config = get_encoder_config(ONNX_DIR=output, QUANTIZE=quantize)
+            encoder = OnnxEncoder(output, onnx_model_path(config))
+            parity = check_parity(reference, encoder, texts)
+            label = 'onnx-int8' if quantize else 'onnx'
+            self.stdout.write(
+                f"{label:<12}{parity['min_cosine']:>10.4f}{parity['mean_cosine']:>10.4f}"
+                f"{self.query_latency(encoder):>10.2f}"
+            )
+            if parity['min_cosine'] < options['min_cosine']:
+                failed.append(label)
+
+        if failed:
+            raise CommandError(f"Parity check failed for {', '.join(failed)} (min cosine below {options['min_cosine']})")
+
+    def query_latency(self, encoder, runs=20):
+        """Median single-query encode time, as on the voice request path."""
+        encoder.encode(SAMPLE_QUERIES[:1])
+        timings = []
+        for i in range(runs):
+            started = time.perf_counter()
+            encoder.encode([SAMPLE_QUERIES[i % len(SAMPLE_QUERIES)]])
+            timings.append((time.perf_counter() - started) * 1000)
+        return float(np.median(timings))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from voice_assistant.embedding_server import serve
+
+
+class Command(BaseCommand):
+    help = 'Serve embeddings and the inventory index to the web workers on this host over a Unix socket'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--socket', help="Socket path (default: VOICE_ASSISTANT_EMBEDDING_SERVER['SOCKET'])")
+        parser.add_argument('--snapshot-dir', help="Where index snapshots are saved for the workers to map")
+
+    def handle(self, *args, **options):
+        serve(options['socket'], options['snapshot_dir'])
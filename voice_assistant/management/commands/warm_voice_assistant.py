@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from voice_assistant.rag_engine import warm_up
+
+
+class Command(BaseCommand):
+    help = 'Preload the voice assistant encoder, Gemini client and inventory index'
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        engine = warm_up()
+        self.stdout.write(self.style.SUCCESS(
+            f"Voice assistant warmed up in {time.perf_counter() - started:.2f}s "
+            f"({len(engine.snapshot.passages)} passages indexed)"
+        ))
+
+        memory = engine.memory_report()
+        self.stdout.write(
+            f"Index: {memory['index_type']}/{memory['storage']}, {memory['vectors']} vectors, "
+            f"{memory['index_bytes'] / 1024:.1f} KiB ({memory['bytes_per_vector']:.0f} B/vector); "
+            f"passages {memory['passage_bytes'] / 1024:.1f} KiB"
+        )
@@ -0,0 +1,137 @@
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class StageSummary:
+    """Count, total and recent samples of one stage's duration in seconds."""
+
+    def __init__(self, window=1024):
+        self.count = 0
+        self.total = 0.0
+        self.samples = deque(maxlen=window)
+
+    def observe(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        self.samples.append(seconds)
+
+    def quantile(self, q: float) -> float:
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class VoiceMetrics:
+    """Process-wide latency and timeout counters for the voice pipeline.
+
+    Percentiles are computed over the most recent ``window`` samples of each
+    stage; counts and sums cover the life of the process, as Prometheus
+    summaries expect.
+    """
+
+    def __init__(self, window=1024):
+        self.window = window
+        self.stages = {}
+        self.timeouts = Counter()
+        self.counters = Counter()
+        self.lock = threading.Lock()
+
+    def observe(self, stage: str, seconds: float):
+        with self.lock:
+            summary = self.stages.get(stage)
+            if summary is None:
+                summary = self.stages[stage] = StageSummary(self.window)
+            summary.observe(seconds)
+
+    def reset(self):
+        with self.lock:
+            self.stages.clear()
+            self.timeouts.clear()
+            self.counters.clear()
+
+    def record_timeout(self, stage: str):
+        with self.lock:
+            self.timeouts[stage] += 1
+
+    def increment(self, name: str):
+        with self.lock:
+            self.counters[name] += 1
+
+    def stats(self):
+        """Per-stage percentiles in milliseconds, for the readiness probe."""
+        with self.lock:
+            return {
+                'stages': {
+                    stage: {
+                        'count': summary.count,
+                        **{f"p{int(q * 100)}_ms": round(summary.quantile(q) * 1000, 1) for q in QUANTILES},
+                    }
+                    for stage, summary in sorted(self.stages.items())
+                },
+                'timeouts': dict(self.timeouts),
+                'counters': dict(self.counters),
+            }
+
+    def prometheus(self) -> str:
+        """Render the metrics in the Prometheus text exposition format."""
+        lines = [
+            '# HELP voice_assistant_stage_seconds Time spent in each stage of a voice turn.',
+            '# TYPE voice_assistant_stage_seconds summary',
+        ]
+        with self.lock:
+            for stage, summary in sorted(self.stages.items()):
+                for q in QUANTILES:
+                    lines.append(f'voice_assistant_stage_seconds{{stage="{stage}",quantile="{q}"}} {summary.quantile(q):.6f}')
+                lines.append(f'voice_assistant_stage_seconds_sum{{stage="{stage}"}} {summary.total:.6f}')
+                lines.append(f'voice_assistant_stage_seconds_count{{stage="{stage}"}} {summary.count}')
+
+            lines.append('# HELP voice_assistant_stage_timeouts_total Stages that missed their deadline.')
+            lines.append('# TYPE voice_assistant_stage_timeouts_total counter')
+            for stage, count in sorted(self.timeouts.items()):
+                lines.append(f'voice_assistant_stage_timeouts_total{{stage="{stage}"}} {count}')
+
+            for name, count in sorted(self.counters.items()):
+                lines.append(f'# TYPE voice_assistant_{name}_total counter')
+                lines.append(f'voice_assistant_{name}_total {count}')
+        return '\n'.join(lines) + '\n'
+
+
+metrics = VoiceMetrics()
+
+
+class TurnTimings:
+    """Stage durations of one turn, added to the process-wide metrics when it finishes."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def add(self, name: str, seconds: float):
+        # A stage that runs more than once (e.g. each streamed chunk) is summed
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def finish(self):
+        """Time the whole turn as 'total' and record every stage once."""
+        self.add('total', time.perf_counter() - self.started)
+        for name, seconds in self.stages.items():
+            metrics.observe(name, seconds)
+
+    def as_dict(self):
+        return {name: round(seconds * 1000, 1) for name, seconds in self.stages.items()}
+
+    def server_timing(self) -> str:
+        """Format the stages as a Server-Timing header value (durations in ms)."""
+        return ', '.join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.stages.items())
@@ -48,3 +48,21 @@ class CallFeedback(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+
+class InventoryVersion(models.Model):
+    """A counter bumped whenever a Car changes, so every worker can tell its index is stale."""
+    version = models.PositiveBigIntegerField(default=0)
+
+    @classmethod
+    def bump(cls) -> int:
+        cls.objects.get_or_create(pk=1)
+        cls.objects.filter(pk=1).update(version=models.F('version') + 1)
+        return cls.current()
+
+    @classmethod
+    def current(cls) -> int:
+        return cls.objects.filter(pk=1).values_list('version', flat=True).first() or 0
+
+    @classmethod
+    async def acurrent(cls) -> int:
+        return await cls.objects.filter(pk=1).values_list('version', flat=True).afirst() or 0
@@ -0,0 +1,133 @@
+import math
+import re
+from typing import Dict, List, Sequence, Tuple
+
+from django.conf import settings
+
+PROMPT_DEFAULTS = {
+    # Token budgets per prompt section (estimated at CHARS_PER_TOKEN)
+    'CONTEXT_TOKENS': 600,
+    'SUMMARY_TOKENS': 150,
+    'HISTORY_TOKENS': 250,
+    'QUERY_TOKENS': 120,
+    'MIN_RELEVANCE': 0.25,  # cosine similarity below which retrieved passages are left out
+}
+
+# Gemini's tokenizer is remote; about 4 characters per token holds for English
+CHARS_PER_TOKEN = 4
+# A passage cut shorter than this is not worth including
+MIN_PASSAGE_TOKENS = 30
+# Words kept from each older message when it is folded into the call summary
+GIST_WORDS = 20
+
+CONTEXT_HEADING = "Relevant dealership information:"
+SUMMARY_HEADING = "Earlier in this call:"
+HISTORY_HEADING = "Previous conversation:"
+
+FIRST_SENTENCE = re.compile(r'^(.+?[.!?])(\s|$)')
+
+
+def get_prompt_config() -> dict:
+    config = dict(PROMPT_DEFAULTS)
+    config.update(getattr(settings, 'VOICE_ASSISTANT_PROMPT', {}))
+    return config
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def truncate_to_tokens(text: str, tokens: int) -> str:
+    """Cut text to about ``tokens`` tokens at a word boundary."""
+    limit = tokens * CHARS_PER_TOKEN
+    if len(text) <= limit:
+        return text
+    cut = text[:limit].rsplit(' ', 1)[0]
+    return cut.rstrip(' ,;:') + '...'
+
+
+def speaker_label(speaker: str) -> str:
+    return "Customer" if speaker == 'user' else "Assistant"
+
+
+def select_passages(context: Sequence[Tuple[str, float]], budget: int, min_relevance: float) -> List[str]:
+    """Most relevant passages that fit the budget; the last one may be shortened to fit."""
+    selected = []
+    for passage, score in sorted(context or [], key=lambda hit: hit[1], reverse=True):
+        if score < min_relevance:
+            break
+        cost = estimate_tokens(passage) + 1
+        if cost <= budget:
+            selected.append(passage)
+            budget -= cost
+        elif budget >= MIN_PASSAGE_TOKENS or not selected:
+            selected.append(truncate_to_tokens(passage, budget))
+            break
+        else:
+            break
+    return selected
+
+
+def select_history(history: Sequence[Dict], budget: int) -> List[str]:
+    """The newest messages that fit the budget, oldest first."""
+    lines = []
+    for msg in reversed(history or []):
+        line = f"{speaker_label(msg['speaker'])}: {msg['message']}"
+        cost = estimate_tokens(line) + 1
+        if cost > budget:
+            if not lines:
+                lines.append(truncate_to_tokens(line, budget))
+            break
+        lines.append(line)
+        budget -= cost
+    return lines[::-1]
+
+
+def gist(msg: Dict) -> str:
+    """A short line standing in for one older message."""
+    text = ' '.join(msg['message'].split())
+    if msg['speaker'] != 'user':
+        match = FIRST_SENTENCE.match(text)
+        text = match.group(1) if match else text
+    words = text.split()
+    if len(words) > GIST_WORDS:
+        text = ' '.join(words[:GIST_WORDS]) + '...'
+    return f"{speaker_label(msg['speaker'])}: {text}"
+
+
+def fold_into_summary(summary: Sequence[str], messages: Sequence[Dict], budget: int = None) -> List[str]:
+    """Add older messages to a call's summary lines, keeping it within the budget.
+
+    The customer's own words (what they are looking for) outlast the
+    assistant's replies: when over budget, the oldest assistant line goes
+    first, then the oldest customer line.
+    """
+    budget = budget or get_prompt_config()['SUMMARY_TOKENS']
+    lines = list(summary) + [gist(msg) for msg in messages]
+    while lines and sum(estimate_tokens(line) + 1 for line in lines) > budget:
+        assistant_lines = [i for i, line in enumerate(lines) if not line.startswith("Customer:")]
+        del lines[assistant_lines[0] if assistant_lines else 0]
+    return lines
+
+
+def build_prompt(system_prompt: str, query: str, context: Sequence[Tuple[str, float]],
+                 conversation_history: Sequence[Dict] = None, summary: Sequence[str] = None) -> str:
+    """Assemble the prompt with each section held to its token budget.
+
+    ``context`` is (passage, relevance) pairs; ``summary`` condenses the call
+    before ``conversation_history``, so the prompt stays the same size however
+    long the call runs.
+    """
+    config = get_prompt_config()
+    passages = select_passages(context, config['CONTEXT_TOKENS'], config['MIN_RELEVANCE'])
+    history = select_history(conversation_history, config['HISTORY_TOKENS'])
+    summary = fold_into_summary(summary or [], [], config['SUMMARY_TOKENS'])
+
+    prompt = f"{system_prompt}\n\n"
+    prompt += f"{CONTEXT_HEADING}\n" + "\n".join(passages) + "\n\n"
+    if summary:
+        prompt += f"{SUMMARY_HEADING}\n" + "\n".join(summary) + "\n\n"
+    if history:
+        prompt += f"{HISTORY_HEADING}\n" + "\n".join(history) + "\n\n"
+    prompt += f"Customer: {truncate_to_tokens(query, config['QUERY_TOKENS'])}\n\nAssistant:"
+    return prompt
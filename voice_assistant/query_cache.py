@@ -0,0 +1,94 @@
+import re
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+# Hesitations that carry no meaning at either end of an utterance. Words such
+# as "okay", "right" or "please" stay: "is that okay" is not "is that".
+EDGE_FILLERS = {'um', 'umm', 'uh', 'uhh', 'er', 'erm', 'ah', 'hmm', 'so'}
+
+
+def normalize_query(text: str) -> str:
+    """Lowercase, drop punctuation and leading/trailing filler words."""
+    words = re.sub(r"[^\w$'/.\s]|(?<!\d)\.|\.(?!\d)", ' ', text.lower()).split()
+    while words and words[0] in EDGE_FILLERS:
+        words.pop(0)
+    while words and words[-1] in EDGE_FILLERS:
+        words.pop()
+    return ' '.join(words)
+
+
+class QueryCacheEntry:
+    __slots__ = ('vector', 'version', 'k', 'ids', 'distances')
+
+    def __init__(self, vector: np.ndarray):
+        self.vector = vector
+        self.version = None
+        self.k = 0
+        self.ids = None
+        self.distances = None
+
+
+class QueryCache:
+    """Bounded LRU of normalized query text -> embedding and nearest passages.
+
+    Embeddings never go stale; search results are only reused for the index
+    version they were computed against and for up to the k searched for.
+    """
+
+    def __init__(self, max_entries=1000):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.vector_hits = 0
+        self.vector_misses = 0
+        self.result_hits = 0
+        self.result_misses = 0
+
+    def get_vector(self, query: str) -> Optional[np.ndarray]:
+        key = normalize_query(query)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.vector_misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.vector_hits += 1
+            return entry.vector
+
+    def put_vector(self, query: str, vector: np.ndarray):
+        key = normalize_query(query)
+        with self.lock:
+            if key not in self.entries:
+                self.entries[key] = QueryCacheEntry(vector)
+                while len(self.entries) > self.max_entries:
+                    self.entries.popitem(last=False)
+            self.entries.move_to_end(key)
+
+    def get_results(self, query: str, version: int, k: int) -> Optional[Tuple[List[int], List[float]]]:
+        """Return the top-k ids and distances cached for this index version, if any."""
+        with self.lock:
+            entry = self.entries.get(normalize_query(query))
+            if entry is None or entry.version != version or entry.k < k:
+                self.result_misses += 1
+                return None
+            self.result_hits += 1
+            return entry.ids[:k], entry.distances[:k]
+
+    def put_results(self, query: str, version: int, k: int, ids: List[int], distances: List[float]):
+        with self.lock:
+            entry = self.entries.get(normalize_query(query))
+            if entry is not None:
+                entry.version, entry.k, entry.ids, entry.distances = version, k, ids, distances
+
+    def stats(self):
+        with self.lock:
+            return {
+                'entries': len(self.entries),
+                'vector_hits': self.vector_hits,
+                'vector_misses': self.vector_misses,
+                'result_hits': self.result_hits,
+                'result_misses': self.result_misses,
+            }
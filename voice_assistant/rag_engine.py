@@ -1,12 +1,12 @@
 import os
-from typing import List, Dict
+import re
+import threading
+import time
+from typing import List, Dict, Optional, Tuple
 import requests
-from sentence_transformers import SentenceTransformer
-import faiss
 import numpy as np
 from dotenv import load_dotenv
 import json
-import google.generativeai as genai
 import django
 from django.conf import settings
 from asgiref.sync import sync_to_async
@@ -17,261 +17,192 @@ if not settings.configured:
     django.setup()
 
 from cars.models import Car
-from django.db import models
+from django.db import close_old_connections, models
+from .embedding_store import EmbeddingStore
+from .encode_batcher import QueryEncodeBatcher
+from .encoders import encoder_namespace, load_encoder
+from .embedding_server import EmbeddingClient, get_server_config, use_embedding_server
+from .faq import FaqFastPath, get_faq_config
+from .generation_backends import load_generation_backend
+from .generation_gateway import GatewayBusy, generation_gateway
+from .index_factory import build_index, get_index_config, index_memory_bytes
+from .deadlines import StageTimeout, TurnDeadline
+from .index_snapshot import IndexSnapshot
+from .inventory_search import describe_constraints, model_terms_for, parse_inventory_query, search_inventory
+from .metrics import TurnTimings, metrics
+from .models import CallSession, Conversation, InventoryVersion
+from . import prompt_builder
+from .query_cache import QueryCache
+from .response_cache import SemanticResponseCache
+from .speculation import SpeculativeRetrieval
 
 load_dotenv()
 
-# Initialize Google Gemini API settings
-GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
-genai.configure(api_key=GEMINI_API_KEY)
+# Sentence transformer used for embeddings
+EMBEDDING_MODEL_NAME = 'all-MiniLM-L6-v2'
 
-# Initialize the Gemini model
-model = genai.GenerativeModel('gemini-1.5-flash')
+# The generation backend, the encoder and the engine are heavy, so they are only
+# created on first use (or by `manage.py warm_voice_assistant`). Importing this
+# module must stay cheap: management commands import it through the URLconf.
+_model = None
+_encoder = None
+_engine = None
+_load_lock = threading.Lock()
+_engine_lock = threading.Lock()
+# Background warm-up started by the readiness probe
+_warm_up_lock = threading.Lock()
+_warm_up_thread = None
+_warm_up_error = None
+_warmed_up = False
 
-# Initialize sentence transformer for embeddings
-encoder = SentenceTransformer('all-MiniLM-L6-v2')
+# Dealership information (non-car specific) indexed next to the inventory.
+# FAQ templates in faq.py restate these passages word for word as their keys.
+BASE_KNOWLEDGE = [
+    # Financing Options
+    "We offer competitive financing rates starting from 2.9% APR for qualified buyers.",
+    "Special financing programs available for first-time buyers and college graduates with rates from 3.9% APR.",
+    "Flexible lease terms available from 24 to 60 months with multiple mileage options.",
+    "We work with multiple lenders to ensure you get the best possible financing terms.",
+    "Zero down payment options available for qualified buyers with excellent credit.",
+    "Quick and easy online pre-approval process available through our secure website.",
 
-class RAGEngine:
-    def __init__(self):
-        # Base knowledge base with dealership information (non-car specific)
-        self.base_knowledge = [
-            # Financing Options
-            "We offer competitive financing rates starting from 2.9% APR for qualified buyers.",
-            "Special financing programs available for first-time buyers and college graduates with rates from 3.9% APR.",
-            "Flexible lease terms available from 24 to 60 months with multiple mileage options.",
-            "We work with multiple lenders to ensure you get the best possible financing terms.",
-            "Zero down payment options available for qualified buyers with excellent credit.",
-            "Quick and easy online pre-approval process available through our secure website.",
-            
-            # Service Department
-            "Our service department is staffed with factory-trained technicians certified by major manufacturers.",
-            "We offer comprehensive maintenance services including oil changes, tire rotations, brake service, and major repairs.",
-            "Express service available for routine maintenance with no appointment necessary.",
-            "Complimentary multi-point inspection with every service visit.",
-            "Service hours: Monday-Friday 7 AM to 7 PM, Saturday 8 AM to 5 PM.",
-            "We use genuine OEM parts for all repairs and maintenance.",
-            
-            # Special Programs
-            "Military personnel receive an additional $500 off their purchase.",
-            "College graduate program offers $750 rebate on new vehicle purchases.",
-            "First-time buyer program includes reduced down payment requirements and special rates.",
-            "Trade-in program offers competitive market value plus an additional $500 towards your new vehicle.",
-            
-            # Dealership Amenities
-            "Comfortable waiting area with complimentary Wi-Fi, coffee, and refreshments.",
-            "Courtesy shuttle service available within a 10-mile radius.",
-            "Kids play area in the showroom to make your visit more comfortable.",
-            "Complimentary car wash with every service visit.",
-            
-            # Business Hours & Location
-            "Sales department hours: Monday-Saturday 9 AM to 7 PM, Sunday 11 AM to 5 PM.",
-            "Service center hours: Monday-Friday 7 AM to 7 PM, Saturday 8 AM to 5 PM.",
-            "We are located in University of Education, Lahore, Pakistan.",
-            "Reference points include Township and College Road.",
-            
-            # Test Drive Policy
-            "Test drives available 7 days a week with prior appointment.",
-            "Extended test drives up to 24 hours available for serious buyers.",
-            "Virtual test drive consultations available through video call.",
-            "Multiple vehicles can be test-driven in a single visit.",
-            
-            # Warranty Information
-            "New vehicles come with comprehensive manufacturer warranty coverage.",
-            "Extended warranty options available for both new and used vehicles.",
-            "Certified pre-owned vehicles include additional 1-year/12,000-mile warranty.",
-            "Powertrain warranty coverage up to 10 years/100,000 miles available.",
-            
-            # Additional Services
-            "All our used vehicles undergo a comprehensive 150-point inspection and come with a detailed vehicle history report.",
-            "We offer certified pre-owned vehicles from major manufacturers with extended warranty coverage.",
-            "Every used vehicle comes with a 7-day/500-mile money-back guarantee.",
-            "Free vehicle history reports for all used cars.",
-            "Complimentary vehicle appraisals for trade-ins.",
-            "Online inventory search with detailed vehicle specifications and photos.",
-            "Custom vehicle ordering available for specific model configurations.",
-            "Assistance with vehicle registration and insurance.",
-        ]
-        
-        # Session-based caching for car inventory
-        self.session_cache = {}
-        self.current_session_id = None
-        self.knowledge_base = None
-        self.embeddings = None
-        self.index = None
-        
-        # Initialize with base knowledge only (no car data yet)
-        self.initialize_base_index()
+    # Service Department
+    "Our service department is staffed with factory-trained technicians certified by major manufacturers.",
+    "We offer comprehensive maintenance services including oil changes, tire rotations, brake service, and major repairs.",
+    "Express service available for routine maintenance with no appointment necessary.",
+    "Complimentary multi-point inspection with every service visit.",
+    "Service hours: Monday-Friday 7 AM to 7 PM, Saturday 8 AM to 5 PM.",
+    "We use genuine OEM parts for all repairs and maintenance.",
 
-    def initialize_base_index(self):
-        """Initialize FAISS index with base knowledge only (no car inventory yet)."""
-        self.knowledge_base = self.base_knowledge.copy()
-        self.embeddings = encoder.encode(self.knowledge_base)
-        self.dimension = self.embeddings.shape[1]
-        self.index = faiss.IndexFlatL2(self.dimension)
-        self.index.add(self.embeddings.astype('float32'))
-
-    async def get_or_create_session_context(self, session_id=None):
-        """Get cached car inventory context for session, or create if not exists."""
-        # If no session provided, use global context (refresh each time)
-        if not session_id:
-            return await self.get_car_inventory_context()
-        
-        # Check if we have cached context for this session
-        if session_id in self.session_cache:
-            return self.session_cache[session_id]
-        
-        # Create new context for this session
-        car_context = await self.get_car_inventory_context()
-        self.session_cache[session_id] = car_context
-        
-        # Clean up old sessions (keep only last 10 sessions to prevent memory bloat)
-        if len(self.session_cache) > 10:
-            oldest_session = next(iter(self.session_cache))
-            del self.session_cache[oldest_session]
-        
-        return car_context
+    # Special Programs
+    "Military personnel receive an additional $500 off their purchase.",
+    "College graduate program offers $750 rebate on new vehicle purchases.",
+    "First-time buyer program includes reduced down payment requirements and special rates.",
+    "Trade-in program offers competitive market value plus an additional $500 towards your new vehicle.",
 
-    async def update_knowledge_base_for_session(self, session_id=None):
-        """Update the knowledge base with car inventory for specific session."""
-        # Get car inventory (cached for session or fresh)
-        car_inventory = await self.get_or_create_session_context(session_id)
-        
-        # Only rebuild if session changed or if we don't have current knowledge base
-        if (self.current_session_id != session_id or 
-            self.knowledge_base is None or 
-            len(self.knowledge_base) == len(self.base_knowledge)):  # No car data yet
-            
-            # Combine base knowledge with current inventory
-            self.knowledge_base = self.base_knowledge + car_inventory
-            
-            # Recreate FAISS index with updated knowledge
-            self.embeddings = encoder.encode(self.knowledge_base)
-            self.dimension = self.embeddings.shape[1]
-            self.index = faiss.IndexFlatL2(self.dimension)
-            self.index.add(self.embeddings.astype('float32'))
-            
-            # Update current session tracking
-            self.current_session_id = session_id
-
-    def refresh_session_inventory(self, session_id):
-        """Force refresh car inventory for a specific session (use when inventory changes)."""
-        if session_id in self.session_cache:
-            del self.session_cache[session_id]
-            print(f"Refreshed inventory cache for session: {session_id}")
-        # Next call to get_or_create_session_context will fetch fresh data
-
-    def clear_session_cache(self, session_id=None):
-        """Clear cache for specific session or all sessions."""
-        if session_id:
-            if session_id in self.session_cache:
-                del self.session_cache[session_id]
-                print(f"Cleared cache for session: {session_id}")
-        else:
-            self.session_cache.clear()
-            self.current_session_id = None
-            print("Cleared all session caches")
+    # Dealership Amenities
+    "Comfortable waiting area with complimentary Wi-Fi, coffee, and refreshments.",
+    "Courtesy shuttle service available within a 10-mile radius.",
+    "Kids play area in the showroom to make your visit more comfortable.",
+    "Complimentary car wash with every service visit.",
 
-    @sync_to_async
-    def get_car_inventory_context(self):
-        """Fetch current car inventory from database and convert to context strings."""
-        try:
-            cars = Car.objects.all()
-            car_contexts = []
-            
-            # Group cars by model for better organization
-            car_models = {}
-            for car in cars:
-                model_key = f"{car.model} {car.year}".strip()
-                if model_key not in car_models:
-                    car_models[model_key] = []
-                car_models[model_key].append(car)
-            
-            # Create context for inventory overview
-            if cars.exists():
-                models_available = set(car.model for car in cars)
-                years_range = f"{cars.aggregate(min_year=models.Min('year'), max_year=models.Max('year'))['min_year']}-{cars.aggregate(min_year=models.Min('year'), max_year=models.Max('year'))['max_year']}"
-                
-                car_contexts.append(f"We have a great selection of vehicles available in our showroom.")
-                car_contexts.append(f"Our current lineup includes: {', '.join(sorted(models_available))}.")
-                car_contexts.append(f"Model years range from {years_range}.")
-            
-            # Create detailed context for each car
-            for car in cars[:20]:  # Limit to first 20 cars to avoid too much context
-                # Handle MultiSelectField features properly
-                if hasattr(car.features, '__iter__') and not isinstance(car.features, str):
-                    # If it's iterable (list-like), join it
-                    features_text = ', '.join(car.features) if car.features else 'standard features'
-                elif isinstance(car.features, str):
-                    # If it's a string, split it
-                    features_list = car.features.split(',') if car.features else []
-                    features_text = ', '.join(features_list) if features_list else 'standard features'
+    # Business Hours & Location
+    "Sales department hours: Monday-Saturday 9 AM to 7 PM, Sunday 11 AM to 5 PM.",
+    "Service center hours: Monday-Friday 7 AM to 7 PM, Saturday 8 AM to 5 PM.",
+    "We are located in University of Education, Lahore, Pakistan.",
+    "Reference points include Township and College Road.",
+
+    # Test Drive Policy
+    "Test drives available 7 days a week with prior appointment.",
+    "Extended test drives up to 24 hours available for serious buyers.",
+    "Virtual test drive consultations available through video call.",
+    "Multiple vehicles can be test-driven in a single visit.",
+
+    # Warranty Information
+    "New vehicles come with comprehensive manufacturer warranty coverage.",
+    "Extended warranty options available for both new and used vehicles.",
+    "Certified pre-owned vehicles include additional 1-year/12,000-mile warranty.",
+    "Powertrain warranty coverage up to 10 years/100,000 miles available.",
+
+    # Additional Services
+    "All our used vehicles undergo a comprehensive 150-point inspection and come with a detailed vehicle history report.",
+    "We offer certified pre-owned vehicles from major manufacturers with extended warranty coverage.",
+    "Every used vehicle comes with a 7-day/500-mile money-back guarantee.",
+    "Free vehicle history reports for all used cars.",
+    "Complimentary vehicle appraisals for trade-ins.",
+    "Online inventory search with detailed vehicle specifications and photos.",
+    "Custom vehicle ordering available for specific model configurations.",
+    "Assistance with vehicle registration and insurance.",
+]
+
+
+def get_model():
+    """Return the generation backend (Gemini by default, per VOICE_ASSISTANT_LLM), loading it on first use."""
+    global _model
+    if _model is None:
+        with _load_lock:
+            if _model is None:
+                _model = load_generation_backend()
+    return _model
+
+
+def get_encoder():
+    """Return the embedding encoder, loading it on first use.
+
+    Workers using the embedding server get a client with the same encode().
+    """
+    global _encoder
+    if _encoder is None:
+        with _load_lock:
+            if _encoder is None:
+                if use_embedding_server():
+                    config = get_server_config()
+                    _encoder = EmbeddingClient(config['SOCKET'], config['TIMEOUT'])
                 else:
-                    features_text = 'standard features'
-                
-                car_context = f"{car.car_title}: {car.year} {car.model} in {car.color}, priced at ${car.price:,}. "
-                car_context += f"This {car.condition} vehicle has {car.miles:,} miles, {car.engine} engine, {car.transmission} transmission, "
-                car_context += f"{car.doors} doors, seats {car.passengers} passengers, and features {features_text}. "
-                car_context += f"Fuel type: {car.fuel_type}, Located in {car.city}, {car.state}."
-                
-                if car.is_featured:
-                    car_context += " This is a FEATURED vehicle with special pricing."
-                
-                car_contexts.append(car_context)
-            
-            # Add summary information about different categories without specific counts
-            if cars.exists():
-                # Price ranges - just mention ranges without counts
-                has_budget = cars.filter(price__lt=30000).exists()
-                has_mid_range = cars.filter(price__gte=30000, price__lt=50000).exists()
-                has_luxury = cars.filter(price__gte=50000).exists()
-                
-                price_ranges = []
-                if has_budget:
-                    price_ranges.append("budget-friendly options under $30,000")
-                if has_mid_range:
-                    price_ranges.append("mid-range vehicles $30,000-$50,000")
-                if has_luxury:
-                    price_ranges.append("luxury vehicles over $50,000")
-                
-                if price_ranges:
-                    car_contexts.append(f"We offer {', '.join(price_ranges)}.")
-            
-            return car_contexts
-            
-        except Exception as e:
-            print(f"Error fetching car inventory: {str(e)}")
-            return ["We have a variety of quality vehicles available. Please visit our showroom or contact us for current inventory."]
+                    # PyTorch or ONNX Runtime, per VOICE_ASSISTANT_ENCODER
+                    _encoder = load_encoder(EMBEDDING_MODEL_NAME)
+    return _encoder
 
-    async def get_relevant_context(self, query: str, session_id: str = None, k: int = 5) -> str:
-        """Retrieve relevant context from knowledge base using similarity search."""
-        # Update knowledge base for this specific session (uses cache if available)
-        await self.update_knowledge_base_for_session(session_id)
-        
-        query_vector = encoder.encode([query])[0].reshape(1, -1).astype('float32')
-        distances, indices = self.index.search(query_vector, k)
-        
-        relevant_docs = [self.knowledge_base[i] for i in indices[0]]
-        context = "\n".join(relevant_docs)
+# FAISS ids: base knowledge uses 0..N, inventory summary and cars are offset
+SUMMARY_ID_OFFSET = 100_000
+CAR_ID_OFFSET = 1_000_000
 
-        return context
 
-    async def get_response(self, query: str, conversation_history: List[Dict] = None, session_id: str = None) -> str:
-        """Generate response using Google Gemini with RAG-enhanced context."""
-        try:
-            # Get relevant context from knowledge base (with session-based caching)
-            context = await self.get_relevant_context(query, session_id)
-            
-            # Prepare conversation history
-            history_text = ""
-            if conversation_history:
-                history_items = []
-                for msg in conversation_history[-3:]:  # Last 3 messages for brevity
-                    speaker = "Customer" if msg['speaker'] == 'user' else "Assistant"
-                    history_items.append(f"{speaker}: {msg['message']}")
-                history_text = "\n".join(history_items)
-            
-            # Create the system prompt
-            system_prompt = """You are a car dealership AI assistant named CarBot. Be helpful, friendly, and concise.
+def format_car_context(car) -> str:
+    """Convert a single car into a context passage."""
+    # Handle MultiSelectField features properly
+    if hasattr(car.features, '__iter__') and not isinstance(car.features, str):
+        # If it's iterable (list-like), join it
+        features_text = ', '.join(car.features) if car.features else 'standard features'
+    elif isinstance(car.features, str):
+        # If it's a string, split it
+        features_list = car.features.split(',') if car.features else []
+        features_text = ', '.join(features_list) if features_list else 'standard features'
+    else:
+        features_text = 'standard features'
+    
+    car_context = f"{car.car_title}: {car.year} {car.model} in {car.color}, priced at ${car.price:,}. "
+    car_context += f"This {car.condition} vehicle has {car.miles:,} miles, {car.engine} engine, {car.transmission} transmission, "
+    car_context += f"{car.doors} doors, seats {car.passengers} passengers, and features {features_text}. "
+    car_context += f"Fuel type: {car.fuel_type}, Located in {car.city}, {car.state}."
+    
+    if car.is_featured:
+        car_context += " This is a FEATURED vehicle with special pricing."
+    
+    return car_context
+
+
+def get_inventory_summary() -> List[str]:
+    """Build the inventory-wide overview passages (lineup, years, price ranges)."""
+    cars = Car.objects.all()
+    if not cars.exists():
+        return []
+    
+    summary = []
+    models_available = set(cars.values_list('model', flat=True))
+    years = cars.aggregate(min_year=models.Min('year'), max_year=models.Max('year'))
+    years_range = f"{years['min_year']}-{years['max_year']}"
+    
+    summary.append("We have a great selection of vehicles available in our showroom.")
+    summary.append(f"Our current lineup includes: {', '.join(sorted(models_available))}.")
+    summary.append(f"Model years range from {years_range}.")
+    
+    # Price ranges - just mention ranges without counts
+    price_ranges = []
+    if cars.filter(price__lt=30000).exists():
+        price_ranges.append("budget-friendly options under $30,000")
+    if cars.filter(price__gte=30000, price__lt=50000).exists():
+        price_ranges.append("mid-range vehicles $30,000-$50,000")
+    if cars.filter(price__gte=50000).exists():
+        price_ranges.append("luxury vehicles over $50,000")
+    
+    if price_ranges:
+        summary.append(f"We offer {', '.join(price_ranges)}.")
+    
+    return summary
+
+
+SYSTEM_PROMPT = """You are a car dealership AI assistant named CarBot. Be helpful, friendly, and concise.
 You have access to information about our dealership's inventory, services, financing options, and more.
 Keep your responses professional but conversational, direct, and to the point - like a helpful dealership employee.
 
@@ -290,70 +221,761 @@ PROFESSIONAL COMMUNICATION:
 - Use phrases like "we offer", "available models include", "you can choose from"
 - Present vehicles as readily available without mentioning quantity limitations"""
 
-            # Format the entire prompt
-            prompt = f"{system_prompt}\n\n"
-            prompt += f"Relevant dealership information:\n{context}\n\n"
+NO_ANSWER_RESPONSE = "I'm sorry, I'm having trouble accessing our information right now. Can I help you with something else?"
+ERROR_RESPONSE = "I'm having trouble with our system right now. Can I take your number and have someone call you back?"
+TIMEOUT_RESPONSE = "Sorry, that's taking me longer than it should. Could you ask me that again?"
+FALLBACK_PASSAGES = 2
+FALLBACK_INTRO = "Here's what I can tell you right away."
+
+# Clean up common formatting issues in model responses
+RESPONSE_PREFIXES = [
+    "Here's a potential response:", 
+    "Assistant:", 
+    "As the assistant, I would respond:", 
+    "I would respond with:"
+]
+
+# Meta-commentary and fabricated dialogue: nothing after these is kept
+DIALOGUE_MARKERS = ["This response:", "Customer:", "User:", "Human:", "Person:"]
+
+SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?])\s+')
+
+
+def get_generation_config() -> dict:
+    """Sampling settings shared by the blocking and streaming calls, in Gemini's GenerationConfig fields."""
+    return {
+        'temperature': 0.7,
+        'top_p': 0.9,
+        'top_k': 40,
+        'max_output_tokens': 150,  # Reduced for faster responses
+        'candidate_count': 1,
+    }
+
+
+def fallback_response(context: List[Tuple[str, float]] = None) -> str:
+    """Templated reply from the top retrieved passages, used when Gemini misses its deadline or is too busy."""
+    metrics.increment('fallback_responses')
+    passages = [passage.strip() for passage, _ in (context or []) if passage.strip()][:FALLBACK_PASSAGES]
+    if not passages:
+        return TIMEOUT_RESPONSE
+    return f"{FALLBACK_INTRO} {' '.join(passages)} Would you like more details on any of that?"
+
+
+def is_canned_response(text: str) -> bool:
+    """True for error and fallback replies, which must not be cached as answers."""
+    return text in (NO_ANSWER_RESPONSE, ERROR_RESPONSE, TIMEOUT_RESPONSE) or text.startswith(FALLBACK_INTRO)
+
+
+def strip_response_prefixes(text: str) -> str:
+    for prefix in RESPONSE_PREFIXES:
+        if text.startswith(prefix):
+            text = text[len(prefix):].lstrip()
+    return text
+
+
+def clean_response(text: str) -> str:
+    """Clean up a complete model reply before it is spoken."""
+    text = strip_response_prefixes(text.strip())
+    
+    # Remove quotes if the entire response is wrapped in them
+    if text.startswith('"') and text.endswith('"'):
+        text = text[1:-1].strip()
+    
+    # Remove meta-commentary and any fabricated customer queries the model hallucinated
+    for marker in DIALOGUE_MARKERS:
+        if marker in text:
+            text = text.split(marker)[0].strip()
+    
+    # Use first-person language
+    return text.replace("the dealership", "our dealership")
+
+
+class ResponseStreamCleaner:
+    """Apply the clean_response() rules incrementally, releasing whole sentences."""
+
+    # Enough leading text to recognise any of RESPONSE_PREFIXES
+    prefix_window = max(len(prefix) for prefix in RESPONSE_PREFIXES)
+
+    def __init__(self):
+        self.buffer = ""
+        self.started = False
+        self.quoted = False
+        self.stopped = False
+
+    def feed(self, chunk: str) -> List[str]:
+        """Add streamed text and return any sentences that are now complete."""
+        if self.stopped:
+            return []
+        self.buffer += chunk
+        
+        # A marker can span chunks, but the unfinished sentence always stays
+        # buffered, so checking the whole buffer catches it
+        for marker in DIALOGUE_MARKERS:
+            if marker in self.buffer:
+                self.buffer = self.buffer.split(marker)[0]
+                self.stopped = True
+        
+        if not self.started:
+            if len(self.buffer.lstrip()) < self.prefix_window and not self.stopped:
+                return []
+            self._start()
+        
+        return self._take_sentences(final=self.stopped)
+
+    def finish(self) -> List[str]:
+        """Flush whatever is left once the stream has ended."""
+        if not self.started:
+            self._start()
+        self.stopped = True
+        return self._take_sentences(final=True)
+
+    def _start(self):
+        self.buffer = strip_response_prefixes(self.buffer.lstrip())
+        if self.buffer.startswith('"'):
+            self.quoted = True
+            self.buffer = self.buffer[1:]
+        self.started = True
+
+    def _take_sentences(self, final: bool) -> List[str]:
+        parts = SENTENCE_BOUNDARY.split(self.buffer)
+        if final:
+            complete, self.buffer = parts, ""
+        else:
+            complete, self.buffer = parts[:-1], parts[-1]
+        
+        sentences = [part.strip() for part in complete if part.strip()]
+        if final and self.quoted and sentences and sentences[-1].endswith('"'):
+            sentences[-1] = sentences[-1][:-1].strip()
+        
+        # Use first-person language
+        return [sentence.replace("the dealership", "our dealership") for sentence in sentences if sentence]
+
+
+class RAGEngine:
+    def __init__(self):
+        # Base knowledge base with dealership information (non-car specific)
+        self.base_knowledge = list(BASE_KNOWLEDGE)
+        
+        # Shared index over base knowledge and inventory. Car signals publish
+        # a new immutable snapshot instead of editing the one being searched.
+        self.snapshot = None
+        self.inventory_loaded = False
+        self.known_models = set()
+        self.write_lock = threading.Lock()
+        # InventoryVersion this worker's index reflects; Car changes in other
+        # workers bump it, and the next turn here rebuilds the index
+        self.inventory_db_version = None
+        self.reload_lock = threading.Lock()
+        
+        # Replies reused for near-identical questions, scoped to inventory_version
+        cache_settings = getattr(settings, 'VOICE_ASSISTANT_RESPONSE_CACHE', {})
+        self.response_cache = None
+        if cache_settings.get('ENABLED', True):
+            self.response_cache = SemanticResponseCache(
+                threshold=cache_settings.get('SIMILARITY_THRESHOLD', 0.92),
+                max_entries=cache_settings.get('MAX_ENTRIES', 500),
+                ttl=cache_settings.get('TTL', 3600),
+                max_bytes=cache_settings.get('MAX_BYTES', 5 * 1024 * 1024),
+            )
+        
+        # Re-sent utterances skip the encoder and the index search
+        query_cache_settings = getattr(settings, 'VOICE_ASSISTANT_QUERY_CACHE', {})
+        self.query_cache = None
+        if query_cache_settings.get('ENABLED', True):
+            self.query_cache = QueryCache(max_entries=query_cache_settings.get('MAX_ENTRIES', 1000))
+        
+        # Retrieval prepared from interim transcripts while the caller is still talking
+        speculation_settings = getattr(settings, 'VOICE_ASSISTANT_SPECULATION', {})
+        self.speculation = None
+        if speculation_settings.get('ENABLED', True):
+            self.speculation = SpeculativeRetrieval(
+                similarity=speculation_settings.get('SIMILARITY', 0.85),
+                ttl=speculation_settings.get('TTL', 30),
+                max_sessions=speculation_settings.get('MAX_SESSIONS', 1000),
+            )
+        self.speculation_min_words = speculation_settings.get('MIN_WORDS', 3)
+        
+        # Policy questions answered from curated templates without the LLM
+        self.faq = FaqFastPath(self.base_knowledge) if get_faq_config()['ENABLED'] else None
+        
+        # Concurrent query encodes share one encoder forward pass
+        batching = getattr(settings, 'VOICE_ASSISTANT_QUERY_BATCHING', {})
+        self.query_batcher = None
+        if batching.get('ENABLED', True):
+            self.query_batcher = QueryEncodeBatcher(
+                lambda texts: get_encoder().encode(texts),
+                max_batch=batching.get('MAX_BATCH', 16),
+                max_wait=batching.get('MAX_WAIT_MS', 5) / 1000,
+            )
+        
+        # Passage embeddings persisted across restarts and shared between workers
+        self.embedding_store = EmbeddingStore(
+            getattr(settings, 'VOICE_ASSISTANT_EMBEDDING_CACHE_DIR', os.path.join(settings.BASE_DIR, '.cache', 'embeddings')),
+            encoder_namespace(EMBEDDING_MODEL_NAME),
+        )
+        
+        # Initialize with base knowledge only (no car data yet)
+        self.initialize_base_index()
+
+    def initialize_base_index(self):
+        """Initialize FAISS index with base knowledge only (no car inventory yet)."""
+        passages = dict(enumerate(self.base_knowledge))
+        self.snapshot = IndexSnapshot(0, self.build_index(passages), passages)
+        self.inventory_loaded = False
+
+    def build_index(self, passages: Dict[int, str]):
+        """Build a fresh index of the configured type (VOICE_ASSISTANT_INDEX) over passages."""
+        ids = np.array(list(passages.keys()), dtype='int64')
+        embeddings = self.embed(list(passages.values()))
+        self.dimension = embeddings.shape[1]
+        return build_index(self.dimension, embeddings, ids)
+
+    @property
+    def inventory_version(self) -> int:
+        return self.snapshot.version
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """Encode passages, reusing vectors already in the on-disk embedding store."""
+        vectors, missing = self.embedding_store.get_many(texts)
+        if missing:
+            new_vectors = get_encoder().encode([texts[i] for i in missing]).astype('float32')
+            self.embedding_store.put_many([texts[i] for i in missing], new_vectors)
+            vectors.update(zip(missing, new_vectors))
+        return np.array([vectors[i] for i in range(len(texts))], dtype='float32')
+
+    def apply_changes(self, upserts: Dict[int, str] = None, removals: List[int] = None):
+        """Publish a new index snapshot with passages upserted and removed."""
+        with self.write_lock:
+            current = self.snapshot
+            # Unchanged passages keep their vectors, only new text is encoded
+            upserts = {i: text for i, text in (upserts or {}).items() if current.passages.get(i) != text}
+            removals = [i for i in (removals or []) if i in current.passages and i not in upserts]
+            if not upserts and not removals:
+                return
             
-            if history_text:
-                prompt += f"Previous conversation:\n{history_text}\n\n"
+            embeddings = self.embed(list(upserts.values())) if upserts else None
+            self.publish(current.with_changes(upserts, embeddings, removals, rebuild=self.build_index))
+
+    def publish(self, snapshot: IndexSnapshot):
+        """Make snapshot the one new requests search."""
+        self.snapshot = snapshot
+        # Replies generated against the old inventory are no longer valid
+        if self.response_cache:
+            self.response_cache.invalidate(snapshot.version)
+
+    def load_inventory(self):
+        """Add every car and the inventory summary to the shared index."""
+        first_load = not self.inventory_loaded
+        if use_embedding_server():
+            # The server already holds the inventory; only ask it to load if it has not
+            if not self.refresh_server_snapshot():
+                get_encoder().reload_inventory()
+                self.refresh_server_snapshot()
+        else:
+            self.index_inventory()
+        if first_load:
+            # Each worker seeds its own response cache once its index is in place
+            self.prewarm_response_cache(getattr(settings, 'VOICE_ASSISTANT_RESPONSE_CACHE', {}).get('PREWARM', 0))
+
+    def index_inventory(self):
+        """Rebuild the shared index from the base knowledge and every car in the database."""
+        db_version = None
+        try:
+            # Read before the cars, so a change committed meanwhile triggers another rebuild
+            db_version = InventoryVersion.current()
+            cars = list(Car.objects.all())
+            inventory = {CAR_ID_OFFSET + car.pk: format_car_context(car) for car in cars}
+            summary = get_inventory_summary()
+            self.known_models = model_terms_for(cars)
+        except Exception as e:
+            print(f"Error fetching car inventory: {str(e)}")
+            inventory = {}
+            summary = ["We have a variety of quality vehicles available. Please visit our showroom or contact us for current inventory."]
+        
+        car_count = len(inventory)
+        passages = dict(enumerate(self.base_knowledge))
+        passages.update(inventory)
+        passages.update(self.summary_passages(summary))
+        
+        # Full rebuild, so IVF-PQ can train once the inventory is large enough
+        with self.write_lock:
+            self.publish(IndexSnapshot(self.snapshot.version + 1, self.build_index(passages), passages))
+        self.inventory_db_version = db_version
+        self.inventory_loaded = True
+        print(f"Indexed {car_count} cars in the shared inventory index (version {self.inventory_version})")
+
+    def reload_inventory(self):
+        """Rebuild the inventory part of the index from the database."""
+        if use_embedding_server():
+            get_encoder().reload_inventory()
+            self.refresh_server_snapshot()
+            return
+        self.load_inventory()
+
+    def refresh_server_snapshot(self) -> bool:
+        """Map the embedding server's latest saved snapshot if it is not the one published."""
+        snapshot_dir = get_server_config()['SNAPSHOT_DIR']
+        version = IndexSnapshot.saved_version(snapshot_dir)
+        if version is None:
+            return False
+        if self.inventory_loaded and version == self.snapshot.version:
+            return True
+        with self.write_lock:
+            snapshot, metadata = IndexSnapshot.load(snapshot_dir)
+            self.known_models = set(metadata.get('known_models', []))
+            self.publish(snapshot)
+        self.inventory_loaded = True
+        return True
+
+    def memory_report(self) -> Dict:
+        """Report how much memory the published index and passages use in this worker."""
+        snapshot = self.snapshot
+        config = get_index_config()
+        index_bytes = index_memory_bytes(snapshot.index)
+        return {
+            'index_type': config['TYPE'],
+            'storage': config['STORAGE'],
+            'vectors': snapshot.index.ntotal,
+            'index_bytes': index_bytes,
+            'bytes_per_vector': index_bytes / max(snapshot.index.ntotal, 1),
+            'passage_bytes': sum(len(text.encode('utf-8')) for text in snapshot.passages.values()),
+            'response_cache_bytes': self.response_cache.stats()['bytes'] if self.response_cache else 0,
+        }
+
+    async def ensure_inventory_loaded(self):
+        """Load the inventory into the shared index on first use."""
+        if not self.inventory_loaded:
+            await sync_to_async(self.load_inventory)()
+
+    async def sync_inventory(self):
+        """Load the inventory, or bring it up to date with changes made elsewhere; once per turn."""
+        if not self.inventory_loaded:
+            await self.ensure_inventory_loaded()
+            return
+        if use_embedding_server():
+            # Map the snapshot the server published for changes made elsewhere
+            await sync_to_async(self.refresh_server_snapshot)()
+            return
+        if await InventoryVersion.acurrent() == self.inventory_db_version:
+            return
+        # One rebuild at a time; concurrent turns answer from the current snapshot meanwhile
+        if self.reload_lock.acquire(blocking=False):
+            try:
+                await sync_to_async(self.index_inventory)()
+            finally:
+                self.reload_lock.release()
+
+    def applied_inventory_change(self, version: int = None):
+        """Note that this worker applied the Car change that bumped InventoryVersion to version.
+
+        If it was the only change since the last sync nothing needs rebuilding;
+        otherwise the version stays behind and the next turn rebuilds.
+        """
+        if version is not None and self.inventory_db_version is not None and version == self.inventory_db_version + 1:
+            self.inventory_db_version = version
+
+    def update_car(self, car, version: int = None):
+        """Re-encode a single saved car and refresh the inventory summary."""
+        if use_embedding_server():
+            get_encoder().update_car(car.pk)
+            self.refresh_server_snapshot()
+            return
+        if not self.inventory_loaded:
+            return
+        self.known_models |= model_terms_for([car])
+        summary = self.summary_passages()
+        upserts = {CAR_ID_OFFSET + car.pk: format_car_context(car), **summary}
+        self.apply_changes(upserts, self.stale_summary_ids(summary))
+        self.applied_inventory_change(version)
+
+    def remove_car(self, car_id, version: int = None):
+        """Drop a deleted car from the index and refresh the inventory summary."""
+        if use_embedding_server():
+            get_encoder().remove_car(car_id)
+            self.refresh_server_snapshot()
+            return
+        if not self.inventory_loaded:
+            return
+        summary = self.summary_passages()
+        self.apply_changes(summary, [CAR_ID_OFFSET + car_id] + self.stale_summary_ids(summary))
+        self.applied_inventory_change(version)
+
+    def summary_passages(self, summary: List[str] = None) -> Dict[int, str]:
+        """Return the inventory summary keyed by its index ids."""
+        if summary is None:
+            summary = get_inventory_summary()
+        return {SUMMARY_ID_OFFSET + i: text for i, text in enumerate(summary)}
+
+    def stale_summary_ids(self, summary: Dict[int, str]) -> List[int]:
+        return [i for i in self.snapshot.passages if SUMMARY_ID_OFFSET <= i < CAR_ID_OFFSET and i not in summary]
+
+    async def encode_query(self, query: str) -> np.ndarray:
+        """Embed a query as a (1, dimension) float32 array."""
+        if self.query_cache:
+            vector = self.query_cache.get_vector(query)
+            if vector is not None:
+                return vector
+        
+        if self.query_batcher:
+            vector = (await self.query_batcher.encode_one(query)).reshape(1, -1)
+        else:
+            # Encoding is CPU-bound, keep it off the event loop
+            encode = sync_to_async(get_encoder().encode, thread_sensitive=False)
+            vector = (await encode([query]))[0].reshape(1, -1).astype('float32')
+        
+        if self.query_cache:
+            self.query_cache.put_vector(query, vector)
+        return vector
+
+    async def get_relevant_context(self, query: str, session_id: str = None, k: int = 5,
+                                   query_vector: np.ndarray = None) -> List[Tuple[str, float]]:
+        """Retrieve relevant context: matching cars from SQL plus similar passages from FAISS.
+
+        Returns (passage, relevance) pairs, most relevant first.
+        """
+        context, _, _ = await self.retrieve_context(query, k, query_vector)
+        return context
+
+    async def retrieve_context(self, query: str, k: int = 5, query_vector: np.ndarray = None, passage_hits=None):
+        """get_relevant_context() that also returns the parsed constraints and the FAISS hits.
+
+        ``passage_hits`` from an earlier search with the same vector are reused
+        instead of searching again when they are long enough.
+        """
+        # Inventory is loaded once and then kept current by Car signals
+        await self.ensure_inventory_loaded()
+        
+        # Questions like "SUVs under $30k after 2020" are answered from the
+        # database so every car is considered, not just the closest passages
+        constraints = parse_inventory_query(query, self.known_models)
+        car_docs = []
+        if constraints:
+            cars = await sync_to_async(search_inventory)(constraints, limit=k)
+            car_docs = [format_car_context(car) for car in cars]
+            if not car_docs:
+                car_docs = [f"No vehicles in our current inventory match: {describe_constraints(constraints)}."]
+        
+        # Read one consistent snapshot; writers publish new ones concurrently
+        snapshot = self.snapshot
+        limit = k + len(car_docs)
+        hits = None
+        if passage_hits is not None and len(passage_hits[0]) >= limit:
+            hits = passage_hits[0][:limit], passage_hits[1][:limit]
+        elif self.query_cache:
+            hits = self.query_cache.get_results(query, snapshot.version, limit)
+        if hits is None:
+            if query_vector is None:
+                query_vector = await self.encode_query(query)
+            hits = snapshot.search(query_vector, limit)
+            if self.query_cache:
+                self.query_cache.put_results(query, snapshot.version, limit, *hits)
+        # Embeddings are normalized, so cosine similarity is 1 - squared L2 / 2
+        scored = [(i, 1 - distance / 2) for i, distance in zip(*hits)]
+        if constraints:
+            # Car passages already came from SQL; keep policy and summary passages
+            scored = [(i, score) for i, score in scored if i < CAR_ID_OFFSET][:max(2, k - len(car_docs))]
+        # Cars matching the customer's own constraints rank above any passage
+        context = [(doc, 1.0) for doc in car_docs] + [(snapshot.passages[i], score) for i, score in scored[:k]]
+
+        return context, constraints, hits
+
+    async def speculate(self, session_id: str, text: str) -> bool:
+        """Run retrieval for an interim transcript and keep it for the session's final message."""
+        if not self.speculation or not session_id or len(text.split()) < self.speculation_min_words:
+            return False
+        if self.speculation.is_prepared(session_id, text):
+            return True
+        await self.ensure_inventory_loaded()
+        version = self.inventory_version
+        query_vector = await self.encode_query(text)
+        context, constraints, hits = await self.retrieve_context(text, query_vector=query_vector)
+        self.speculation.store(session_id, text, query_vector, context, version, constraints, hits)
+        return True
+
+    async def speculative_context(self, query: str, speculative) -> List[Tuple[str, float]]:
+        """Context for the final text from the retrieval prepared for an interim transcript.
+
+        Its embedding and FAISS hits stand in for the final text's, but SQL
+        results only carry over when the final text parses to the same
+        constraints ("under 30" vs "under 30,000", "2018" vs "2019").
+        """
+        if parse_inventory_query(query, self.known_models) == speculative.constraints:
+            return speculative.context
+        context, _, _ = await self.retrieve_context(query, query_vector=speculative.vector, passage_hits=speculative.hits)
+        return context
+
+    def take_speculative(self, query: str, session_id: str = None):
+        """Return retrieval prepared from an interim transcript close enough to query, if any."""
+        if not self.speculation:
+            return None
+        return self.speculation.take(session_id, query, self.inventory_version)
+
+    async def get_cached_response(self, query_vector: np.ndarray):
+        """Return a cached reply for a semantically equivalent earlier query, if any."""
+        if not self.response_cache:
+            return None
+        await self.ensure_inventory_loaded()
+        return self.response_cache.lookup(query_vector, self.inventory_version)
+
+    def cache_response(self, query: str, query_vector: np.ndarray, response: str):
+        if self.response_cache and not is_canned_response(response):
+            self.response_cache.store(query, query_vector, response, self.inventory_version)
+
+    def prewarm_response_cache(self, limit: int = 200) -> int:
+        """Seed the response cache from the opening question and reply of recent calls."""
+        if not self.response_cache or not limit:
+            return 0
+        
+        pairs = {}
+        recent_calls = list(CallSession.objects.order_by('-start_time').values_list('id', flat=True)[:limit])
+        messages = Conversation.objects.filter(session_id__in=recent_calls).order_by('session_id', 'timestamp')
+        question = None
+        asked = set()
+        for session_id, speaker, message in messages.values_list('session_id', 'speaker', 'message'):
+            if speaker == 'user':
+                # Later questions in a call may depend on what was said before
+                question = None if session_id in asked else (session_id, message)
+                asked.add(session_id)
+            elif question and question[0] == session_id and not is_canned_response(message):
+                if self.response_cacheable(question[1]):
+                    pairs[question[1].strip().lower()] = message
+                question = None
+        
+        if not pairs:
+            return 0
+        queries = list(pairs.keys())
+        vectors = get_encoder().encode(queries).astype('float32')
+        for query, vector in zip(queries, vectors):
+            self.cache_response(query, vector, pairs[query])
+        print(f"Seeded the response cache with {len(pairs)} replies")
+        return len(pairs)
+
+    def response_cacheable(self, query: str, conversation_history: List[Dict] = None, summary: List[str] = None) -> bool:
+        """Whether query's reply can be shared with other calls through the response cache.
+
+        Only a call's opening question qualifies: follow-ups such as "how much is
+        it?" depend on the call so far. Inventory questions with constraints are
+        answered from SQL, and near-identical wordings ("under 30k" / "under 40k")
+        differ in exactly the part the embedding barely sees.
+        """
+        if not self.response_cache or summary:
+            return False
+        if any(msg['speaker'] == 'user' and msg['message'] != query for msg in conversation_history or []):
+            return False
+        return not parse_inventory_query(query, self.known_models)
+
+    def build_prompt(self, query: str, context: List[Tuple[str, float]], conversation_history: List[Dict] = None,
+                     summary: List[str] = None) -> str:
+        """Assemble the Gemini prompt from retrieved context, the call summary and recent history."""
+        return prompt_builder.build_prompt(SYSTEM_PROMPT, query, context, conversation_history, summary)
+
+    async def retrieve(self, query: str, session_id: str, deadline: TurnDeadline, timings: TurnTimings,
+                       cacheable: bool = False):
+        """Embed and retrieve for a query within the turn's deadline.
+
+        Returns (query_vector, ready reply or None, context); the ready reply is
+        a cached answer (only looked up when cacheable) or an FAQ template, and
+        needs no LLM call.
+        """
+        speculative = self.take_speculative(query, session_id)
+        if speculative:
+            query_vector = speculative.vector
+        else:
+            query_vector = await deadline.run('encode', self.encode_query(query), timings)
+        if cacheable:
+            with timings.stage('cache'):
+                cached = await self.get_cached_response(query_vector)
+            if cached:
+                return query_vector, cached, None
+        
+        # Get relevant context from the shared knowledge base
+        if speculative:
+            context = await deadline.run('search', self.speculative_context(query, speculative), timings)
+        else:
+            context = await deadline.run('search', self.get_relevant_context(query, session_id, query_vector=query_vector), timings)
+        
+        if self.faq:
+            with timings.stage('faq'):
+                answer = self.faq.answer(query, context, self.known_models)
+            if answer:
+                return query_vector, answer, context
+        return query_vector, None, context
+
+    async def get_response(self, query: str, conversation_history: List[Dict] = None, session_id: str = None,
+                           timings: TurnTimings = None, summary: List[str] = None) -> str:
+        """Generate response using Google Gemini with RAG-enhanced context."""
+        owns_timings = timings is None
+        timings = timings or TurnTimings()
+        deadline = TurnDeadline()
+        context = None
+        try:
+            # The one inventory check of the turn
+            await self.sync_inventory()
+            cacheable = self.response_cacheable(query, conversation_history, summary)
+            query_vector, ready, context = await self.retrieve(query, session_id, deadline, timings, cacheable)
+            if ready:
+                return ready
             
-            prompt += f"Customer: {query}\n\nAssistant:"
+            with timings.stage('prompt'):
+                prompt = self.build_prompt(query, context, conversation_history, summary)
 
-            # Generate response using Gemini
-            response = model.generate_content(
+            # Generate response using Gemini without blocking the event loop
+            response = await deadline.run('llm', generation_gateway.generate(
+                get_model(),
                 prompt,
-                generation_config=genai.types.GenerationConfig(
-                    temperature=0.7,
-                    top_p=0.9,
-                    top_k=40,
-                    max_output_tokens=150,  # Reduced for faster responses
-                    candidate_count=1
-                )
-            )
+                generation_config=get_generation_config()
+            ), timings)
 
             if response.text:
-                text = response.text.strip()
-                
-                # Clean up common formatting issues in model responses
-                prefixes_to_remove = [
-                    "Here's a potential response:", 
-                    "Assistant:", 
-                    "As the assistant, I would respond:", 
-                    "I would respond with:"
-                ]
-                
-                for prefix in prefixes_to_remove:
-                    if text.startswith(prefix):
-                        text = text[len(prefix):].strip()
-                
-                # Remove quotes if the entire response is wrapped in them
-                if text.startswith('"') and text.endswith('"'):
-                    text = text[1:-1].strip()
-                    
-                # Remove meta-commentary or explanations about the response
-                if "This response:" in text:
-                    text = text.split("This response:")[0].strip()
-                
-                # Remove any fabricated customer queries that the model might have hallucinated
-                if "Customer:" in text:
-                    text = text.split("Customer:")[0].strip()
-                
-                # Also check for common dialogue indicators
-                dialogue_markers = ["Customer:", "User:", "Human:", "Person:"]
-                for marker in dialogue_markers:
-                    if marker in text:
-                        text = text.split(marker)[0].strip()
-                
-                # Use first-person language
-                text = text.replace("the dealership", "our dealership")
-                
+                text = clean_response(response.text)
+                if cacheable:
+                    self.cache_response(query, query_vector, text)
                 return text
             else:
-                return "I'm sorry, I'm having trouble accessing our information right now. Can I help you with something else?"
+                return NO_ANSWER_RESPONSE
 
+        except (StageTimeout, GatewayBusy):
+            return fallback_response(context)
         except Exception as e:
             print(f"Error generating response: {str(e)}")
-            return "I'm having trouble with our system right now. Can I take your number and have someone call you back?"
+            return ERROR_RESPONSE
+        finally:
+            if owns_timings:
+                timings.finish()
+
+    async def stream_response(self, query: str, conversation_history: List[Dict] = None, session_id: str = None,
+                              timings: TurnTimings = None, summary: List[str] = None):
+        """Yield the cleaned Gemini reply sentence by sentence as it is generated."""
+        owns_timings = timings is None
+        timings = timings or TurnTimings()
+        deadline = TurnDeadline()
+        context = None
+        cleaner = ResponseStreamCleaner()
+        emitted = False
+        try:
+            # The one inventory check of the turn
+            await self.sync_inventory()
+            cacheable = self.response_cacheable(query, conversation_history, summary)
+            query_vector, ready, context = await self.retrieve(query, session_id, deadline, timings, cacheable)
+            if ready:
+                for sentence in SENTENCE_BOUNDARY.split(ready):
+                    emitted = True
+                    yield sentence
+                return
+            
+            with timings.stage('prompt'):
+                prompt = self.build_prompt(query, context, conversation_history, summary)
+
+            response = await deadline.run('llm', generation_gateway.generate(
+                get_model(),
+                prompt,
+                generation_config=get_generation_config(),
+                stream=True
+            ), timings)
+            chunks = response.__aiter__()
+            sentences = []
+            try:
+                while True:
+                    try:
+                        # The whole generation shares the LLM budget
+                        chunk = await deadline.run('llm', chunks.__anext__(), timings)
+                    except StopAsyncIteration:
+                        break
+                    for sentence in cleaner.feed(chunk.text):
+                        emitted = True
+                        sentences.append(sentence)
+                        yield sentence
+                    if cleaner.stopped:
+                        break
+            finally:
+                # Frees the gateway slot now rather than when the stream is collected
+                if hasattr(chunks, 'aclose'):
+                    await chunks.aclose()
+
+            for sentence in cleaner.finish():
+                emitted = True
+                sentences.append(sentence)
+                yield sentence
+            
+            if sentences and cacheable:
+                self.cache_response(query, query_vector, " ".join(sentences))
+
+            if not emitted:
+                yield NO_ANSWER_RESPONSE
+
+        except (StageTimeout, GatewayBusy):
+            # Cut off mid-reply: the sentences already spoken stand on their own
+            if not emitted:
+                for sentence in SENTENCE_BOUNDARY.split(fallback_response(context)):
+                    yield sentence
+        except Exception as e:
+            print(f"Error streaming response: {str(e)}")
+            if not emitted:
+                yield ERROR_RESPONSE
+        finally:
+            if owns_timings:
+                timings.finish()
+
+def get_rag_engine() -> RAGEngine:
+    """Return the process-wide RAG engine, creating it on first use."""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = RAGEngine()
+    return _engine
+
+
+async def aget_rag_engine() -> RAGEngine:
+    """Async variant of get_rag_engine() that loads the engine off the event loop."""
+    if _engine is not None:
+        return _engine
+    return await sync_to_async(get_rag_engine, thread_sensitive=False)()
+
+
+def get_loaded_rag_engine():
+    """Return the RAG engine only if it has already been created."""
+    return _engine
+
+
+def warm_up():
+    """Load the encoder, the generation backend and the inventory index ahead of the first call."""
+    global _warmed_up
+    get_model()
+    engine = get_rag_engine()
+    if not engine.inventory_loaded:
+        engine.load_inventory()
+    _warmed_up = True
+    return engine
+
+
+def warm_up_in_background() -> Optional[RAGEngine]:
+    """Return the engine once warm_up() has finished, else start it in a thread and return None.
+
+    Raises the error of a failed warm-up once; the next call starts it again.
+    """
+    global _warm_up_thread, _warm_up_error
+    with _warm_up_lock:
+        if _warmed_up:
+            return _engine
+        if _warm_up_thread is not None and _warm_up_thread.is_alive():
+            return None
+        if _warm_up_error is not None:
+            error, _warm_up_error = _warm_up_error, None
+            raise error
+        _warm_up_thread = threading.Thread(target=_run_warm_up, name='voice-assistant-warm-up', daemon=True)
+        _warm_up_thread.start()
+        return None
+
 
-# Initialize RAG engine as a singleton
-rag_engine = RAGEngine() 
\ No newline at end of file
+def _run_warm_up():
+    global _warm_up_error
+    started = time.perf_counter()
+    try:
+        warm_up()
+        print(f"Voice assistant warmed up in {time.perf_counter() - started:.2f}s")
+    except Exception as e:
+        print(f"Error warming up the voice assistant: {str(e)}")
+        _warm_up_error = e
+    finally:
+        close_old_connections()
@@ -0,0 +1,99 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+import numpy as np
+
+# Rough per-entry bookkeeping cost on top of the vector and strings
+ENTRY_OVERHEAD_BYTES = 200
+
+
+class CacheEntry:
+    def __init__(self, query: str, vector: np.ndarray, response: str, inventory_version: int):
+        self.query = query
+        self.vector = vector
+        self.response = response
+        self.inventory_version = inventory_version
+        self.created = time.monotonic()
+        self.size = vector.nbytes + len(query.encode('utf-8')) + len(response.encode('utf-8')) + ENTRY_OVERHEAD_BYTES
+
+
+class SemanticResponseCache:
+    """Reuse assistant replies for queries whose embeddings are close enough.
+
+    Entries are scoped to the inventory version they were generated against
+    and evicted least-recently-used first when they exceed ``max_entries`` or
+    ``max_bytes``; entries older than ``ttl`` seconds are never served.
+    """
+
+    def __init__(self, threshold=0.92, max_entries=500, ttl=3600, max_bytes=5 * 1024 * 1024):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self._next_key = 0
+
+    @staticmethod
+    def _normalize(vector: np.ndarray) -> np.ndarray:
+        vector = np.asarray(vector, dtype='float32').reshape(-1)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, vector: np.ndarray, inventory_version: int) -> Optional[str]:
+        """Return the cached reply for the most similar query, if it is similar enough."""
+        vector = self._normalize(vector)
+        now = time.monotonic()
+        with self.lock:
+            best_key, best_score = None, self.threshold
+            for key, entry in list(self.entries.items()):
+                if entry.inventory_version != inventory_version or now - entry.created > self.ttl:
+                    self._remove(key)
+                    continue
+                score = float(np.dot(entry.vector, vector))
+                if score >= best_score:
+                    best_key, best_score = key, score
+
+            if best_key is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(best_key)
+            self.hits += 1
+            return self.entries[best_key].response
+
+    def store(self, query: str, vector: np.ndarray, response: str, inventory_version: int):
+        entry = CacheEntry(query, self._normalize(vector), response, inventory_version)
+        if entry.size > self.max_bytes:
+            return
+        with self.lock:
+            key = self._next_key
+            self._next_key += 1
+            self.entries[key] = entry
+            self.total_bytes += entry.size
+            while len(self.entries) > self.max_entries or self.total_bytes > self.max_bytes:
+                self._remove(next(iter(self.entries)))
+
+    def invalidate(self, inventory_version: int = None):
+        """Drop entries not generated against inventory_version (all entries if None)."""
+        with self.lock:
+            for key, entry in list(self.entries.items()):
+                if inventory_version is None or entry.inventory_version != inventory_version:
+                    self._remove(key)
+
+    def _remove(self, key):
+        entry = self.entries.pop(key)
+        self.total_bytes -= entry.size
+
+    def stats(self):
+        with self.lock:
+            return {
+                'entries': len(self.entries),
+                'bytes': self.total_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
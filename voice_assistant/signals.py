@@ -0,0 +1,51 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from cars.models import Car
+from .embedding_server import use_embedding_server
+from .models import InventoryVersion
+from .rag_engine import get_encoder, get_loaded_rag_engine
+
+
+@receiver(post_save, sender=Car)
+def index_saved_car(sender, instance, **kwargs):
+    """Re-encode only the saved car's passage once the transaction commits."""
+    def update():
+        try:
+            # Other workers see the new version and rebuild their own index
+            version = InventoryVersion.bump()
+            # Nothing to update until the engine has been loaded in this process,
+            # unless the index lives in the embedding server
+            rag_engine = get_loaded_rag_engine()
+            if rag_engine is None and not use_embedding_server():
+                return
+            if rag_engine is None:
+                get_encoder().update_car(instance.pk)
+            else:
+                rag_engine.update_car(instance, version)
+        except Exception as e:
+            print(f"Error updating inventory index for car {instance.pk}: {str(e)}")
+
+    transaction.on_commit(update)
+
+
+@receiver(post_delete, sender=Car)
+def unindex_deleted_car(sender, instance, **kwargs):
+    """Remove a deleted car's passage from the shared inventory index."""
+    car_id = instance.pk
+
+    def remove():
+        try:
+            version = InventoryVersion.bump()
+            rag_engine = get_loaded_rag_engine()
+            if rag_engine is None and not use_embedding_server():
+                return
+            if rag_engine is None:
+                get_encoder().remove_car(car_id)
+            else:
+                rag_engine.remove_car(car_id, version)
+        except Exception as e:
+            print(f"Error removing car {car_id} from inventory index: {str(e)}")
+
+    transaction.on_commit(remove)
@@ -0,0 +1,89 @@
+import threading
+import time
+from collections import OrderedDict
+from difflib import SequenceMatcher
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .query_cache import normalize_query
+
+
+def transcript_similarity(a: str, b: str) -> float:
+    """Word-level similarity of two transcripts, ignoring case, punctuation and fillers."""
+    a_words, b_words = normalize_query(a).split(), normalize_query(b).split()
+    if not a_words or not b_words:
+        return 0.0
+    return SequenceMatcher(None, a_words, b_words, autojunk=False).ratio()
+
+
+class SpeculativeResult:
+    __slots__ = ('text', 'vector', 'context', 'inventory_version', 'constraints', 'hits', 'created')
+
+    def __init__(self, text: str, vector: np.ndarray, context: List[Tuple[str, float]], inventory_version: int,
+                 constraints: Dict = None, hits: Tuple[List[int], List[float]] = None):
+        self.text = text
+        self.vector = vector
+        self.context = context
+        self.inventory_version = inventory_version
+        # The interim text's inventory constraints and FAISS (ids, distances)
+        self.constraints = constraints or {}
+        self.hits = hits
+        self.created = time.monotonic()
+
+
+class SpeculativeRetrieval:
+    """Retrieval prepared from a call's interim transcript, kept for its final message.
+
+    Only the latest interim result per session is kept. The final message
+    reuses it if the texts are at least ``similarity`` alike, the inventory
+    has not changed and it is younger than ``ttl`` seconds; the engine redoes
+    the SQL part when the final text's constraints differ.
+    """
+
+    def __init__(self, similarity=0.85, ttl=30, max_sessions=1000):
+        self.similarity = similarity
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.results = OrderedDict()
+        self.lock = threading.Lock()
+        self.prepared = 0
+        self.hits = 0
+        self.misses = 0
+
+    def is_prepared(self, session_id: str, text: str) -> bool:
+        with self.lock:
+            result = self.results.get(session_id)
+            return result is not None and normalize_query(result.text) == normalize_query(text)
+
+    def store(self, session_id: str, text: str, vector: np.ndarray, context: List[Tuple[str, float]], inventory_version: int,
+              constraints: Dict = None, hits: Tuple[List[int], List[float]] = None):
+        with self.lock:
+            self.results[session_id] = SpeculativeResult(text, vector, context, inventory_version, constraints, hits)
+            self.results.move_to_end(session_id)
+            self.prepared += 1
+            while len(self.results) > self.max_sessions:
+                self.results.popitem(last=False)
+
+    def take(self, session_id: str, text: str, inventory_version: int) -> Optional[SpeculativeResult]:
+        """Return (and forget) the session's prepared retrieval if it fits the final text."""
+        if not session_id:
+            return None
+        with self.lock:
+            result = self.results.pop(session_id, None)
+            if (result is None or result.inventory_version != inventory_version
+                    or time.monotonic() - result.created > self.ttl
+                    or transcript_similarity(result.text, text) < self.similarity):
+                self.misses += 1
+                return None
+            self.hits += 1
+            return result
+
+    def stats(self):
+        with self.lock:
+            return {
+                'sessions': len(self.results),
+                'prepared': self.prepared,
+                'hits': self.hits,
+                'misses': self.misses,
+            }
@@ -0,0 +1,62 @@
+import asyncio
+import time
+import zlib
+
+from .prompt_builder import CONTEXT_HEADING
+
+
+class StubResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class StubStream:
+    """Async iterable of reply chunks, like a streamed Gemini response."""
+
+    def __init__(self, text: str, chunk_size: int, chunk_delay: float):
+        self.chunks = [text[i:i + chunk_size] for i in range(0, len(text), chunk_size)]
+        self.chunk_delay = chunk_delay
+
+    async def __aiter__(self):
+        for chunk in self.chunks:
+            await asyncio.sleep(self.chunk_delay)
+            yield StubResponse(chunk)
+
+
+class StubGenerativeModel:
+    """Deterministic local stand-in for genai.GenerativeModel, for benchmarks.
+
+    The reply quotes the first passage of the prompt's retrieved context, and
+    the latency is ``latency`` plus up to ``jitter`` seconds derived from the
+    prompt, so replaying the same calls gives the same replies and delays.
+    """
+
+    def __init__(self, latency=0.8, jitter=0.0, chunk_size=24, chunk_delay=0.02):
+        self.latency = latency
+        self.jitter = jitter
+        self.chunk_size = chunk_size
+        self.chunk_delay = chunk_delay
+        self.calls = 0
+
+    def reply(self, prompt: str) -> str:
+        passage = ''
+        if CONTEXT_HEADING in prompt:
+            passage = prompt.split(CONTEXT_HEADING + "\n", 1)[1].split("\n", 1)[0].strip()
+        return f"Thanks for asking. {passage or 'Let me check that for you.'} Is there anything else I can help with?"
+
+    def delay(self, prompt: str) -> float:
+        if not self.jitter:
+            return self.latency
+        return self.latency + self.jitter * (zlib.crc32(prompt.encode('utf-8')) % 1000) / 1000
+
+    def generate_content(self, prompt: str, stream=False, **kwargs):
+        self.calls += 1
+        time.sleep(self.delay(prompt))
+        return StubResponse(self.reply(prompt))
+
+    async def generate_content_async(self, prompt: str, stream=False, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(self.delay(prompt))
+        if stream:
+            return StubStream(self.reply(prompt), self.chunk_size, self.chunk_delay)
+        return StubResponse(self.reply(prompt))
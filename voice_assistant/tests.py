@@ -1,3 +1,647 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import re
+import tempfile
+import threading
+from unittest import mock
 
-# Create your tests here.
+import faiss
+import numpy as np
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from . import conversation_writer, rag_engine
+from .call_state import call_states, message_entry
+from .calls import STILL_ANSWERING, end_call, stream_reply
+from .conversation_writer import ConversationWriter
+from .faq import FAQ_ANSWERS
+from .generation_gateway import GatewayBusy, GenerationGateway
+from .index_factory import build_index, get_index_config, min_training_size, trained_on
+from .index_snapshot import IndexSnapshot
+from .inventory_search import model_terms_for, parse_inventory_query, search_inventory
+from .models import CallSession, Conversation, InventoryVersion
+from .query_cache import normalize_query
+from .rag_engine import BASE_KNOWLEDGE, ResponseStreamCleaner, clean_response
+from .turns import Superseded, TurnTracker, adds_nothing, record_user_message, turns
+from .websocket import voice_socket
+from cars.models import Car
+
+
+def make_car(**fields):
+    values = {
+        'car_title': 'Toyota Corolla', 'state': 'AL', 'city': 'Lahore', 'color': 'White', 'model': 'Corolla',
+        'year': 2020, 'condition': 'New', 'price': 20000, 'description': '', 'car_photo': 'x.jpg',
+        'features': ['Airbags'], 'body_style': 'Sedan', 'engine': '1.8', 'transmission': 'Auto',
+        'interior': 'Black', 'miles': 0, 'doors': '4', 'passengers': 5, 'vin_no': 'X', 'milage': 15,
+        'fuel_type': 'Petrol', 'no_of_owners': '1',
+    }
+    values.update(fields)
+    return Car.objects.create(**values)
+
+
+def numbers(text):
+    return set(re.findall(r'\d+(?:[.,]\d+)*', text))
+
+
+class ParseInventoryQueryTests(SimpleTestCase):
+    def test_price_limits(self):
+        self.assertEqual(parse_inventory_query('anything under 30k?'), {'max_price': 30000})
+        self.assertEqual(parse_inventory_query('cars over $15,000'), {'min_price': 15000})
+        self.assertEqual(parse_inventory_query('up to 25 thousand dollars'), {'max_price': 25000})
+
+    def test_price_range_carries_unit_to_both_ends(self):
+        self.assertEqual(parse_inventory_query('between 20 and 30 thousand'),
+                         {'min_price': 20000, 'max_price': 30000})
+        self.assertEqual(parse_inventory_query('something $20-30k'), {'min_price': 20000, 'max_price': 30000})
+        self.assertEqual(parse_inventory_query('between $18,000 and $22,500'),
+                         {'min_price': 18000, 'max_price': 22500})
+
+    def test_numbers_with_other_units_are_not_prices(self):
+        for text in ('cars under 50,000 miles', 'anything over 200 horsepower', 'under 50k miles',
+                     'over 30 mpg', 'between 10 and 20 km away', 'is the shuttle within 10 miles?',
+                     'less than 5 years old', 'under 3% apr'):
+            with self.subTest(text=text):
+                constraints = parse_inventory_query(text)
+                self.assertNotIn('max_price', constraints)
+                self.assertNotIn('min_price', constraints)
+
+    def test_years(self):
+        self.assertEqual(parse_inventory_query('newer than 2018'), {'min_year': 2019})
+        self.assertEqual(parse_inventory_query('a 2020 model'), {'min_year': 2020, 'max_year': 2020})
+
+    def test_year_ranges_are_not_prices(self):
+        for text in ('any cars between 2018 and 2020', 'something from 2018 to 2020', 'from 2020 to 2018'):
+            with self.subTest(text=text):
+                self.assertEqual(parse_inventory_query(text), {'min_year': 2018, 'max_year': 2020})
+        self.assertEqual(parse_inventory_query('anything under 2020'), {'min_year': 2020, 'max_year': 2020})
+
+    def test_year_like_amounts_marked_as_money_are_prices(self):
+        self.assertEqual(parse_inventory_query('under $2020'), {'max_price': 2020})
+        self.assertEqual(parse_inventory_query('under 2000 dollars'), {'max_price': 2000})
+
+    def test_policy_questions_are_not_filters(self):
+        for text in ('what gas mileage can i expect?', "i'll stick with a test drive first",
+                     'are your technicians certified?', 'what are your hours?'):
+            with self.subTest(text=text):
+                self.assertEqual(parse_inventory_query(text), {})
+
+    def test_vehicle_attributes(self):
+        constraints = parse_inventory_query('a used gas car with a stick shift and heated seats')
+        self.assertEqual(constraints['condition'], ['Used'])
+        self.assertEqual(constraints['fuel_type'], ['Gasoline'])
+        self.assertEqual(constraints['transmission'], ['Manual'])
+        self.assertEqual(constraints['features'], ['Seat Heating'])
+
+    def test_model_terms_come_from_inventory(self):
+        constraints = parse_inventory_query('do you have a honda civic?', known_models=['Honda Civic', 'Toyota Camry'])
+        self.assertEqual(constraints, {'model_terms': ['civic', 'honda']})
+
+
+class ModelTermTests(TestCase):
+    def test_terms_come_from_model_names_and_known_makes(self):
+        cars = [Car(car_title='Toyota Vitz for sale - one owner', model='Vitz F'),
+                Car(car_title='Suzuki Alto', model='VXR'), Car(car_title='Toyota', model='2020')]
+        self.assertEqual(model_terms_for(cars), {'toyota', 'vitz', 'suzuki', 'vxr'})
+
+    def test_title_words_do_not_turn_questions_into_inventory_queries(self):
+        terms = model_terms_for([Car(car_title='Honda Civic for sale - one owner', model='Civic')])
+        self.assertEqual(parse_inventory_query('is this one still for sale?', terms), {})
+        self.assertEqual(parse_inventory_query('any honda civic?', terms), {'model_terms': ['civic', 'honda']})
+
+    def test_model_terms_match_whole_words(self):
+        ford = make_car(car_title='Ford Focus', model='Focus')
+        corolla = make_car(car_title='Toyota Corolla for sale', model='Corolla')
+        self.assertEqual(search_inventory({'model_terms': ['for']}), [])
+        self.assertEqual(search_inventory({'model_terms': ['ford']}), [ford])
+        self.assertEqual(search_inventory({'model_terms': ['corolla']}), [corolla])
+
+
+class SearchInventoryTests(TestCase):
+    def test_free_text_columns_match_any_known_spelling_in_any_case(self):
+        petrol = make_car(fuel_type='PETROL', transmission='a/t', condition='new')
+        make_car(fuel_type='Diesel', transmission='Auto')
+        make_car(fuel_type='gas', transmission='Manual')
+        constraints = {'fuel_type': ['Gasoline'], 'transmission': ['Automatic'], 'condition': ['New']}
+        self.assertEqual(search_inventory(constraints), [petrol])
+
+
+class InventoryVersionTests(TestCase):
+    def test_car_changes_bump_the_version_once_committed(self):
+        self.assertEqual(InventoryVersion.current(), 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            car = make_car()
+        self.assertEqual(InventoryVersion.current(), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            car.delete()
+        self.assertEqual(InventoryVersion.current(), 2)
+
+
+def vectors(count, dimension=8, seed=0):
+    return np.random.RandomState(seed).rand(count, dimension).astype('float32')
+
+
+class IndexSnapshotTests(SimpleTestCase):
+    def snapshot(self, factory='IDMap2,Flat'):
+        index = faiss.index_factory(8, factory)
+        index.train(vectors(20))
+        index.add_with_ids(vectors(20), np.arange(20, dtype='int64'))
+        return IndexSnapshot(1, index, {i: f'passage {i}' for i in range(20)})
+
+    def test_with_changes_leaves_the_published_snapshot_alone(self):
+        snapshot = self.snapshot()
+        new = snapshot.with_changes({3: 'edited', 50: 'added'}, vectors(2, seed=1), [4])
+        self.assertEqual((new.version, new.index.ntotal), (2, 20))
+        self.assertEqual((new.passages[3], new.passages[50]), ('edited', 'added'))
+        self.assertNotIn(4, new.passages)
+        self.assertEqual((snapshot.index.ntotal, snapshot.passages[3]), (20, 'passage 3'))
+        self.assertEqual(new.search(vectors(2, seed=1)[1:], 1)[0], [50])
+
+    def test_int8_index_is_rebuilt_rather_than_clipping_new_vectors(self):
+        rebuilt = []
+
+        def rebuild(passages):
+            rebuilt.append(len(passages))
+            return build_index(8, vectors(len(passages)), np.array(list(passages)), config)
+
+        config = get_index_config(TYPE='flat', STORAGE='int8', SQ_RANGE_HEADROOM=0.2)
+        snapshot = IndexSnapshot(1, build_index(8, vectors(20), np.arange(20), config), {i: str(i) for i in range(20)})
+        snapshot = snapshot.with_changes({50: 'within headroom'}, vectors(1, seed=1) * 1.1, [], rebuild)
+        self.assertEqual(rebuilt, [])
+        snapshot.with_changes({51: 'far outside'}, vectors(1, seed=2) * 5, [], rebuild)
+        self.assertEqual(rebuilt, [22])
+
+    def test_with_changes_on_a_memory_mapped_snapshot(self):
+        for factory in ('IDMap2,Flat', 'IDMap2,SQ8'):
+            with self.subTest(factory=factory), tempfile.TemporaryDirectory() as directory:
+                self.snapshot(factory).save(directory)
+                loaded, _ = IndexSnapshot.load(directory)
+                # Between two trained vectors, so within the SQ8 ranges
+                added = (vectors(20)[:1] + vectors(20)[1:2]) / 2
+                new = loaded.with_changes({50: 'added'}, added, [4])
+                self.assertEqual(new.index.ntotal, 20)
+                self.assertEqual(new.search(added, 1)[0], [50])
+
+
+class IvfPqTrainingTests(SimpleTestCase):
+    def config(self, directory):
+        return get_index_config(TYPE='ivfpq', IVF_NLIST=4, PQ_M=2, PQ_NBITS=4,
+                                TRAINED_INDEX_PATH=os.path.join(directory, 'ivfpq.faiss'))
+
+    def build(self, config, count):
+        return build_index(8, vectors(count), np.arange(count), config)
+
+    def test_needs_39_training_vectors_per_centroid(self):
+        with tempfile.TemporaryDirectory() as directory:
+            config = self.config(directory)
+            self.assertEqual(min_training_size(config), 39 * 16)
+            self.assertNotIsInstance(self.build(config, 39 * 16 - 1), faiss.IndexIVFPQ)
+            self.assertIsInstance(self.build(config, 39 * 16), faiss.IndexIVFPQ)
+
+    def test_retrains_once_the_inventory_has_grown(self):
+        with tempfile.TemporaryDirectory() as directory:
+            config = self.config(directory)
+            self.build(config, 700)
+            self.assertEqual(trained_on(config['TRAINED_INDEX_PATH']), 700)
+            self.build(config, 1300)
+            self.assertEqual(trained_on(config['TRAINED_INDEX_PATH']), 700)
+            self.build(config, 1400)
+            self.assertEqual(trained_on(config['TRAINED_INDEX_PATH']), 1400)
+
+
+class FaqTemplateTests(SimpleTestCase):
+    def test_every_template_restates_a_base_knowledge_passage(self):
+        missing = [passage for passage in FAQ_ANSWERS if passage not in BASE_KNOWLEDGE]
+        self.assertEqual(missing, [], 'FAQ_ANSWERS keys must match BASE_KNOWLEDGE passages exactly')
+
+    def test_templates_state_no_numbers_their_passage_lacks(self):
+        for passage, answer in FAQ_ANSWERS.items():
+            with self.subTest(passage=passage):
+                self.assertLessEqual(numbers(answer), numbers(passage))
+
+
+class NormalizeQueryTests(SimpleTestCase):
+    def test_strips_case_punctuation_and_hesitations(self):
+        self.assertEqual(normalize_query('Um, what are your hours?'), 'what are your hours')
+        self.assertEqual(normalize_query('so uh do you finance'), 'do you finance')
+        self.assertEqual(normalize_query('Is it under $25.5k... hmm'), 'is it under $25.5k')
+
+    def test_keeps_words_that_change_the_meaning(self):
+        self.assertEqual(normalize_query('is that okay'), 'is that okay')
+        self.assertEqual(normalize_query('right, the blue one'), 'right the blue one')
+        self.assertEqual(normalize_query('please hold the civic'), 'please hold the civic')
+        self.assertNotEqual(normalize_query('the price is right'), normalize_query('the price is'))
+
+    def test_resent_acknowledgements_add_nothing(self):
+        self.assertTrue(adds_nothing('okay'))
+        self.assertTrue(adds_nothing('um yeah, thanks'))
+        self.assertFalse(adds_nothing('okay and the trade-in?'))
+
+
+class FakeEngine:
+    """Streams canned sentences, pausing after each so a test can act mid-reply."""
+
+    def __init__(self, sentences, pause=0.05, delay=0):
+        self.sentences = sentences
+        self.pause = pause
+        self.delay = delay
+
+    async def stream_response(self, query, conversation_history=None, session_id=None, timings=None, summary=None):
+        await asyncio.sleep(self.delay)
+        for sentence in self.sentences:
+            yield sentence
+            await asyncio.sleep(self.pause)
+
+
+async def saved_messages(state):
+    return [msg async for msg in Conversation.objects.filter(session=state.session)
+            .order_by('timestamp').values_list('speaker', 'message')]
+
+
+@override_settings(VOICE_ASSISTANT_TURNS={'DEBOUNCE_MS': 0, 'MERGE_WINDOW_SECONDS': 20},
+                   VOICE_ASSISTANT_CONVERSATION_WRITES={'ENABLED': False})
+class StreamReplyTests(TestCase):
+    async def test_full_reply_is_streamed_and_saved(self):
+        state = await call_states.create('test-stream-full')
+        engine = FakeEngine(['One.', 'Two.'], pause=0)
+        events = [event async for event in stream_reply(engine, state, 'new', 'hello', [])]
+        self.assertEqual([event['type'] for event in events], ['chunk', 'chunk', 'done'])
+        self.assertEqual(await saved_messages(state), [('assistant', 'One. Two.')])
+
+    async def test_superseded_mid_stream_keeps_what_was_said(self):
+        state = await call_states.create('test-stream-superseded')
+        engine = FakeEngine(['First sentence.', 'Second sentence.', 'Third sentence.'])
+        events = []
+        async for event in stream_reply(engine, state, 'new', 'hello', []):
+            events.append(event)
+            if len(events) == 1:
+                # A newer message in the same call arrives while the reply is being spoken
+                newer = turns.start(state.session_id)
+        turns.finish(state.session_id, newer)
+        self.assertEqual([event['type'] for event in events], ['chunk', 'done'])
+        self.assertEqual(events[-1]['response'], 'First sentence.')
+        self.assertEqual(await saved_messages(state), [('assistant', 'First sentence.')])
+
+    async def test_resent_transcript_gets_the_earlier_reply_or_a_fallback(self):
+        state = await call_states.create('test-stream-repeat')
+        events = [event async for event in stream_reply(FakeEngine([]), state, 'repeat', None, [])]
+        self.assertEqual(events, [{'type': 'duplicate', 'response': STILL_ANSWERING, 'pending': True}])
+        events = [event async for event in stream_reply(FakeEngine([]), state, 'repeat', 'We open at 9.', [])]
+        self.assertEqual(events, [{'type': 'duplicate', 'response': 'We open at 9.', 'pending': False}])
+
+    async def test_superseded_before_speaking(self):
+        state = await call_states.create('test-stream-silent')
+        engine = FakeEngine(['Never said.'], delay=0.1)
+        replies = stream_reply(engine, state, 'new', 'hello', [])
+        first = asyncio.ensure_future(replies.__anext__())
+        await asyncio.sleep(0.01)
+        newer = turns.start(state.session_id)
+        events = [await first] + [event async for event in replies]
+        turns.finish(state.session_id, newer)
+        self.assertEqual(events, [{'type': 'superseded'}])
+        self.assertEqual(await saved_messages(state), [])
+
+
+class ConversationWriteTests(TestCase):
+    def setUp(self):
+        # Only flushes that are asked for, never the background timer
+        self.writer = conversation_writer._writer = ConversationWriter(max_batch=50, max_delay=3600)
+
+    def tearDown(self):
+        conversation_writer._writer = None
+
+    async def test_replies_are_buffered_until_the_call_ends(self):
+        state = await call_states.create('test-writes')
+        await call_states.add_message(state, 'user', 'do you finance')
+        await call_states.update_message(state, state.messages[0], 'do you finance used cars')
+        await call_states.add_message(state, 'assistant', 'We do.')
+        self.assertEqual(self.writer.stats()['pending'], 2)
+        self.assertEqual(await saved_messages(state), [])
+
+        # A row another worker has not saved yet is only in the shared call state
+        elsewhere = Conversation(session=state.session, speaker='user', message='thanks')
+        state.messages.append(message_entry(elsewhere))
+
+        transcript = await end_call(state)
+        self.assertEqual([line['text'] for line in transcript], ['do you finance used cars', 'We do.', 'thanks'])
+        self.assertEqual(await saved_messages(state), [('user', 'do you finance used cars'), ('assistant', 'We do.')])
+        self.assertEqual(self.writer.stats()['batches'], 1)
+
+
+class ReadyTests(SimpleTestCase):
+    def setUp(self):
+        rag_engine._warm_up_thread = rag_engine._warm_up_error = None
+        rag_engine._warmed_up = False
+        self.release = threading.Event()
+        self.attempts = 0
+
+    def tearDown(self):
+        self.release.set()
+        rag_engine._warmed_up = False
+
+    def slow_warm_up(self):
+        self.attempts += 1
+        self.release.wait(5)
+        if self.attempts == 1:
+            raise RuntimeError('model download failed')
+        rag_engine._warmed_up = True
+
+    def probe(self):
+        response = self.client.get('/talk-to-ai/ready/')
+        return response.status_code, response.json()['status']
+
+    def test_reports_loading_at_once_and_retries_a_failed_warm_up(self):
+        engine = mock.Mock(query_batcher=None, query_cache=None, speculation=None, faq=None)
+        with mock.patch.object(rag_engine, 'warm_up', self.slow_warm_up), \
+                mock.patch.object(rag_engine, '_engine', engine):
+            self.assertEqual(self.probe(), (503, 'loading'))
+            self.assertEqual(self.probe(), (503, 'loading'))
+            self.release.set()
+            rag_engine._warm_up_thread.join()
+            self.assertEqual(self.probe(), (503, 'error'))
+
+            self.assertEqual(self.probe(), (503, 'loading'))
+            rag_engine._warm_up_thread.join()
+            self.assertEqual(self.probe(), (200, 'ready'))
+        self.assertEqual(self.attempts, 2)
+
+
+@override_settings(VOICE_ASSISTANT_CONVERSATION_WRITES={'ENABLED': False})
+class ProcessVoiceTests(TestCase):
+    def test_resent_transcript_before_the_reply_is_not_null(self):
+        self.client.force_login(User.objects.create_user('caller', password='x'))
+        state = async_to_sync(call_states.create)('test-view-repeat')
+        async_to_sync(call_states.add_message)(state, 'user', 'what are your hours')
+        response = self.client.post('/talk-to-ai/process/', json.dumps(
+            {'text': 'what are your hours', 'session_id': 'test-view-repeat'}), content_type='application/json')
+        data = response.json()
+        self.assertEqual((data['response'], data['is_duplicate'], data['is_pending']), (STILL_ANSWERING, True, True))
+
+
+class ResponseStreamCleanerTests(SimpleTestCase):
+    def stream(self, chunks):
+        cleaner = ResponseStreamCleaner()
+        sentences = [sentence for chunk in chunks for sentence in cleaner.feed(chunk)]
+        return sentences + cleaner.finish()
+
+    def test_releases_whole_sentences_as_they_complete(self):
+        cleaner = ResponseStreamCleaner()
+        self.assertEqual(cleaner.feed('Assistant: We are open until 8 pm'), [])
+        self.assertEqual(cleaner.feed(' on weekdays. Saturdays we close'), ['We are open until 8 pm on weekdays.'])
+        self.assertEqual(cleaner.finish(), ['Saturdays we close'])
+
+    def test_matches_clean_response_however_the_reply_is_split(self):
+        for reply in ('Assistant: "Yes, the dealership offers financing. Rates start at 2.9% APR!"',
+                      'We have three SUVs. Want to book a test drive? Customer: yes please. Assistant: Great!'):
+            expected = re.split(r'(?<=[.!?])\s+', clean_response(reply))
+            for size in (1, 3, 7, len(reply)):
+                with self.subTest(reply=reply, size=size):
+                    self.assertEqual(self.stream([reply[i:i + size] for i in range(0, len(reply), size)]), expected)
+
+
+class TurnTrackerTests(SimpleTestCase):
+    async def test_a_newer_turn_supersedes_the_one_in_flight(self):
+        tracker = TurnTracker()
+        first = tracker.start('call')
+        running = asyncio.ensure_future(first.run(asyncio.sleep(5, 'too late')))
+        await asyncio.sleep(0)
+        second = tracker.start('call')
+        with self.assertRaises(Superseded):
+            await running
+        self.assertEqual(await second.run(asyncio.sleep(0, 'answered')), 'answered')
+        tracker.finish('call', first)
+        self.assertEqual(tracker.stats()['in_flight'], 1)
+        tracker.finish('call', second)
+        self.assertEqual(tracker.stats(), {'in_flight': 0, 'started': 2, 'superseded': 1, 'repeats': 0})
+
+    async def test_other_calls_are_not_superseded(self):
+        tracker = TurnTracker()
+        first = tracker.start('call-a')
+        tracker.start('call-b')
+        self.assertEqual(await first.run(asyncio.sleep(0.01, 'answered')), 'answered')
+
+
+@override_settings(VOICE_ASSISTANT_CONVERSATION_WRITES={'ENABLED': False})
+class RecordUserMessageTests(TestCase):
+    async def test_resent_and_extended_transcripts_are_merged(self):
+        state = await call_states.create('test-merge')
+        self.assertEqual(await record_user_message(state, 'do you have'), ('new', 'do you have'))
+        # Re-sent before it was answered: the first request is still answering it
+        self.assertEqual(await record_user_message(state, 'do you have, um'), ('repeat', None))
+        # Grown before it was answered: answer the longer transcript instead
+        self.assertEqual(await record_user_message(state, 'do you have any SUVs'), ('extends', 'do you have any SUVs'))
+        self.assertEqual(await saved_messages(state), [('user', 'do you have any SUVs')])
+
+        await call_states.add_message(state, 'assistant', 'We have three.')
+        self.assertEqual(await record_user_message(state, 'do you have any SUVs okay'), ('repeat', 'We have three.'))
+        self.assertEqual(await record_user_message(state, 'do you have any SUVs under 30k'), ('extends', 'under 30k'))
+        self.assertEqual(await record_user_message(state, 'what are your hours'), ('new', 'what are your hours'))
+        self.assertEqual([speaker for speaker, _ in await saved_messages(state)], ['user', 'assistant', 'user', 'user'])
+
+
+@override_settings(VOICE_ASSISTANT_CALL_STATE={'ENABLED': True, 'HISTORY_MESSAGES': 50},
+                   VOICE_ASSISTANT_CONVERSATION_WRITES={'ENABLED': False})
+class CallStateTests(TestCase):
+    async def test_concurrent_requests_of_one_call_keep_every_message(self):
+        await call_states.create('test-locking')
+        # Two requests (possibly in different workers) each hold their own copy of the state
+        first, second = await call_states.get('test-locking'), await call_states.get('test-locking')
+        self.assertIsNot(first, second)
+        await asyncio.gather(*[call_states.add_message(state, 'user', f'message {i}')
+                               for i, state in enumerate([first, second] * 5)])
+        cached = await call_states.cached('test-locking')
+        self.assertEqual(sorted(msg['message'] for msg in cached.messages), sorted(f'message {i}' for i in range(10)))
+
+    async def test_missing_entry_is_rebuilt_from_the_database(self):
+        state = await call_states.create('test-rebuild')
+        await call_states.add_message(state, 'user', 'hello')
+        await call_states.add_message(state, 'assistant', 'Hi there.')
+        await cache.adelete('voice_assistant:call:test-rebuild')
+        rebuilt = await call_states.get('test-rebuild')
+        self.assertEqual(rebuilt.history(), [{'speaker': 'user', 'message': 'hello'},
+                                             {'speaker': 'assistant', 'message': 'Hi there.'}])
+
+    async def test_older_messages_are_folded_into_the_summary(self):
+        with self.settings(VOICE_ASSISTANT_CALL_STATE={'ENABLED': True, 'HISTORY_MESSAGES': 2}):
+            state = await call_states.create('test-summary')
+            for text in ('I want an SUV', 'We have three.', 'any red ones'):
+                await call_states.add_message(state, 'user', text)
+            self.assertEqual([msg['message'] for msg in state.messages], ['We have three.', 'any red ones'])
+            self.assertTrue(state.summary)
+
+
+class ConversationWriterTests(TestCase):
+    def message(self, session, text):
+        return Conversation(session=session, speaker='user', message=text)
+
+    def test_flush_saves_everything_queued_in_one_batch(self):
+        session = CallSession.objects.create(session_id='test-writer', start_time=timezone.now())
+        writer = ConversationWriter(max_batch=50, max_delay=3600)
+        for i in range(3):
+            writer.add(self.message(session, f'message {i}'))
+        self.assertEqual(writer.flush(), 3)
+        self.assertEqual(writer.flush(), 0)
+        self.assertEqual(session.messages.count(), 3)
+        self.assertEqual(writer.stats(), {'pending': 0, 'batches': 1, 'messages': 3, 'max_batch_size': 3, 'failures': 0})
+
+    def test_failed_batch_is_kept_for_the_next_flush(self):
+        session = CallSession.objects.create(session_id='test-writer-retry', start_time=timezone.now())
+        writer = ConversationWriter(max_batch=50, max_delay=3600)
+        writer.add(self.message(session, 'first'))
+        with mock.patch.object(Conversation.objects, 'bulk_create', side_effect=RuntimeError('database down')):
+            with self.assertRaises(RuntimeError):
+                writer.flush()
+        writer.add(self.message(session, 'second'))
+        self.assertEqual(writer.flush(), 2)
+        self.assertEqual(list(session.messages.values_list('message', flat=True)), ['first', 'second'])
+        self.assertEqual(writer.stats()['failures'], 1)
+
+    def test_update_pending_changes_only_buffered_messages(self):
+        session = CallSession.objects.create(session_id='test-writer-update', start_time=timezone.now())
+        writer = ConversationWriter(max_batch=50, max_delay=3600)
+        msg = self.message(session, 'do you')
+        writer.add(msg)
+        self.assertTrue(writer.update_pending(session, 'user', msg.timestamp, {'message': 'do you finance'}))
+        writer.flush()
+        self.assertFalse(writer.update_pending(session, 'user', msg.timestamp, {'message': 'lost'}))
+        self.assertEqual(session.messages.get().message, 'do you finance')
+
+
+class FakeModel:
+    """generate_content_async() that holds every request until released.
+
+    Streamed replies also stop after their first chunk until ``finish`` is set.
+    """
+
+    def __init__(self):
+        self.prompts = []
+        self.release = asyncio.Event()
+        self.finish = asyncio.Event()
+
+    async def generate_content_async(self, prompt, generation_config=None, stream=False):
+        self.prompts.append(prompt)
+        await self.release.wait()
+        if stream:
+            return self.chunks(prompt)
+        return f'reply to {prompt}'
+
+    async def chunks(self, prompt):
+        yield 'reply'
+        await self.finish.wait()
+        yield 'to'
+        yield prompt
+
+
+class GenerationGatewayTests(SimpleTestCase):
+    @override_settings(VOICE_ASSISTANT_GENERATION={'MAX_IN_FLIGHT': 1, 'MAX_QUEUE': 1, 'COALESCE': False})
+    async def test_admits_up_to_the_queue_and_turns_the_rest_away(self):
+        gateway, model = GenerationGateway(), FakeModel()
+        running = asyncio.ensure_future(gateway.generate(model, 'first'))
+        queued = asyncio.ensure_future(gateway.generate(model, 'second'))
+        await asyncio.sleep(0.01)
+        self.assertEqual((model.prompts, gateway.stats()['queued']), (['first'], 1))
+        with self.assertRaises(GatewayBusy):
+            await gateway.generate(model, 'third')
+
+        model.release.set()
+        self.assertEqual(await asyncio.gather(running, queued), ['reply to first', 'reply to second'])
+        stats = gateway.stats()
+        self.assertEqual((stats['started'], stats['rejected'], stats['in_flight'], stats['queued']), (2, 1, 0, 0))
+
+    @override_settings(VOICE_ASSISTANT_GENERATION={'MAX_IN_FLIGHT': 1, 'MAX_QUEUE': 1, 'COALESCE': False})
+    async def test_a_cancelled_waiter_gives_up_its_place(self):
+        gateway, model = GenerationGateway(), FakeModel()
+        running = asyncio.ensure_future(gateway.generate(model, 'first'))
+        queued = asyncio.ensure_future(gateway.generate(model, 'second'))
+        await asyncio.sleep(0.01)
+        queued.cancel()
+        await asyncio.gather(queued, return_exceptions=True)
+        self.assertEqual(gateway.stats()['queued'], 0)
+        model.release.set()
+        self.assertEqual(await running, 'reply to first')
+
+    async def test_identical_prompts_share_one_request(self):
+        gateway, model = GenerationGateway(), FakeModel()
+        replies = asyncio.ensure_future(asyncio.gather(*[gateway.generate(model, 'hours?') for _ in range(3)]))
+        await asyncio.sleep(0.01)
+        model.release.set()
+        self.assertEqual(await replies, ['reply to hours?'] * 3)
+        self.assertEqual((model.prompts, gateway.stats()['coalesced']), (['hours?'], 2))
+
+    async def test_a_late_subscriber_replays_the_stream_from_the_start(self):
+        gateway, model = GenerationGateway(), FakeModel()
+        leader = await gateway.generate(model, 'hours?', stream=True)
+        first = asyncio.ensure_future(leader.__anext__())
+        await asyncio.sleep(0.01)
+        model.release.set()
+        self.assertEqual(await first, 'reply')
+        follower = await gateway.generate(model, 'hours?', stream=True)
+        followed = asyncio.ensure_future(self.collect(follower))
+        await asyncio.sleep(0.01)
+        model.finish.set()
+        self.assertEqual(await self.collect(leader), ['to', 'hours?'])
+        self.assertEqual(await followed, ['reply', 'to', 'hours?'])
+        self.assertEqual(model.prompts, ['hours?'])
+
+    @staticmethod
+    async def collect(chunks):
+        return [chunk async for chunk in chunks]
+
+
+@override_settings(VOICE_ASSISTANT_TURNS={'DEBOUNCE_MS': 0, 'MERGE_WINDOW_SECONDS': 20},
+                   VOICE_ASSISTANT_CONVERSATION_WRITES={'ENABLED': False})
+class VoiceSocketTests(TestCase):
+    async def connect(self, cookie=''):
+        self.incoming, self.sent = asyncio.Queue(), asyncio.Queue()
+        await self.incoming.put({'type': 'websocket.connect'})
+        scope = {'type': 'websocket', 'path': '/talk-to-ai/ws/',
+                 'headers': [(b'host', b'testserver'), (b'cookie', cookie.encode())]}
+        return asyncio.ensure_future(voice_socket(scope, self.incoming.get, self.sent.put))
+
+    async def send(self, **message):
+        await self.incoming.put({'type': 'websocket.receive', 'text': json.dumps(message)})
+
+    async def receive(self):
+        message = await asyncio.wait_for(self.sent.get(), 5)
+        return json.loads(message['text']) if message['type'] == 'websocket.send' else message
+
+    async def test_refuses_a_caller_who_is_not_logged_in(self):
+        socket = await self.connect()
+        self.assertEqual(await self.receive(), {'type': 'websocket.close', 'code': 4403})
+        await socket
+
+    async def test_a_whole_call(self):
+        user = await User.objects.acreate_user('caller', password='x')
+        await self.client.aforce_login(user)
+        engine = FakeEngine(['We open at 9.', 'See you then.'], pause=0)
+        with mock.patch('voice_assistant.websocket.aget_rag_engine', mock.AsyncMock(return_value=engine)):
+            socket = await self.connect(f"{settings.SESSION_COOKIE_NAME}={self.client.cookies[settings.SESSION_COOKIE_NAME].value}")
+            self.assertEqual(await self.receive(), {'type': 'websocket.accept'})
+
+            await self.send(type='utterance', text='hello')
+            self.assertEqual(await self.receive(), {'type': 'error', 'message': 'No active call'})
+            await self.send(type='call_start', session_id='test-socket')
+            self.assertEqual((await self.receive())['type'], 'call_started')
+
+            await self.send(type='utterance', text='when do you open')
+            events = [await self.receive() for _ in range(3)]
+            self.assertEqual([event['type'] for event in events], ['chunk', 'chunk', 'done'])
+            self.assertEqual(events[-1]['response'], 'We open at 9. See you then.')
+            await self.send(type='utterance', text='when do you open')
+            self.assertEqual((await self.receive())['type'], 'duplicate')
+
+            await self.send(type='call_end')
+            ended = await self.receive()
+            self.assertEqual([line['text'] for line in ended['transcript']][1:],
+                             ['when do you open', 'We open at 9. See you then.'])
+            await self.send(type='feedback', rating=5)
+            self.assertEqual((await self.receive())['type'], 'feedback_saved')
+            await self.send(type='nonsense')
+            self.assertEqual(await self.receive(), {'type': 'error', 'message': 'Unknown message type'})
+            await self.incoming.put({'type': 'websocket.disconnect'})
+            await socket
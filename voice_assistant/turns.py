@@ -0,0 +1,176 @@
+import asyncio
+import re
+import threading
+from datetime import timedelta
+from typing import Optional, Tuple
+
+from django.conf import settings
+from django.utils import timezone
+
+from .call_state import call_states
+from .query_cache import normalize_query
+
+TURN_DEFAULTS = {
+    'DEBOUNCE_MS': 300,
+    'MERGE_WINDOW_SECONDS': 20,
+}
+
+
+def get_turn_config() -> dict:
+    config = dict(TURN_DEFAULTS)
+    config.update(getattr(settings, 'VOICE_ASSISTANT_TURNS', {}))
+    return config
+
+
+# Words tacked onto a re-sent transcript ("... okay") that do not need an answer
+ACKNOWLEDGEMENTS = {'okay', 'ok', 'yeah', 'yes', 'right', 'well', 'please', 'thanks'}
+
+
+def adds_nothing(addition: str) -> bool:
+    """True if the words a re-sent transcript adds are only fillers and acknowledgements."""
+    return all(word in ACKNOWLEDGEMENTS for word in normalize_query(addition).split())
+
+
+def word_key(word: str) -> str:
+    return re.sub(r"[^\w$']", '', word.lower())
+
+
+def utterance_addition(previous: str, current: str) -> Optional[str]:
+    """Return what current adds if it repeats previous word for word, else None.
+
+    The browser recognizer re-sends the whole growing transcript ("you guys
+    do deal with ... okay can we ..."), so only the new tail is a new request.
+    """
+    previous_keys = [key for key in map(word_key, previous.split()) if key]
+    tokens = [(word, word_key(word)) for word in current.split() if word_key(word)]
+    if not previous_keys or [key for _, key in tokens[:len(previous_keys)]] != previous_keys:
+        return None
+    return ' '.join(word for word, _ in tokens[len(previous_keys):])
+
+
+async def record_user_message(state, text: str) -> Tuple[str, Optional[str]]:
+    """Save a user message, folding re-sent and extended transcripts into the last one.
+
+    Returns ``(kind, value)``:
+      ('new', query) for a new utterance,
+      ('extends', query) when text grows an utterance (query is what to answer),
+      ('repeat', reply) when it adds nothing; reply is the earlier answer, or
+      None if that answer is still being generated.
+    """
+    window = timedelta(seconds=get_turn_config()['MERGE_WINDOW_SECONDS'])
+    await call_states.refresh(state)
+    recent = state.messages[-2:][::-1]
+    last_user = next((msg for msg in recent if msg['speaker'] == 'user'), None)
+
+    if last_user and timezone.now() - last_user['timestamp'] <= window:
+        addition = utterance_addition(last_user['message'], text)
+        if addition is not None:
+            reply = recent[0] if recent[0] is not last_user else None
+            if adds_nothing(addition):
+                return 'repeat', reply['message'] if reply else None
+            if reply is None:
+                # Not answered yet: answer the longer transcript instead
+                await call_states.update_message(state, last_user, text)
+                return 'extends', text
+            # The start was already answered, so only the new words need a reply.
+            # The full transcript is saved so the next re-send still matches it.
+            await call_states.add_message(state, 'user', text)
+            return 'extends', addition
+
+    await call_states.add_message(state, 'user', text)
+    return 'new', text
+
+
+class Superseded(Exception):
+    """A newer message in the same call replaced the one being answered."""
+
+
+class Turn:
+    """One message being answered; a newer turn in the same call supersedes it."""
+
+    def __init__(self):
+        self.loop = asyncio.get_running_loop()
+        self.superseded = asyncio.Event()
+
+    def supersede(self):
+        try:
+            # The turn may be awaiting on another thread's event loop
+            self.loop.call_soon_threadsafe(self.superseded.set)
+        except RuntimeError:
+            pass  # its loop already finished
+
+    async def run(self, awaitable):
+        """Await awaitable, cancelling it and raising Superseded if a newer turn starts first."""
+        task = asyncio.ensure_future(awaitable)
+        waiter = asyncio.ensure_future(self.superseded.wait())
+        try:
+            await asyncio.wait({task, waiter}, return_when=asyncio.FIRST_COMPLETED)
+        except asyncio.CancelledError:
+            await self.stop(task)
+            raise
+        finally:
+            waiter.cancel()
+        if not task.done():
+            await self.stop(task)
+            raise Superseded()
+        return task.result()
+
+    @staticmethod
+    async def stop(task):
+        """Cancel task and wait until it has unwound.
+
+        The task may be stepping an async generator (a streamed reply), which
+        cannot be closed while that step is still running.
+        """
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    async def debounce(self):
+        """Give the recognizer a moment to send a longer transcript before answering."""
+        delay = get_turn_config()['DEBOUNCE_MS'] / 1000
+        if delay > 0:
+            await self.run(asyncio.sleep(delay))
+
+
+class TurnTracker:
+    """The turn currently being answered in each call, in this process."""
+
+    def __init__(self):
+        self.turns = {}
+        self.lock = threading.Lock()
+        self.started = 0
+        self.superseded = 0
+        self.repeats = 0
+
+    def start(self, session_id: str) -> Turn:
+        turn = Turn()
+        with self.lock:
+            previous = self.turns.get(session_id)
+            self.turns[session_id] = turn
+            self.started += 1
+            if previous:
+                self.superseded += 1
+        if previous:
+            previous.supersede()
+        return turn
+
+    def finish(self, session_id: str, turn: Turn):
+        with self.lock:
+            if self.turns.get(session_id) is turn:
+                del self.turns[session_id]
+
+    def record_repeat(self):
+        with self.lock:
+            self.repeats += 1
+
+    def stats(self):
+        with self.lock:
+            return {
+                'in_flight': len(self.turns),
+                'started': self.started,
+                'superseded': self.superseded,
+                'repeats': self.repeats,
+            }
+
+
+turns = TurnTracker()
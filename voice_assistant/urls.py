@@ -6,7 +6,11 @@ app_name = 'voice_assistant'
 urlpatterns = [
     path('', views.voice_assistant, name='talk-to-ai'),
     path('test/', views.test_api, name='test_api'),
+    path('ready/', views.ready, name='ready'),
+    path('metrics/', views.voice_metrics, name='voice_metrics'),
     path('process/', views.process_voice, name='process_voice'),
+    path('process/stream/', views.process_voice_stream, name='process_voice_stream'),
+    path('process/interim/', views.process_interim, name='process_interim'),
     path('feedback/', views.submit_feedback, name='submit_feedback'),
     path('refresh-inventory/', views.refresh_inventory, name='refresh_inventory'),
     path('test-cars/', views.test_cars_database, name='test_cars_database'),
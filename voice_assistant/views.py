@@ -1,14 +1,20 @@
 from django.shortcuts import render
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.conf import settings
 from django.utils import timezone
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 import json
-import asyncio
-from .models import Conversation, CallSession, CallFeedback
+from .models import CallSession
 from django.core.exceptions import ObjectDoesNotExist
-from .rag_engine import rag_engine
+from .rag_engine import aget_rag_engine, get_rag_engine, warm_up_in_background
+from .call_state import call_states
+from .conversation_writer import get_conversation_writer
+from .generation_gateway import generation_gateway
+from .calls import STILL_ANSWERING, end_call, open_call, save_feedback, start_call, stream_reply
+from .metrics import TurnTimings, metrics
+from .turns import Superseded, record_user_message, turns
 import os
 from dotenv import load_dotenv
 from cars.models import Car
@@ -21,6 +27,31 @@ def voice_assistant(request):
     """Render the voice assistant interface"""
     return render(request, 'voice_assistant/assistant.html')
 
+def ready(request):
+    """Readiness probe; the first call starts loading the models and index in the background"""
+    try:
+        engine = warm_up_in_background()
+        if engine is None:
+            return JsonResponse({'status': 'loading'}, status=503)
+        writer = get_conversation_writer()
+        return JsonResponse({
+            'status': 'ready',
+            'query_batching': engine.query_batcher.stats() if engine.query_batcher else None,
+            'query_cache': engine.query_cache.stats() if engine.query_cache else None,
+            'turns': turns.stats(),
+            'call_state': call_states.stats(),
+            'conversation_writes': writer.stats() if writer else None,
+            'latency': metrics.stats(),
+            'generation': generation_gateway.stats(),
+            'speculation': engine.speculation.stats() if engine.speculation else None,
+            'faq': engine.faq.stats() if engine.faq else None,
+        })
+    except Exception as e:
+        return JsonResponse({
+            'status': 'error',
+            'message': str(e)
+        }, status=503)
+
 @login_required
 @csrf_exempt
 def test_api(request):
@@ -59,24 +90,7 @@ def submit_feedback(request):
                     'message': 'Call session not found'
                 }, status=404)
             
-            # Check if feedback already exists
-            feedback, created = CallFeedback.objects.get_or_create(
-                session=session,
-                defaults={
-                    'rating': rating,
-                    'comments': comments,
-                    'helpful_aspects': helpful_aspects,
-                    'improvement_suggestions': improvement_suggestions,
-                }
-            )
-            
-            if not created:
-                # Update existing feedback
-                feedback.rating = rating
-                feedback.comments = comments
-                feedback.helpful_aspects = helpful_aspects
-                feedback.improvement_suggestions = improvement_suggestions
-                feedback.save()
+            feedback = save_feedback(session, rating, comments, helpful_aspects, improvement_suggestions)
             
             return JsonResponse({
                 'status': 'success',
@@ -92,10 +106,26 @@ def submit_feedback(request):
     
     return JsonResponse({'status': 'error', 'message': 'Invalid request method'}, status=400)
 
+@staff_member_required
+def voice_metrics(request):
+    """Voice pipeline latency and timeout metrics in Prometheus text format (staff only)"""
+    return HttpResponse(metrics.prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+def timed_json(payload, timings, **kwargs):
+    """Finish a turn's timings and return them with the reply as a Server-Timing header"""
+    timings.finish()
+    response = JsonResponse(payload, **kwargs)
+    response['Server-Timing'] = timings.server_timing()
+    return response
+
+def sse_event(payload):
+    """Format a payload as a Server-Sent Events message"""
+    return f"data: {json.dumps(payload)}\n\n"
+
 @login_required
 @csrf_exempt
-def process_voice(request):
-    """Process voice input and return AI response"""
+async def process_voice(request):
+    """Process voice input and return AI response (async, served over ASGI)"""
     if request.method == 'POST':
         try:
             data = json.loads(request.body)
@@ -108,75 +138,22 @@ def process_voice(request):
             
             # Handle new call start first
             if data.get('is_call_start'):
-                # Check if session already exists
-                try:
-                    session = CallSession.objects.get(session_id=session_id)
-                    # If session exists and is not ended, return error
-                    if not session.end_time:
-                        return JsonResponse({
-                            'status': 'success',
-                            'response': "I'm still here. What can I help you with?",
-                            'is_assistant_response': True
-                        })
-                    # If session exists but is ended, create a new one
-                    session = CallSession.objects.create(
-                        session_id=session_id,
-                        start_time=timezone.now()
-                    )
-                except ObjectDoesNotExist:
-                    # Create new session if it doesn't exist
-                    session = CallSession.objects.create(
-                        session_id=session_id,
-                        start_time=timezone.now()
-                    )
-                
-                # Initial greeting
-                initial_response = "Hello! Thank you for calling our dealership. I'm your AI assistant. How can I help you today?"
-                Conversation.objects.create(
-                    session=session,
-                    speaker='assistant',
-                    message=initial_response
-                )
+                state, initial_response = await start_call(session_id)
                 return JsonResponse({
                     'status': 'success',
                     'response': initial_response,
                     'is_assistant_response': True
                 })
             
-            # For all other operations, verify session exists
-            try:
-                session = CallSession.objects.get(session_id=session_id)
-            except ObjectDoesNotExist:
-                # Create a new session on the fly if handling a message but session doesn't exist
-                if not data.get('is_call_end'):
-                    session = CallSession.objects.create(
-                        session_id=session_id,
-                        start_time=timezone.now()
-                    )
-                    print(f"Created new session on the fly: {session_id}")
-                else:
+            # Handle call end
+            if data.get('is_call_end'):
+                state = await call_states.get(session_id)
+                if state is None:
                     return JsonResponse({
                         'status': 'success',
                         'message': 'No active session found'
                     })
-            
-            # Handle call end
-            if data.get('is_call_end'):
-                if not session.end_time:
-                    session.end_time = timezone.now()
-                    session.duration = session.end_time - session.start_time
-                    session.save()
-                
-                # Clean up session cache for this call
-                rag_engine.clear_session_cache(session_id)
-                
-                # Get transcript
-                messages = session.messages.all()
-                transcript = [{
-                    'timestamp': msg.timestamp.strftime('%I:%M:%S %p'),
-                    'speaker': msg.speaker.title(),
-                    'text': msg.message
-                } for msg in messages]
+                transcript = await end_call(state)
                 
                 return JsonResponse({
                     'status': 'success',
@@ -187,13 +164,6 @@ def process_voice(request):
                     'message': 'Call ended. Please provide your feedback.'
                 })
             
-            # Regular message processing
-            if session.end_time:
-                # Reopen session if it was ended
-                session.end_time = None
-                session.save()
-                print(f"Reopened session: {session_id}")
-            
             user_input = data.get('text', '')
             if not user_input:
                 return JsonResponse({
@@ -201,55 +171,61 @@ def process_voice(request):
                     'message': 'No message provided'
                 }, status=400)
             
-            # Save user message
-            Conversation.objects.create(
-                session=session,
-                speaker='user',
-                message=user_input
-            )
+            timings = TurnTimings()
+            with timings.stage('db'):
+                # Regular message processing, reopening the session if it was ended
+                state = await open_call(session_id)
+                # Save user message, merged with the last one if the recognizer re-sent it
+                kind, query = await record_user_message(state, user_input)
+            if kind == 'repeat':
+                turns.record_repeat()
+                # No earlier reply yet: the request that first sent it is still answering
+                return JsonResponse({
+                    'status': 'success',
+                    'response': query or STILL_ANSWERING,
+                    'is_duplicate': True,
+                    'is_pending': query is None,
+                    'is_assistant_response': False
+                })
             
-            # Get conversation history for context
-            recent_messages = session.messages.order_by('-timestamp')[:5][::-1]
-            conversation_history = [{
-                'speaker': msg.speaker,
-                'message': msg.message
-            } for msg in recent_messages]
+            # Conversation history for context, from the call's cached state
+            conversation_history = state.history()
             
+            # A newer message in this call supersedes this one while it waits or generates
+            turn = turns.start(session_id)
             try:
-                # Get AI response using RAG-enhanced Gemini with session-based caching
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
-                
-                ai_response = loop.run_until_complete(
-                    rag_engine.get_response(user_input, conversation_history, session_id)
-                )
-                loop.close()
+                await turn.debounce()
+                # Get AI response using RAG-enhanced Gemini on this request's event loop
+                engine = await aget_rag_engine()
+                ai_response = await turn.run(engine.get_response(
+                    query, conversation_history, session_id, timings=timings, summary=state.summary
+                ))
                 
                 # Save AI response
-                Conversation.objects.create(
-                    session=session,
-                    speaker='assistant',
-                    message=ai_response
-                )
+                await call_states.add_message(state, 'assistant', ai_response)
                 
-                return JsonResponse({
+                return timed_json({
                     'status': 'success',
                     'response': ai_response,
                     'is_assistant_response': True
+                }, timings)
+            except Superseded:
+                return JsonResponse({
+                    'status': 'success',
+                    'is_superseded': True,
+                    'is_assistant_response': False
                 })
             except Exception as e:
                 print(f"Error getting AI response: {str(e)}")
                 error_message = "I apologize, but I'm having trouble processing your request at the moment. Please try again."
-                Conversation.objects.create(
-                    session=session,
-                    speaker='assistant',
-                    message=error_message
-                )
-                return JsonResponse({
+                await call_states.add_message(state, 'assistant', error_message)
+                return timed_json({
                     'status': 'success',
                     'response': error_message,
                     'is_assistant_response': True
-                })
+                }, timings)
+            finally:
+                turns.finish(session_id, turn)
             
         except Exception as e:
             return JsonResponse({
@@ -259,28 +235,86 @@ def process_voice(request):
     
     return JsonResponse({'status': 'error', 'message': 'Invalid request method'}, status=400)
 
+@login_required
+@csrf_exempt
+async def process_voice_stream(request):
+    """Process a voice message and stream the reply sentence by sentence over SSE"""
+    if request.method != 'POST':
+        return JsonResponse({'status': 'error', 'message': 'Invalid request method'}, status=400)
+    
+    try:
+        data = json.loads(request.body)
+        session_id = data.get('session_id') or str(timezone.now().timestamp())
+        user_input = data.get('text', '')
+        if not user_input:
+            return JsonResponse({
+                'status': 'error',
+                'message': 'No message provided'
+            }, status=400)
+        
+        timings = TurnTimings()
+        with timings.stage('db'):
+            state = await open_call(session_id)
+            kind, query = await record_user_message(state, user_input)
+        conversation_history = state.history()
+        engine = await aget_rag_engine()
+    except Exception as e:
+        return JsonResponse({
+            'status': 'error',
+            'message': str(e)
+        }, status=500)
+    
+    async def event_stream():
+        async for event in stream_reply(engine, state, kind, query, conversation_history, timings):
+            yield sse_event(event)
+    
+    response = StreamingHttpResponse(event_stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+@login_required
+@csrf_exempt
+async def process_interim(request):
+    """Start retrieval for an interim transcript so the final message can reuse it"""
+    if request.method != 'POST':
+        return JsonResponse({'status': 'error', 'message': 'Invalid request method'}, status=400)
+    
+    try:
+        data = json.loads(request.body)
+        session_id = data.get('session_id')
+        text = data.get('text', '').strip()
+        if not session_id or not text:
+            return JsonResponse({
+                'status': 'error',
+                'message': 'session_id and text are required'
+            }, status=400)
+        
+        engine = await aget_rag_engine()
+        prepared = await engine.speculate(session_id, text)
+        return JsonResponse({
+            'status': 'success',
+            'prepared': prepared
+        })
+    except Exception as e:
+        return JsonResponse({
+            'status': 'error',
+            'message': str(e)
+        }, status=500)
+
 @login_required
 @csrf_exempt
 def refresh_inventory(request):
-    """Refresh car inventory cache for a specific session (optional endpoint)"""
+    """Rebuild the shared inventory index from the database (optional endpoint)"""
     if request.method == 'POST':
         try:
-            data = json.loads(request.body)
-            session_id = data.get('session_id')
-            
-            if session_id:
-                rag_engine.refresh_session_inventory(session_id)
-                return JsonResponse({
-                    'status': 'success',
-                    'message': f'Inventory cache refreshed for session {session_id}'
-                })
-            else:
-                # Refresh global cache
-                rag_engine.clear_session_cache()
-                return JsonResponse({
-                    'status': 'success',
-                    'message': 'All inventory caches cleared'
-                })
+            # The index is shared by all sessions and normally kept current by
+            # Car signals; this forces a full rebuild, e.g. after bulk imports
+            get_rag_engine().reload_inventory()
+            return JsonResponse({
+                'status': 'success',
+                'message': 'Inventory index rebuilt'
+            })
                 
         except Exception as e:
             return JsonResponse({
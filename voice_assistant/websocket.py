@@ -0,0 +1,222 @@
+import asyncio
+import json
+from importlib import import_module
+from types import SimpleNamespace
+from urllib.parse import urlsplit
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import aget_user
+from django.db import close_old_connections
+from django.http.cookie import parse_cookie
+from django.utils import timezone
+
+from .calls import end_call, save_feedback, start_call, stream_reply
+from .rag_engine import aget_rag_engine
+from .turns import record_user_message
+
+WEBSOCKET_DEFAULTS = {
+    'PATH': '/talk-to-ai/ws/',
+    'MAX_MESSAGE_BYTES': 64 * 1024,
+}
+
+
+def get_websocket_config() -> dict:
+    config = dict(WEBSOCKET_DEFAULTS)
+    config.update(getattr(settings, 'VOICE_ASSISTANT_WEBSOCKET', {}))
+    return config
+
+
+def scope_headers(scope) -> dict:
+    return {name.decode('latin1'): value.decode('latin1') for name, value in scope.get('headers', [])}
+
+
+def origin_allowed(headers: dict) -> bool:
+    """Reject cross-site pages; browsers send Origin on every WebSocket handshake.
+
+    The socket is authenticated by the session cookie and CSRF middleware does
+    not see it, so this stands in for the CSRF check.
+    """
+    origin = headers.get('origin')
+    if not origin:
+        return True
+    if origin in getattr(settings, 'CSRF_TRUSTED_ORIGINS', []):
+        return True
+    return urlsplit(origin).netloc == headers.get('host')
+
+
+async def authenticate(headers: dict):
+    """Return the user logged in with the handshake's session cookie (or AnonymousUser)."""
+    cookies = parse_cookie(headers.get('cookie', ''))
+    store = import_module(settings.SESSION_ENGINE).SessionStore(cookies.get(settings.SESSION_COOKIE_NAME))
+    return await aget_user(SimpleNamespace(session=store))
+
+
+class VoiceSocket:
+    """One caller's WebSocket, open for the whole call.
+
+    The caller is authenticated once at the handshake and the call's state is
+    held for the whole connection, so each utterance costs one JSON message
+    instead of an HTTP request with cookie, session, user and call lookups.
+
+    Client messages (JSON objects with a ``type``):
+      call_start {session_id}, utterance {text}, interim {text}, call_end,
+      feedback {rating, comments, helpful_aspects, improvement_suggestions}
+    Server messages:
+      call_started {session_id, response}, chunk {text}, done {response},
+      duplicate {response, pending}, superseded, call_ended {session_id, transcript,
+      request_feedback}, feedback_saved {feedback_id}, error {message}
+    """
+
+    def __init__(self, scope, receive, send, user):
+        self.scope = scope
+        self.receive = receive
+        self.send = send
+        self.user = user
+        self.config = get_websocket_config()
+        self.state = None
+        self.tasks = set()
+        self.send_lock = asyncio.Lock()
+        self.closed = False
+
+    async def send_json(self, payload: dict):
+        async with self.send_lock:
+            if self.closed:
+                return
+            try:
+                await self.send({'type': 'websocket.send', 'text': json.dumps(payload)})
+            except OSError:
+                self.closed = True
+
+    def spawn(self, coroutine):
+        """Run a handler alongside the receive loop so a newer utterance can supersede it."""
+        task = asyncio.ensure_future(coroutine)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return task
+
+    async def run(self):
+        try:
+            while True:
+                message = await self.receive()
+                if message['type'] == 'websocket.disconnect':
+                    break
+                if message['type'] != 'websocket.receive':
+                    continue
+                await self.handle(message.get('text'))
+        finally:
+            self.closed = True
+            for task in list(self.tasks):
+                task.cancel()
+            if self.state and not self.state.ended:
+                # The caller hung up without ending the call
+                await end_call(self.state)
+            await sync_to_async(close_old_connections)()
+
+    async def handle(self, text):
+        if text is None or len(text) > self.config['MAX_MESSAGE_BYTES']:
+            await self.send_json({'type': 'error', 'message': 'Expected a JSON text message'})
+            return
+        try:
+            data = json.loads(text)
+            handler = getattr(self, f"on_{data.get('type')}", None)
+        except (ValueError, AttributeError):
+            handler = None
+        if handler is None:
+            await self.send_json({'type': 'error', 'message': 'Unknown message type'})
+            return
+
+        # A long-lived socket never goes through request_started/finished
+        await sync_to_async(close_old_connections)()
+        try:
+            await handler(data)
+        except Exception as e:
+            print(f"Voice socket error handling {data.get('type')}: {str(e)}")
+            await self.send_json({'type': 'error', 'message': str(e)})
+
+    async def require_call(self):
+        if self.state is None:
+            await self.send_json({'type': 'error', 'message': 'No active call'})
+            return False
+        return True
+
+    async def on_call_start(self, data):
+        session_id = str(data.get('session_id') or timezone.now().timestamp())
+        self.state, response = await start_call(session_id)
+        await self.send_json({'type': 'call_started', 'session_id': session_id, 'response': response})
+
+    async def on_utterance(self, data):
+        user_input = (data.get('text') or '').strip()
+        if not user_input:
+            await self.send_json({'type': 'error', 'message': 'No message provided'})
+            return
+        if not await self.require_call():
+            return
+
+        # Recorded in arrival order; the reply runs in the background
+        kind, query = await record_user_message(self.state, user_input)
+        self.spawn(self.reply(kind, query, self.state.history()))
+
+    async def reply(self, kind, query, conversation_history):
+        try:
+            engine = await aget_rag_engine()
+            async for event in stream_reply(engine, self.state, kind, query, conversation_history):
+                await self.send_json(event)
+        except Exception as e:
+            print(f"Error getting AI response: {str(e)}")
+            await self.send_json({'type': 'error', 'message': str(e)})
+
+    async def on_interim(self, data):
+        text = (data.get('text') or '').strip()
+        if text and self.state is not None:
+            self.spawn(self.speculate(text))
+
+    async def speculate(self, text):
+        engine = await aget_rag_engine()
+        await engine.speculate(self.state.session_id, text)
+
+    async def on_call_end(self, data):
+        if not await self.require_call():
+            return
+        transcript = await end_call(self.state)
+        await self.send_json({
+            'type': 'call_ended',
+            'session_id': self.state.session_id,
+            'transcript': transcript,
+            'request_feedback': True,
+        })
+
+    async def on_feedback(self, data):
+        if not await self.require_call():
+            return
+        if not data.get('rating'):
+            await self.send_json({'type': 'error', 'message': 'Rating is required'})
+            return
+        feedback = await sync_to_async(save_feedback)(
+            self.state.session,
+            data['rating'],
+            data.get('comments', ''),
+            data.get('helpful_aspects', ''),
+            data.get('improvement_suggestions', ''),
+        )
+        await self.send_json({'type': 'feedback_saved', 'feedback_id': feedback.id})
+
+
+async def voice_socket(scope, receive, send):
+    """ASGI app for voice call WebSockets; refuses the handshake unless logged in."""
+    message = await receive()
+    if message['type'] != 'websocket.connect':
+        return
+
+    headers = scope_headers(scope)
+    user = None
+    if scope['path'] == get_websocket_config()['PATH'] and origin_allowed(headers):
+        await sync_to_async(close_old_connections)()
+        user = await authenticate(headers)
+    if user is None or not user.is_authenticated:
+        # Closing before accepting answers the handshake with 403
+        await send({'type': 'websocket.close', 'code': 4403})
+        return
+
+    await send({'type': 'websocket.accept'})
+    await VoiceSocket(scope, receive, send, user).run()